@@ -0,0 +1,54 @@
+"""Compare two benchmark results files written by run.py.
+
+    python benchmarks/compare.py base.json head.json --threshold 1.1
+
+Exits with status 1 if a benchmark median got slower than 'threshold' times."""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+
+def load(path: str) -> dict:
+    report = json.loads(Path(path).read_text())
+    return report["meta"], {
+        (result["name"], json.dumps(result["params"], sort_keys=True)): result
+        for result in report["results"]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=1.1)
+    args = parser.parse_args()
+
+    base_meta, base = load(args.base)
+    head_meta, head = load(args.head)
+    print(f"base: {base_meta['commit']} ({base_meta['backend']})")
+    print(f"head: {head_meta['commit']} ({head_meta['backend']})")
+    if base_meta["backend"] != head_meta["backend"]:
+        print("warning: the results come from different backends")
+
+    regressions = 0
+    print(f"\n{'benchmark':<20} {'params':<40} {'base':>10} {'head':>10} {'ratio':>7}")
+    for key in sorted(base.keys() & head.keys()):
+        before, after = base[key]["median_s"], head[key]["median_s"]
+        ratio = after / before if before else float("inf")
+        flag = ""
+        if ratio > args.threshold:
+            flag, regressions = " slower", regressions + 1
+        elif ratio < 1 / args.threshold:
+            flag = " faster"
+        print(
+            f"{key[0]:<20} {key[1]:<40} {before:>10.6f} {after:>10.6f} {ratio:>7.2f}{flag}"
+        )
+    for key in sorted(base.keys() ^ head.keys()):
+        print(f"{key[0]:<20} {key[1]:<40} only in {'base' if key in base else 'head'}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""Benchmark the MongoDB connection and write the results to a JSON file.
+
+    python benchmarks/run.py --url mongodb://localhost:27017 --output base.json
+    python benchmarks/run.py --mock --sizes 10,1000,100000 --output head.json
+    python benchmarks/compare.py base.json head.json
+
+With '--mock' the connection runs against mongomock, an in-process stand-in
+(pip install mongomock): useful to measure the overhead of the connector itself.
+The working tree is benchmarked, not the installed package."""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from statistics import median
+from time import perf_counter
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+import pymongo  # noqa: E402
+import streamlit  # noqa: E402
+from connection import MongoDBConnection, clients  # noqa: E402
+from connection.keys import cache_key  # noqa: E402
+
+DATABASE = "st_mongo_benchmarks"
+
+
+# ---- measures
+
+
+def measure(func, repeat: int, setup=None) -> dict:
+    """Time 'repeat' calls of func (after setup, not timed) and summarize them."""
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = perf_counter()
+        func()
+        times.append(perf_counter() - start)
+    times.sort()
+    return {
+        "repeat": repeat,
+        "min_s": times[0],
+        "median_s": median(times),
+        "p95_s": times[min(len(times) - 1, round(0.95 * (len(times) - 1)))],
+    }
+
+
+def document(i: int, payload: int = 100) -> dict:
+    return {"i": i, "group": i % 10, "name": f"user-{i}", "text": "x" * payload}
+
+
+def fill(conn: MongoDBConnection, size: int):
+    conn._instance.drop()
+    for start in range(0, size, 10_000):
+        batch = range(start, min(size, start + 10_000))
+        conn._instance.insert_many([document(i) for i in batch])
+
+
+# ---- benchmarks
+
+
+def bench_find(conn, sizes, repeat):
+    for size in sizes:
+        fill(conn, size)
+        runs = max(1, repeat if size <= 100_000 else repeat // 5)
+        yield "find.uncached", {"size": size}, measure(
+            lambda: conn.find({}, ttl=0), runs
+        )
+        yield "find.cold", {"size": size}, measure(
+            lambda: conn.find({}), runs, setup=conn.clear_cache
+        )
+        conn.find({})
+        yield "find.warm", {"size": size}, measure(lambda: conn.find({}), runs)
+        pipeline = [{"$match": {"group": {"$lt": 5}}}, {"$sort": {"i": -1}}]
+        yield "aggregate.cold", {"size": size}, measure(
+            lambda: conn.aggregate(pipeline), runs, setup=conn.clear_cache
+        )
+        conn.aggregate(pipeline)
+        yield "aggregate.warm", {"size": size}, measure(
+            lambda: conn.aggregate(pipeline), runs
+        )
+
+
+def bench_insert(conn, batch_sizes, total, repeat):
+    for batch_size in batch_sizes:
+        documents = [document(i) for i in range(total)]
+
+        def insert():
+            for start in range(0, total, batch_size):
+                batch = [dict(doc) for doc in documents[start : start + batch_size]]
+                conn.insert(batch[0] if batch_size == 1 else batch)
+
+        result = measure(insert, repeat, setup=conn._instance.drop)
+        result["documents_per_s"] = total / result["median_s"]
+        yield "insert", {"batch_size": batch_size, "total": total}, result
+
+
+def bench_keys(repeat):
+    scope = ("mongodb://localhost", f"{DATABASE}.keys")
+    for values in (10, 1_000, 100_000):
+        filters = {"i": {"$in": list(range(values))}, "group": {"$gte": 1}}
+        yield "cache_key.filters", {"values": values}, measure(
+            lambda: cache_key(scope, "find", filters=filters), repeat
+        )
+    for payload in (1_000, 100_000, 1_000_000):
+        pipeline = [{"$match": {"text": "x" * payload}}]
+        yield "cache_key.payload", {"bytes": payload}, measure(
+            lambda: cache_key(scope, "aggregate", pipeline=pipeline), repeat
+        )
+
+
+def bench_sessions(conn, sessions, size, repeat):
+    fill(conn, size)
+    for workers in sessions:
+        with ThreadPoolExecutor(workers) as pool:
+            for name, setup in (("warm", None), ("cold", conn.clear_cache)):
+                # every session reads a different group, then the same page
+                def run():
+                    reads = [
+                        pool.submit(conn.find, {"group": i % 10})
+                        for i in range(workers)
+                    ]
+                    reads += [pool.submit(conn.find, {}) for _ in range(workers)]
+                    for read in reads:
+                        read.result()
+
+                run()
+                result = measure(run, repeat, setup=setup)
+                result["reads_per_s"] = 2 * workers / result["median_s"]
+                yield f"sessions.{name}", {"sessions": workers, "size": size}, result
+
+
+# ---- main
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def integers(value: str) -> list:
+    return [int(item) for item in value.split(",") if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--url", default="mongodb://localhost:27017")
+    parser.add_argument("--mock", action="store_true", help="use mongomock")
+    parser.add_argument("--sizes", type=integers, default=[10, 1_000, 100_000])
+    parser.add_argument("--batch-sizes", type=integers, default=[1, 100, 1_000])
+    parser.add_argument("--insert-total", type=int, default=10_000)
+    parser.add_argument("--sessions", type=integers, default=[1, 4, 16])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--only", nargs="*", help="benchmark groups to run")
+    parser.add_argument("--output", default="benchmarks.json")
+    args = parser.parse_args()
+
+    if args.mock:
+        import mongomock
+
+        clients.MongoClient = mongomock.MongoClient
+    warnings.filterwarnings("ignore")
+    conn = MongoDBConnection(
+        "benchmarks", url=args.url, database=DATABASE, collection="documents"
+    )
+    groups = {
+        "find": lambda: bench_find(conn, args.sizes, args.repeat),
+        "insert": lambda: bench_insert(
+            conn, args.batch_sizes, args.insert_total, max(1, args.repeat // 5)
+        ),
+        "keys": lambda: bench_keys(args.repeat),
+        "sessions": lambda: bench_sessions(
+            conn, args.sessions, min(args.sizes[-1], 10_000), args.repeat
+        ),
+    }
+    results = []
+    try:
+        for group, run in groups.items():
+            if args.only and group not in args.only:
+                continue
+            for name, params, result in run():
+                print(f"{name:<20} {json.dumps(params):<40} {result['median_s']:.6f}s")
+                results.append({"name": name, "params": params, **result})
+    finally:
+        conn._instance.database.client.drop_database(DATABASE)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "date": datetime.now(timezone.utc).isoformat(),
+            "backend": "mongomock" if args.mock else "mongod",
+            "python": platform.python_version(),
+            "pymongo": pymongo.version,
+            "streamlit": streamlit.__version__,
+            "machine": platform.machine(),
+        },
+        "results": results,
+    }
+    Path(args.output).write_text(json.dumps(report, indent=2))
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
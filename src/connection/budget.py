@@ -0,0 +1,22 @@
+from typing import Callable
+
+import pymongo
+from pymongo.errors import PyMongoError
+
+
+def within(timeout_ms: int, compute: Callable) -> Callable:
+    """Wrap a read to run within a time budget: every command it sends gets the
+    remaining time as its maxTimeMS, and the client gives up waiting (for a server,
+    a pooled connection or a reply) once the budget is spent."""
+
+    def _compute():
+        with pymongo.timeout(timeout_ms / 1000):
+            return compute()
+
+    return _compute
+
+
+def is_timeout(error: BaseException) -> bool:
+    """Whether the error is a read running out of time, on the server (maxTimeMS
+    exceeded) or on the client."""
+    return isinstance(error, PyMongoError) and error.timeout
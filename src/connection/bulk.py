@@ -0,0 +1,68 @@
+from typing import Dict, Iterable, Iterator, List
+
+from bson import encode
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError
+
+COUNTS = {
+    "nInserted": "inserted_count",
+    "nMatched": "matched_count",
+    "nModified": "modified_count",
+    "nRemoved": "deleted_count",
+    "nUpserted": "upserted_count",
+}
+
+
+def request_size(request) -> int:
+    """Return the approximate BSON size of a write request in a write command."""
+    if isinstance(request, InsertOne):
+        return len(encode(request._doc))
+    size = len(encode(getattr(request, "_filter", None) or {}))
+    document = getattr(request, "_doc", None)
+    if isinstance(document, Dict):
+        size += len(encode(document))
+    elif document is not None:
+        size += len(encode({"u": document}))
+    return size
+
+
+def chunks(requests: Iterable, max_count: int, max_bytes: int) -> Iterator[List]:
+    """Split the write requests in chunks of at most 'max_count' requests and (about)
+    'max_bytes' bytes, consuming the requests lazily."""
+    chunk, chunk_bytes = [], 0
+    for request in requests:
+        size = request_size(request)
+        if chunk and (len(chunk) >= max_count or chunk_bytes + size > max_bytes):
+            yield chunk
+            chunk, chunk_bytes = [], 0
+        chunk.append(request)
+        chunk_bytes += size
+    if chunk:
+        yield chunk
+
+
+class BulkResult:
+    """Aggregated result of the bulk writes of several chunks."""
+
+    def __init__(self):
+        self.details = {key: 0 for key in COUNTS}
+        self.details |= {"upserted": [], "writeErrors": [], "writeConcernErrors": []}
+
+    def add(self, details: Dict, offset: int):
+        """Add the raw result (or BulkWriteError details) of the chunk starting at
+        index 'offset' of the whole write."""
+        for key in COUNTS:
+            self.details[key] += details.get(key, 0)
+        for key in ("upserted", "writeErrors"):
+            for item in details.get(key, []):
+                self.details[key].append({**item, "index": item["index"] + offset})
+        self.details["writeConcernErrors"] += details.get("writeConcernErrors", [])
+
+    def raise_errors(self):
+        if self.details["writeErrors"] or self.details["writeConcernErrors"]:
+            raise BulkWriteError(self.details)
+
+    def to_dict(self) -> Dict:
+        response = {name: self.details[key] for key, name in COUNTS.items()}
+        upserted = {item["index"]: item["_id"] for item in self.details["upserted"]}
+        return response | {"upserted_ids": upserted}
@@ -0,0 +1,220 @@
+import pickle
+from collections import defaultdict
+from concurrent.futures import Future
+from contextvars import ContextVar
+from datetime import timedelta
+from threading import RLock
+from typing import Callable, Dict, Hashable, Optional, Tuple, Union
+
+from .concurrency import submit
+from .metrics import metrics
+from .stores import Entry, get_store
+
+STATS = (
+    "hits",
+    "stale",
+    "misses",
+    "coalesced",
+    "fallbacks",
+    "evictions",
+    "entries",
+    "bytes",
+)
+
+Ttl = Union[int, float, timedelta, None]
+
+
+def ttl_seconds(ttl: Ttl) -> Optional[float]:
+    if isinstance(ttl, timedelta):
+        return ttl.total_seconds()
+    return ttl
+
+
+class ResultCache:
+    """Size-aware cache of read results, stored pickled (so every hit returns a
+    fresh copy, as with st.cache_data) and accounted by their pickled size.
+    With the 'memory' backend (default) results are held by the process:
+    'max_entries' and 'max_bytes' bound the whole cache, 'methods' maps a read
+    method to its own limits, e.g. {"find": {"max_bytes": 50_000_000}}. When a limit
+    is exceeded entries are evicted following 'policy': least recently ('lru') or
+    least frequently ('lfu') used first. The 'disk' (a SQLite file at 'path') and
+    'redis' (a server at 'url') backends are shared by several processes.
+    Concurrent misses of the same read are coalesced in a single computation. With a
+    'stale_ttl' an expired result is still served for that long while it is
+    refreshed once in the background. The results of reads with a fallback are kept
+    'fallback_ttl' seconds after they expire, to be served if the read fails."""
+
+    def __init__(
+        self,
+        backend: str = "memory",
+        stale_ttl: Ttl = 0,
+        fallback_ttl: Ttl = 3600,
+        **options,
+    ):
+        self.stale_ttl, self.fallback_ttl = stale_ttl, fallback_ttl
+        self._store = get_store(backend, **options)
+        self._lock = RLock()
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: dict.fromkeys(STATS[:5], 0)
+        )
+        self._flights: Dict[Tuple[str, str], Future] = {}
+        self._stale = ContextVar(f"stale-{id(self)}", default=False)
+
+    @property
+    def shared(self) -> bool:
+        """Whether the results are shared with other processes."""
+        return self._store.shared
+
+    def generation(self, namespace: Hashable) -> int:
+        """Write generation of the namespace, shared with the other processes."""
+        return self._store.generation(namespace)
+
+    @property
+    def stale(self) -> bool:
+        """Whether the last read of the current context (e.g. a session script run)
+        returned a stale result: expired, or served after the read failed."""
+        return self._stale.get()
+
+    # reads
+
+    def get(
+        self,
+        method: str,
+        key: str,
+        ttl: Ttl,
+        compute: Callable,
+        stale_ttl: Ttl = None,
+        fallback: Callable[[BaseException], bool] = None,
+    ):
+        """Return the cached result of the read, or compute and cache it. A ttl of 0
+        (or less) disables caching, a ttl of None never expires. An expired result is
+        returned for up to 'stale_ttl' more seconds (the cache default if None) and
+        refreshed in the background. If the computation fails with an error for
+        which 'fallback' returns True, the last result held for the read (up to
+        'fallback_ttl' seconds after it expired) is returned instead. Whether the
+        result is stale is then available as 'stale'."""
+        self._stale.set(False)
+        ttl = ttl_seconds(ttl)
+        if ttl is not None and ttl <= 0:
+            return compute()
+        stale_ttl = ttl_seconds(self.stale_ttl if stale_ttl is None else stale_ttl)
+        retention = stale_ttl
+        if fallback is not None:
+            retention = max(stale_ttl or 0, ttl_seconds(self.fallback_ttl) or 0)
+        found, value, stale = self._lookup(method, key, stale_ttl or None)
+        if found and not stale:
+            return value
+        with self._lock:
+            flight = self._flights.get((method, key))
+            if leader := flight is None:
+                flight = self._flights[method, key] = Future()
+            elif not found:
+                self._stats[method]["coalesced"] += 1
+                metrics.record("coalesced")
+        args = (method, key, ttl, retention, compute, flight)
+        if found:
+            if leader:
+                submit(self._compute, *args)
+            self._stale.set(True)
+            return value
+        try:
+            if leader:
+                value = self._compute(*args)
+            else:
+                value = pickle.loads(flight.result())
+            # reads made by the computation might have set it
+            self._stale.set(False)
+            return value
+        except Exception as error:
+            if fallback is None or not fallback(error):
+                raise
+            entry = self._store.get(method, key)
+            if entry is None:
+                raise
+        with self._lock:
+            self._stats[method]["fallbacks"] += 1
+        metrics.record("fallback", entry.size)
+        self._stale.set(True)
+        return pickle.loads(entry.value)
+
+    def _compute(
+        self,
+        method: str,
+        key: str,
+        ttl: Optional[float],
+        retention: Optional[float],
+        compute: Callable,
+        flight: Future,
+    ):
+        """Compute and cache a read, sharing the result (or the error) with the
+        callers waiting on the same flight."""
+        try:
+            value = compute()
+            entry = self.put(method, key, value, ttl, retention)
+            flight.set_result(entry.value)
+            metrics.record(size=entry.size)
+            return value
+        except BaseException as error:
+            flight.set_exception(error)
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop((method, key), None)
+
+    def lookup(self, method: str, key: str) -> Tuple[bool, object]:
+        """Return whether a fresh result is cached for the read, and the result."""
+        found, value, _ = self._lookup(method, key, None)
+        return found, value
+
+    def _lookup(
+        self, method: str, key: str, stale_ttl: Optional[float]
+    ) -> Tuple[bool, object, bool]:
+        entry = self._store.get(method, key)
+        with self._lock:
+            if entry is None or not entry.servable(stale_ttl):
+                self._stats[method]["misses"] += 1
+                metrics.record("miss")
+                return False, None, False
+            self._stats[method]["hits"] += 1
+            if stale := entry.expired:
+                self._stats[method]["stale"] += 1
+        metrics.record("stale" if stale else "hit", entry.size)
+        return True, pickle.loads(entry.value), stale
+
+    def put(
+        self, method: str, key: str, value, ttl: Ttl, retention: Ttl = None
+    ) -> Entry:
+        """Cache the result of a read, kept 'retention' seconds more than its 'ttl'
+        to be served stale or as a fallback, and return its entry. Results larger
+        than a limit are not cached."""
+        entry = Entry(pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ttl_seconds(ttl))
+        self._store.put(method, key, entry, ttl_seconds(retention))
+        return entry
+
+    # management
+
+    def clear(self, method: str = None, scope: str = ""):
+        """Drop every cached result, or only those of the provided method, and of
+        the provided scope (see 'scope_name')."""
+        self._store.clear(method, scope)
+
+    def stats(self) -> Dict:
+        """Return hits (of which 'stale'), misses (of which 'coalesced' waited for
+        a running computation, and 'fallbacks' were served an old result after
+        failing), evictions, entries and resident bytes of the cache,
+        in total and for each read method. Entries and bytes of a shared backend are
+        those of every process, and unknown for 'redis'."""
+        usage = self._store.usage()
+        with self._lock:
+            methods = {
+                method: {
+                    **dict.fromkeys(STATS, 0),
+                    **self._stats.get(method, {}),
+                    **usage.get(method, {}),
+                }
+                for method in sorted(set(self._stats) | set(usage))
+            }
+        totals = {
+            stat: sum(method[stat] for method in methods.values()) for stat in STATS
+        }
+        return {**totals, "methods": methods}
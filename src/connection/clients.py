@@ -0,0 +1,49 @@
+from threading import Lock
+from typing import Dict, Hashable, Tuple
+
+from pymongo import MongoClient
+
+from .metrics import command_metrics
+
+MAX_WRITE_BATCH_SIZE = 100_000
+MAX_BSON_OBJECT_SIZE = 16 * 1024 * 1024
+
+_clients: Dict[Hashable, MongoClient] = {}
+_write_limits: Dict[int, Tuple[int, int]] = {}
+_lock = Lock()
+
+
+def _freeze(value) -> Hashable:
+    if isinstance(value, Dict):
+        return tuple(sorted((str(key), _freeze(arg)) for key, arg in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(item) for item in value)
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    return value
+
+
+def get_client(url: str, **options) -> MongoClient:
+    """Return the process-wide MongoClient for the URL and client options, creating
+    it on first use. Connections sharing them share the same connection pool and
+    monitoring threads. Their commands are timed for the connection metrics."""
+    key = (url, _freeze(options))
+    with _lock:
+        if key not in _clients:
+            listeners = [*options.pop("event_listeners", []), command_metrics]
+            _clients[key] = MongoClient(url, event_listeners=listeners, **options)
+        return _clients[key]
+
+
+def get_write_limits(client: MongoClient) -> Tuple[int, int]:
+    """Return the maximum number of requests and bytes of a write batch accepted by
+    the servers of the client, asking them only once."""
+    if id(client) not in _write_limits:
+        hello = client.admin.command("hello")
+        _write_limits[id(client)] = (
+            hello.get("maxWriteBatchSize", MAX_WRITE_BATCH_SIZE),
+            hello.get("maxBsonObjectSize", MAX_BSON_OBJECT_SIZE),
+        )
+    return _write_limits[id(client)]
@@ -0,0 +1,162 @@
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Union
+
+import pyarrow as pa
+from bson import Decimal128, ObjectId
+
+try:
+    from pymongoarrow.api import Schema, aggregate_arrow_all, find_arrow_all
+except ImportError:
+    Schema = aggregate_arrow_all = find_arrow_all = None
+
+OUTPUTS = ("arrow", "pandas", "numpy")
+# types are widened when concatenating tables (or merging schemas) since pyarrow
+# 14, before only null types and missing fields are promoted
+PERMISSIVE = int(pa.__version__.split(".")[0]) >= 14
+PROMOTE = {"promote_options": "permissive"} if PERMISSIVE else {"promote": True}
+UNIFY = {"promote_options": "permissive"} if PERMISSIVE else {}
+
+
+def _plain(value):
+    """Convert the BSON values Arrow can't infer a type for."""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Decimal128):
+        return value.to_decimal()
+    if isinstance(value, Dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_plain(item) for item in value]
+    return value
+
+
+def arrow_schema(schema: Union[Dict, pa.Schema, None]):
+    if schema is None or isinstance(schema, pa.Schema):
+        return schema
+    return pa.schema(list(schema.items()))
+
+
+def record_batches(
+    batches: Iterable[List[Dict]], schema: Union[Dict, pa.Schema] = None
+) -> Iterator[pa.RecordBatch]:
+    """Convert batches of documents to Arrow record batches, one at a time, with
+    the provided schema (the fields missing from it are dropped) or the one inferred
+    from the documents of each batch."""
+    schema = arrow_schema(schema)
+    for batch in batches:
+        rows = [_plain(document) for document in batch]
+        yield pa.RecordBatch.from_pylist(rows, schema=schema)
+
+
+def batches_to_arrow(
+    batches: Iterable[List[Dict]], schema: Union[Dict, pa.Schema] = None
+) -> pa.Table:
+    """Build an Arrow table from batches of documents, one record batch at a time
+    (see 'record_batches'). Without a schema, the fields missing from some batches
+    are null there."""
+    converted = [
+        pa.Table.from_batches([record_batch])
+        for record_batch in record_batches(batches, schema)
+    ]
+    if converted:
+        return concat_tables(converted)
+    return pa.Table.from_batches([], schema=arrow_schema(schema) or pa.schema([]))
+
+
+def find_arrow(
+    collection, filters: Dict, schema=None, batch_size: int = 1000, **kwargs
+) -> pa.Table:
+    """Run a find returning an Arrow table, decoded straight from BSON by
+    pymongoarrow when it is installed."""
+    if find_arrow_all is not None:
+        schema = _pymongoarrow_schema(schema)
+        return find_arrow_all(collection, filters, schema=schema, **kwargs)
+    cursor = collection.find(filters, batch_size=batch_size, **kwargs)
+    with cursor:
+        return batches_to_arrow(_batches(cursor, batch_size), schema)
+
+
+def aggregate_arrow(
+    collection, pipeline: List, schema=None, batch_size: int = 1000, **kwargs
+) -> pa.Table:
+    """Run an aggregation returning an Arrow table (see 'find_arrow')."""
+    if aggregate_arrow_all is not None:
+        schema = _pymongoarrow_schema(schema)
+        return aggregate_arrow_all(collection, pipeline, schema=schema, **kwargs)
+    cursor = collection.aggregate(pipeline, batchSize=batch_size, **kwargs)
+    with cursor:
+        return batches_to_arrow(_batches(cursor, batch_size), schema)
+
+
+def _batches(cursor, batch_size: int) -> Iterator[List[Dict]]:
+    while batch := list(islice(cursor, batch_size)):
+        yield batch
+
+
+def _pymongoarrow_schema(schema):
+    if schema is None or isinstance(schema, Schema):
+        return schema
+    if isinstance(schema, pa.Schema):
+        return Schema.from_arrow(schema)
+    return Schema(schema)
+
+
+def concat_tables(tables: List[pa.Table]) -> pa.Table:
+    """Concatenate tables of possibly different schemas, the fields missing from
+    some of them being null."""
+    return pa.concat_tables(tables, **PROMOTE)
+
+
+def unify_schemas(schemas: List[pa.Schema]) -> pa.Schema:
+    """Merge the schemas of record batches into one holding all of them, the types
+    of a field widened if needed: fields null in every batch are strings."""
+    if not schemas:
+        return pa.schema([])
+    schema = pa.unify_schemas(schemas, **UNIFY)
+    return pa.schema(
+        field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+        for field in schema
+    )
+
+
+def conform(record_batch: pa.RecordBatch, schema: pa.Schema) -> pa.RecordBatch:
+    """Cast the record batch to the schema, the fields it misses being null. Raise
+    a ValueError if it has values the schema can't hold."""
+    columns = dict(zip(record_batch.schema.names, record_batch.columns))
+    extra = [
+        name
+        for name, column in columns.items()
+        if name not in schema.names and column.null_count < len(column)
+    ]
+    if extra:
+        raise ValueError(f"fields {extra} are not in the schema")
+    arrays = []
+    for field in schema:
+        if field.name not in columns:
+            arrays.append(pa.nulls(record_batch.num_rows, field.type))
+            continue
+        try:
+            arrays.append(columns[field.name].cast(field.type))
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as error:
+            message = f"field '{field.name}' doesn't fit the schema type {field.type}"
+            raise ValueError(message) from error
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def to_ipc(table: pa.Table) -> bytes:
+    """Serialize the table to an Arrow IPC stream, a compact value to cache."""
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def from_ipc(buffer: bytes, output: str = "arrow"):
+    """Read a table from an Arrow IPC stream and convert it to the requested output:
+    an Arrow table, a pandas DataFrame or a dictionary of NumPy arrays."""
+    table = pa.ipc.open_stream(buffer).read_all()
+    if output == "pandas":
+        return table.to_pandas()
+    if output == "numpy":
+        return {name: table[name].to_numpy() for name in table.column_names}
+    return table
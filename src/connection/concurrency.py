@@ -0,0 +1,22 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import current_thread
+from typing import Callable
+
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+MAX_WORKERS = 16
+
+_executor = ThreadPoolExecutor(MAX_WORKERS, thread_name_prefix="st-mongo-connection")
+
+
+def submit(func: Callable, *args, **kwargs) -> Future:
+    """Run the function in the process-wide worker pool, within the Streamlit script
+    run context of the caller so that Streamlit features (e.g. caching) keep working
+    in the worker thread."""
+    ctx = get_script_run_ctx()
+
+    def run():
+        add_script_run_ctx(current_thread(), ctx)
+        return func(*args, **kwargs)
+
+    return _executor.submit(run)
@@ -0,0 +1,79 @@
+from typing import Callable, Dict, List, Tuple
+
+from .keys import canonical_projection, canonical_sort
+
+OPERATIONS = ("find", "count", "distinct", "aggregate")
+FORBIDDEN_STAGES = (
+    "$collStats",
+    "$facet",
+    "$geoNear",
+    "$indexStats",
+    "$merge",
+    "$out",
+    "$planCacheStats",
+    "$search",
+    "$searchMeta",
+)
+
+
+def _operation(name: str, read: Dict) -> str:
+    operations = [operation for operation in OPERATIONS if operation in read]
+    if len(operations) != 1:
+        raise ValueError(f"'{name}' must define exactly one of {OPERATIONS}")
+    return operations[0]
+
+
+def _match(filters: Dict) -> List[Dict]:
+    return [{"$match": filters}] if filters else []
+
+
+def compile_read(name: str, read: Dict) -> Tuple[List[Dict], Callable]:
+    """Compile a read of a batch to an aggregation pipeline and a function decoding
+    its result from the documents the pipeline outputs."""
+    operation = _operation(name, read)
+    if operation == "count":
+        pipeline = _match(read["count"]) + [{"$count": "count"}]
+        return pipeline, lambda docs: docs[0]["count"] if docs else 0
+    if operation == "distinct":
+        field = read["distinct"]
+        pipeline = _match(read.get("filters")) + [
+            {"$unwind": f"${field}"},
+            {"$group": {"_id": f"${field}"}},
+            {"$sort": {"_id": 1}},
+        ]
+        return pipeline, lambda docs: [doc["_id"] for doc in docs]
+    if operation == "find":
+        pipeline = _match(read["find"])
+        if read.get("sort"):
+            pipeline.append({"$sort": dict(canonical_sort(read["sort"]))})
+        if read.get("skip"):
+            pipeline.append({"$skip": read["skip"]})
+        if read.get("limit"):
+            pipeline.append({"$limit": read["limit"]})
+        projection = canonical_projection(read.get("projection"))
+        projection |= {"_id": 0} if not read.get("mongo_id") else {}
+        return pipeline + ([{"$project": projection}] if projection else []), list
+    pipeline = list(read["aggregate"])
+    for stage in pipeline:
+        if forbidden := set(stage) & set(FORBIDDEN_STAGES):
+            raise ValueError(f"'{name}' uses {forbidden.pop()}, not allowed in $facet")
+    return pipeline, list
+
+
+def compile_batch(reads: Dict[str, Dict]) -> Tuple[List[Dict], Dict[str, Callable]]:
+    """Compile named reads to a single $facet aggregation pipeline, returning it with
+    the decoders of the named results. A $match shared by every read is moved
+    before the $facet, where it can use the indexes of the collection."""
+    compiled = {name: compile_read(name, read) for name, read in reads.items()}
+    first_stages = [pipeline[:1] for pipeline, _ in compiled.values()]
+    shared = first_stages[0] if first_stages else []
+    if (
+        not shared
+        or "$match" not in shared[0]
+        or first_stages.count(shared) < len(first_stages)
+    ):
+        shared = []
+    facet = {name: pipeline[len(shared) :] for name, (pipeline, _) in compiled.items()}
+    facet = {name: pipeline or [{"$match": {}}] for name, pipeline in facet.items()}
+    decoders = {name: decode for name, (_, decode) in compiled.items()}
+    return shared + [{"$facet": facet}], decoders
@@ -0,0 +1,91 @@
+import logging
+from collections.abc import Mapping
+from threading import Thread
+from typing import Dict, List, Optional, Tuple, Union
+
+from pymongo import IndexModel
+from pymongo.collection import Collection
+
+from .keys import canonical_sort
+
+RANGE_OPERATORS = ("$gt", "$gte", "$lt", "$lte", "$ne", "$nin", "$regex", "$exists")
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def index_model(spec: Union[Mapping, List, str]) -> IndexModel:
+    """Build an index from its declaration: the keys alone ("field", [["a", 1],
+    ["b", -1]] or {a=1, b=-1}) or a table with the 'keys' and the index options,
+    e.g. {keys={user=1, timestamp=-1}, unique=true, name="user_timestamp"}."""
+    if isinstance(spec, Mapping) and "keys" in spec:
+        options = {key: value for key, value in spec.items() if key != "keys"}
+        keys = spec["keys"]
+    else:
+        options, keys = {}, spec
+    if isinstance(keys, Mapping):
+        keys = list(keys.items())
+    if isinstance(keys, str):
+        keys = [(keys, 1)]
+    return IndexModel([tuple(key) for key in keys], **options)
+
+
+def ensure_indexes(collection: Collection, specs: List) -> Thread:
+    """Create the declared indexes in a background thread, logging the failures.
+    Creating an index that already exists with the same options does nothing."""
+    models = [index_model(spec) for spec in specs]
+
+    def create():
+        try:
+            collection.create_indexes(models)
+        except Exception as error:
+            _LOGGER.warning(
+                "Indexes of %s not ensured: %s", collection.full_name, error
+            )
+
+    thread = Thread(target=create, name=f"indexes-{collection.full_name}", daemon=True)
+    thread.start()
+    return thread
+
+
+def _is_range(condition) -> bool:
+    return isinstance(condition, Mapping) and any(
+        operator in RANGE_OPERATORS for operator in condition
+    )
+
+
+def _fields(filters: Dict) -> Tuple[List[str], List[str]]:
+    """Split the fields of the filters into equality and range conditions."""
+    equality, ranges = [], []
+    for field, condition in (filters or {}).items():
+        if field == "$and":
+            for sub in condition:
+                sub_equality, sub_ranges = _fields(sub)
+                equality += sub_equality
+                ranges += sub_ranges
+        elif field.startswith("$"):
+            continue
+        elif _is_range(condition):
+            ranges.append(field)
+        else:
+            equality.append(field)
+    return equality, ranges
+
+
+def suggest_index(filters: Dict, sort=None) -> Optional[List[Tuple[str, int]]]:
+    """Suggest a compound index for the filters and sort following the ESR rule:
+    Equality fields first, then the Sort fields, then the Range fields."""
+    equality, ranges = _fields(filters)
+    keys = [(field, 1) for field in dict.fromkeys(equality)]
+    for field, direction in canonical_sort(sort):
+        if field not in dict(keys) and direction in (1, -1):
+            keys.append((field, direction))
+    keys += [(field, 1) for field in dict.fromkeys(ranges) if field not in dict(keys)]
+    return keys or None
+
+
+def covered_by(keys: List[Tuple[str, int]], indexes: Dict) -> bool:
+    """Whether an index of the collection ('index_information') starts with keys."""
+    return any(
+        [tuple(key) for key in index["key"][: len(keys)]] == list(keys)
+        for index in indexes.values()
+    )
@@ -0,0 +1,254 @@
+from collections import defaultdict
+from re import Pattern
+from threading import Lock
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple, Union
+
+from bson import BSON
+from bson.regex import Regex
+
+from .keys import canonical_filters
+
+MODES = ("collection", "filters")
+MAX_TRACKED_READS = 10_000
+
+
+class Invalidator:
+    """Process-wide registry of write versions, one namespace per collection.
+    Cached reads put the version returned by 'version' in their cache key: a write
+    bumps the versions of the reads it might affect, so their old entries are never
+    hit again and expire on their own TTL."""
+
+    def __init__(self, max_tracked_reads: int = MAX_TRACKED_READS):
+        self._lock = Lock()
+        self._max_tracked_reads = max_tracked_reads
+        self._generations: Dict[Hashable, int] = defaultdict(int)
+        self._reads: Dict[Hashable, Dict[bytes, List]] = defaultdict(dict)
+        self._listeners: List[Callable] = []
+
+    def version(self, namespace: Hashable, filters: Dict = None) -> Tuple[int, int]:
+        """Return the current version of a read on the namespace with the provided
+        filters, to be used as part of its cache key. Reads are tracked by their
+        canonical filters, like their cache keys."""
+        read_key = BSON.encode(canonical_filters(filters or {}))
+        with self._lock:
+            reads = self._reads[namespace]
+            if read_key not in reads:
+                if len(reads) >= self._max_tracked_reads:
+                    # forgetting a read would reset its version: start a new
+                    # generation instead, so no stale entry can be hit again
+                    reads.clear()
+                    self._generations[namespace] += 1
+                reads[read_key] = [filters or {}, 0]
+            return self._generations[namespace], reads[read_key][1]
+
+    def invalidate(
+        self,
+        namespace: Hashable,
+        mode: str = "collection",
+        documents: Iterable[Dict] = None,
+        filters: Dict = None,
+        update: Union[Dict, List] = None,
+    ):
+        """Mark the cached reads of the namespace as stale after a write.
+        With mode 'collection' every read is invalidated, with mode 'filters' only
+        the reads whose filters might match the written documents: the inserted
+        'documents', or the ones matched by 'filters' before and after 'update'.
+        With mode None no read is invalidated. The write is then notified to the
+        listeners in any case."""
+        documents = list(documents or [])
+        with self._lock:
+            if mode == "filters":
+                for read in self._reads[namespace].values():
+                    if affects(read[0], documents, filters, update):
+                        read[1] += 1
+            elif mode:
+                self._reads[namespace].clear()
+                self._generations[namespace] += 1
+        for listener in self._listeners:
+            listener(
+                namespace, mode, documents=documents, filters=filters, update=update
+            )
+
+    def add_listener(self, listener: Callable):
+        """Call 'listener(namespace, mode, documents, filters, update)' after every
+        invalidation, e.g. to maintain data derived from the collection. A write
+        without documents nor filters is unknown and might have changed anything."""
+        self._listeners.append(listener)
+
+
+invalidator = Invalidator()
+
+
+# ---- filters analysis (conservative: when in doubt, a filter might match)
+
+_MISSING = object()
+_COMPARISONS = {
+    "$gt": lambda value, arg: value > arg,
+    "$gte": lambda value, arg: value >= arg,
+    "$lt": lambda value, arg: value < arg,
+    "$lte": lambda value, arg: value <= arg,
+}
+
+
+def _resolve(document: Dict, path: str):
+    value = document
+    for part in path.split("."):
+        if isinstance(value, list):
+            return _MISSING, True
+        if not isinstance(value, Dict) or part not in value:
+            return _MISSING, False
+        value = value[part]
+    return value, False
+
+
+def _equals(value, arg) -> bool:
+    if isinstance(arg, (Pattern, Regex)):
+        return True
+    if isinstance(value, list):
+        return value == arg or arg in value
+    return value == arg
+
+
+def _condition_matches(value, condition) -> bool:
+    is_operator = isinstance(condition, Dict) and condition
+    if not is_operator or not all(str(key).startswith("$") for key in condition):
+        return value is not _MISSING and _equals(value, condition)
+    for operator, arg in condition.items():
+        try:
+            if operator == "$eq":
+                matches = value is not _MISSING and _equals(value, arg)
+            elif operator == "$ne":
+                matches = value is _MISSING or not _equals(value, arg)
+            elif operator == "$in":
+                matches = value is not _MISSING and any(_equals(value, a) for a in arg)
+            elif operator == "$nin":
+                matches = value is _MISSING or not any(_equals(value, a) for a in arg)
+            elif operator == "$exists":
+                matches = (value is not _MISSING) == bool(arg)
+            elif operator in _COMPARISONS and not isinstance(value, list):
+                matches = value is not _MISSING and _COMPARISONS[operator](value, arg)
+            else:
+                matches = True
+        except TypeError:
+            matches = True
+        if not matches:
+            return False
+    return True
+
+
+def might_match(filters: Dict, document: Dict) -> bool:
+    """Return False only if the document surely does not match the filters."""
+    for field, condition in (filters or {}).items():
+        if field == "$and":
+            matches = all(might_match(sub, document) for sub in condition)
+        elif field == "$or":
+            matches = any(might_match(sub, document) for sub in condition)
+        elif field.startswith("$"):
+            matches = True
+        else:
+            value, ambiguous = _resolve(document, field)
+            matches = ambiguous or _condition_matches(value, condition)
+        if not matches:
+            return False
+    return True
+
+
+def affects(
+    read_filters: Dict,
+    documents: List[Dict],
+    filters: Dict = None,
+    update: Union[Dict, List] = None,
+) -> bool:
+    """Return False only if the write surely doesn't change which documents match
+    the read filters, nor their content."""
+    return any(might_match(read_filters, doc) for doc in documents) or (
+        filters is not None
+        and (overlaps(filters, read_filters) or updated_into(update, read_filters))
+    )
+
+
+def _equality_values(condition) -> Optional[List]:
+    if not isinstance(condition, Dict):
+        return [condition]
+    if set(condition) == {"$eq"}:
+        return [condition["$eq"]]
+    if set(condition) == {"$in"}:
+        return list(condition["$in"])
+    return None
+
+
+def overlaps(filters: Dict, other: Dict) -> bool:
+    """Return False only if no document can match both filters, i.e. they require
+    different constant values for the same field."""
+    for field, condition in (filters or {}).items():
+        if field.startswith("$") or field not in (other or {}):
+            continue
+        values, others = _equality_values(condition), _equality_values(other[field])
+        if values is None or others is None:
+            continue
+        if any(isinstance(value, (list, Dict)) for value in values + others):
+            continue
+        if not any(value == other_value for value in values for other_value in others):
+            return False
+    return True
+
+
+def is_update(update: Union[Dict, List]) -> bool:
+    return isinstance(update, list) or any(key.startswith("$") for key in update)
+
+
+def updated_into(update: Union[Dict, List, None], filters: Dict) -> bool:
+    """Return True if the update might make documents match the filters."""
+    if update is None:
+        return False
+    if is_update(update):
+        return touches(update_fields(update), filters)
+    return might_match(filters, update)
+
+
+def update_fields(update: Union[Dict, List]) -> Optional[set]:
+    """Return the fields modified by an update document, None if they are unknown
+    (aggregation pipeline updates and replacements)."""
+    if not isinstance(update, Dict) or not is_update(update):
+        return None
+    fields = set()
+    for operator, arguments in update.items():
+        if operator == "$rename":
+            fields |= set(arguments) | set(arguments.values())
+        elif isinstance(arguments, Dict):
+            fields |= set(arguments)
+        else:
+            return None
+    return fields
+
+
+def filter_fields(filters: Dict) -> Optional[set]:
+    """Return the fields referenced by the filters, None if they are unknown."""
+    fields = set()
+    for field, condition in (filters or {}).items():
+        if field in ("$and", "$or", "$nor"):
+            for sub in condition:
+                sub_fields = filter_fields(sub)
+                if sub_fields is None:
+                    return None
+                fields |= sub_fields
+        elif field.startswith("$"):
+            return None
+        else:
+            fields.add(field)
+    return fields
+
+
+def touches(fields: Optional[set], filters: Dict) -> bool:
+    """Return True if modifying the fields might change which documents match the
+    filters."""
+    if fields is not None and not fields:
+        return False
+    read_fields = filter_fields(filters)
+    if fields is None or read_fields is None:
+        return True
+    return any(
+        a == b or a.startswith(f"{b}.") or b.startswith(f"{a}.")
+        for a in fields
+        for b in read_fields
+    )
@@ -0,0 +1,138 @@
+from hashlib import sha256
+from typing import Dict, List, Tuple, Union
+
+from bson import BSON
+from bson.errors import InvalidDocument
+
+ORDER_INSENSITIVE = ("$in", "$nin", "$all")
+# aggregation expressions and code: their arguments are positional
+VERBATIM = ("$expr", "$where", "$function", "$accumulator")
+DIRECTIONS = {"asc": 1, "ascending": 1, "desc": -1, "descending": -1}
+
+
+def _is_operator(document: Dict) -> bool:
+    return bool(document) and all(str(key).startswith("$") for key in document)
+
+
+def canonical_value(value):
+    """Normalize a query value: operator documents are sorted by key and the
+    arguments of set-like query operators are sorted by their BSON encoding. Literal
+    embedded documents keep their key order, which matters for equality, and
+    aggregation expressions ($expr) are kept as they are."""
+    if isinstance(value, Dict):
+        if not _is_operator(value):
+            return {key: canonical_value(arg) for key, arg in value.items()}
+        return {
+            key: (
+                sorted((canonical_value(a) for a in arg), key=_encode_value)
+                if key in ORDER_INSENSITIVE and isinstance(arg, (list, tuple))
+                else canonical_filters(arg)
+                if key in ("$and", "$or", "$nor") or key == "$elemMatch"
+                else arg
+                if key in VERBATIM
+                else canonical_value(arg)
+            )
+            for key, arg in sorted(value.items())
+        }
+    if isinstance(value, (list, tuple)):
+        return [canonical_value(item) for item in value]
+    return value
+
+
+def canonical_filters(filters: Union[Dict, List, None]) -> Union[Dict, List]:
+    """Normalize filters: top level fields are sorted, since they are and-ed."""
+    if isinstance(filters, (list, tuple)):
+        return [canonical_filters(sub) for sub in filters]
+    if not isinstance(filters, Dict):
+        return canonical_value(filters)
+    return {
+        field: filters[field] if field in VERBATIM else canonical_value(filters[field])
+        for field in sorted(filters)
+    }
+
+
+def canonical_projection(projection: Union[Dict, List, None]) -> Dict:
+    """Normalize a projection to a sorted document of 0/1 (or expression) values,
+    expressions being kept as they are."""
+    if not projection:
+        return {}
+    if not isinstance(projection, Dict):
+        projection = {field: 1 for field in projection}
+    return {
+        field: int(spec) if isinstance(spec, (bool, int)) else spec
+        for field, spec in sorted(projection.items())
+    }
+
+
+def canonical_sort(sort: Union[str, List, Dict, None]) -> List[Tuple[str, int]]:
+    """Normalize a sort specification to a list of (field, direction) pairs."""
+    if not sort:
+        return []
+    if isinstance(sort, str):
+        sort = [(sort, 1)]
+    elif isinstance(sort, Dict):
+        sort = list(sort.items())
+    return [
+        (field, DIRECTIONS.get(str(direction).lower(), direction))
+        if not isinstance(direction, Dict)
+        else (field, direction)
+        for field, direction in (
+            (spec, 1) if isinstance(spec, str) else spec for spec in sort
+        )
+    ]
+
+
+def canonical_pipeline(pipeline: List[Dict]) -> List[Dict]:
+    """Normalize the $match stages of an aggregation pipeline, every other stage
+    is kept as it is."""
+    return [
+        {"$match": canonical_filters(stage["$match"])}
+        if set(stage) == {"$match"}
+        else stage
+        for stage in pipeline or []
+    ]
+
+
+CANONICAL_OPTIONS = {"filters": canonical_filters, "pipeline": canonical_pipeline}
+
+
+def _encode_value(value) -> bytes:
+    return BSON.encode({"v": value})
+
+
+def _encodable(value):
+    """Replace the values BSON cannot encode (e.g. sessions or collations passed as
+    options) with their representation."""
+    if isinstance(value, Dict):
+        return {key: _encodable(arg) for key, arg in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encodable(item) for item in value]
+    try:
+        _encode_value(value)
+    except InvalidDocument:
+        return repr(value)
+    return value
+
+
+def scope_name(scope: Tuple) -> str:
+    """Return the digest of a scope (connection URL, database and collection),
+    prefixing the cache keys of its reads."""
+    return sha256(BSON.encode({"scope": list(scope)})).hexdigest()[:16]
+
+
+def cache_key(scope: Tuple, method: str, **query) -> str:
+    """Return a digest identifying a read, prefixed by the name of its scope: its
+    scope (connection URL, database and collection), method and query, whose
+    'filters' and 'pipeline' are put in canonical form for the key only (the server
+    gets them as written). Equal queries share the same key however they are
+    written, datetimes and ObjectIds are compared by their BSON encoding."""
+    options = {
+        key: CANONICAL_OPTIONS[key](value) if key in CANONICAL_OPTIONS else value
+        for key, value in sorted(query.items())
+    }
+    document = {"scope": list(scope), "method": method, "query": options}
+    try:
+        encoded = BSON.encode(document)
+    except InvalidDocument:
+        encoded = BSON.encode(_encodable(document))
+    return f"{scope_name(scope)}:{sha256(encoded).hexdigest()}"
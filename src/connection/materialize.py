@@ -0,0 +1,283 @@
+import logging
+from datetime import datetime, timedelta
+from threading import Lock
+from time import time
+from typing import Dict, Hashable, List, Optional, Tuple, Union
+
+from pymongo import ReturnDocument
+from pymongo.collection import Collection
+from pymongo.errors import DuplicateKeyError
+
+from .concurrency import submit
+from .invalidation import invalidator
+from .keys import cache_key
+
+REFRESHES = ("interval", "on_write", "incremental")
+STATE_COLLECTION = "st_mongo_views"
+REFRESHED = "_refreshed"
+LEASE = 600
+OVERLAP = 60
+MAX_SEEN = 10_000
+
+_LOGGER = logging.getLogger(__name__)
+_views: Dict[Tuple, "MaterializedView"] = {}
+_lock = Lock()
+
+
+def merge_pipeline(group: Dict) -> Union[List[Dict], str]:
+    """Return the $merge 'whenMatched' pipeline adding the accumulators of a $group
+    computed over new documents to the ones already materialized ('keepExisting'
+    if there is nothing to add)."""
+    merged = {}
+    for field, accumulator in group.items():
+        if field == "_id":
+            continue
+        ((operator, _),) = accumulator.items()
+        current, new = f"${field}", f"$$new.{field}"
+        if operator in ("$sum", "$count"):
+            merged[field] = {"$add": [current, new]}
+        elif operator in ("$min", "$max"):
+            merged[field] = {operator: [current, new]}
+        elif operator == "$addToSet":
+            merged[field] = {"$setUnion": [current, new]}
+        elif operator == "$push":
+            merged[field] = {"$concatArrays": [current, new]}
+        elif operator == "$last":
+            merged[field] = new
+        elif operator != "$first":
+            raise ValueError(f"{operator} results can't be updated incrementally")
+    return [{"$set": merged}] if merged else "keepExisting"
+
+
+class MaterializedView:
+    """Aggregation results persisted with $merge in the 'name' collection of the
+    database of the source collection, so that dashboards read a few summary
+    documents instead of aggregating the whole collection. Refresh modes:
+    - 'interval': the whole aggregation is run again every 'interval' seconds, in
+      the background while the previous results are served;
+    - 'on_write': it is run again on the first read after a write made through
+      the connections of the process;
+    - 'incremental': the pipeline, ending with a $group, is run on the documents
+      with a 'watermark_field' value above the last one processed only, and its
+      accumulators are merged into the materialized ones. Since documents can be
+      inserted after others with a higher value (e.g. stamped by the client, or
+      buffered), the values up to 'overlap' seconds (of a date or number field)
+      below the last one are read again, skipping the documents already
+      processed (up to 'MAX_SEEN' of them: a denser window triggers a full
+      rebuild). Writes other than inserts made through the connections of the
+      process trigger a full rebuild.
+    The refresh state is kept in the 'st_mongo_views' collection, where a lease
+    ensures that a single process refreshes a view at a time."""
+
+    def __init__(
+        self,
+        source: Collection,
+        namespace: Hashable,
+        name: str,
+        pipeline: List[Dict],
+        refresh: str = "interval",
+        interval: float = 300,
+        watermark_field: str = "timestamp",
+        overlap: float = OVERLAP,
+    ):
+        if refresh not in REFRESHES:
+            raise ValueError(f"refresh must be one of {REFRESHES}")
+        if name == source.name:
+            raise ValueError("a view can't be materialized in its source collection")
+        if refresh == "incremental":
+            if not pipeline or "$group" not in pipeline[-1]:
+                raise ValueError("an incremental view pipeline must end with $group")
+            self._merge = merge_pipeline(pipeline[-1]["$group"])
+        self.source, self.namespace, self.pipeline = source, namespace, pipeline
+        self.refresh, self.interval = refresh, interval
+        self.watermark_field, self.overlap = watermark_field, overlap
+        self.target = source.database[name]
+        self.key = f"{source.name}.{name}"
+        self.version = cache_key(namespace, "materialize", pipeline=pipeline)
+        self._states = source.database[STATE_COLLECTION]
+        self._dirty = self._rebuild = False
+        invalidator.add_listener(self.on_write)
+
+    def on_write(
+        self,
+        namespace: Hashable,
+        mode: str,
+        documents: List[Dict],
+        filters: Dict = None,
+        update=None,
+    ):
+        if namespace == self.namespace:
+            self._dirty = True
+            # updates and deletions can't be applied incrementally
+            self._rebuild = self._rebuild or not documents
+
+    # refresh
+
+    def update(self):
+        """Refresh the view if it is due (see the refresh modes)."""
+        state = self._states.find_one({"_id": self.key}) or {}
+        built = state.get("version") == self.version
+        if self.refresh == "interval" and built:
+            if time() - state.get("refreshed_at", 0) >= self.interval:
+                submit(self._refresh_logged)
+            return
+        if built and self.refresh == "on_write" and not self._dirty:
+            return
+        self.refresh_now()
+
+    def _refresh_logged(self):
+        try:
+            self.refresh_now()
+        except Exception as error:
+            _LOGGER.warning("View %s not refreshed: %s", self.key, error)
+
+    def refresh_now(self) -> bool:
+        """Refresh the view now, unless another process is refreshing it: return
+        whether it was refreshed."""
+        self._dirty = False
+        state = self._acquire()
+        if state is None:
+            return False
+        watermark, seen = state.get("watermark"), state.get("seen")
+        try:
+            if self.refresh != "incremental":
+                watermark, seen = self._full()
+            elif state.get("version") != self.version or self._rebuild or seen is None:
+                self._rebuild = False
+                watermark, seen = self._full(self._watermark())
+            else:
+                watermark, seen = self._incremental(watermark, seen)
+        except BaseException:
+            self._states.update_one({"_id": self.key}, {"$set": {"lease": 0}})
+            raise
+        refreshed = {"version": self.version, "refreshed_at": time(), "lease": 0}
+        refreshed.update(watermark=watermark, seen=seen)
+        self._states.update_one({"_id": self.key}, {"$set": refreshed})
+        return True
+
+    def _acquire(self) -> Optional[Dict]:
+        """Take the refresh lease of the view, returning its state (None if another
+        process holds the lease)."""
+        try:
+            state = self._states.find_one_and_update(
+                {"_id": self.key, "lease": {"$not": {"$gt": time()}}},
+                {"$set": {"lease": time() + LEASE}},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE,
+            )
+        except DuplicateKeyError:
+            return None
+        return state or {}
+
+    def _watermark(self):
+        field = self.watermark_field
+        last = self.source.find_one(
+            {field: {"$exists": True}}, {field: 1}, sort=[(field, -1)]
+        )
+        return last[field] if last else None
+
+    def _lower(self, watermark):
+        """Start of the overlap window below the watermark."""
+        if isinstance(watermark, datetime):
+            return watermark - timedelta(seconds=self.overlap)
+        if isinstance(watermark, (int, float)) and not isinstance(watermark, bool):
+            return watermark - self.overlap
+        return watermark
+
+    def _window(self, lower, upper, seen: List = ()) -> List[List]:
+        """Return the _id and watermark of the documents with a watermark in
+        (lower, upper], but those already seen: at most 'MAX_SEEN' + 1 of them."""
+        field = self.watermark_field
+        bounds = {"$lte": upper}
+        if lower is not None:
+            bounds["$gt"] = lower
+        query = {field: bounds}
+        if seen:
+            query["_id"] = {"$nin": [_id for _id, _ in seen]}
+        cursor = self.source.find(query, {field: 1}, limit=MAX_SEEN + 1)
+        return [[doc["_id"], doc[field]] for doc in cursor]
+
+    def _full(self, watermark=None) -> Tuple:
+        """Run the whole aggregation (up to the watermark if provided), replacing the
+        materialized results and dropping the ones no longer produced. Return the
+        watermark and the documents processed in its overlap window (None if there
+        are more than 'MAX_SEEN': the next refresh is a full one again)."""
+        refreshed, seen = time(), []
+        pipeline = list(self.pipeline)
+        if watermark is not None:
+            # the documents of the overlap window are listed first: those added to
+            # it meanwhile are left to the next refresh
+            lower = self._lower(watermark)
+            seen = self._window(lower, watermark)
+            match = {self.watermark_field: {"$lte": watermark}}
+            if len(seen) > MAX_SEEN:
+                seen = None
+            else:
+                processed = [
+                    {self.watermark_field: {"$lte": lower}},
+                    {"_id": {"$in": [_id for _id, _ in seen]}},
+                ]
+                match = {"$or": processed}
+            pipeline.insert(0, {"$match": match})
+        pipeline += [
+            {"$set": {REFRESHED: refreshed}},
+            {"$merge": {"into": self.target.name, "whenMatched": "replace"}},
+        ]
+        self.source.aggregate(pipeline, allowDiskUse=True)
+        self.target.delete_many({REFRESHED: {"$ne": refreshed}})
+        return watermark, seen
+
+    def _incremental(self, since, seen: List) -> Tuple:
+        """Run the aggregation on the documents added since the last watermark (or
+        in its overlap window, but those already processed), merging its results
+        into the materialized ones. Return the new watermark and the documents
+        processed in its overlap window, falling back to a full rebuild if there
+        are more than 'MAX_SEEN'."""
+        watermark = self._watermark()
+        if watermark is None:
+            return since, seen
+        field = self.watermark_field
+        lower = None if since is None else self._lower(since)
+        upper = self._lower(watermark)
+        kept = [[_id, value] for _id, value in seen if value > upper]
+        # the documents of the new overlap window are listed first, as in _full;
+        # those below it are matched on their watermark
+        added = self._window(upper, watermark, seen)
+        if len(kept) + len(added) > MAX_SEEN:
+            return self._full(watermark)
+        if added or watermark != since:
+            bounds = {"$lte": upper}
+            if lower is not None:
+                bounds["$gt"] = lower
+            below = {field: bounds}
+            if seen:
+                below["_id"] = {"$nin": [_id for _id, _ in seen]}
+            new = [below, {"_id": {"$in": [_id for _id, _ in added]}}]
+            merge = {"into": self.target.name, "whenMatched": self._merge}
+            pipeline = [{"$match": {"$or": new}}, *self.pipeline, {"$merge": merge}]
+            self.source.aggregate(pipeline, allowDiskUse=True)
+        return watermark, kept + added
+
+    # read
+
+    def read(self, filters: Dict = None, **kwargs) -> List[Dict]:
+        """Return the materialized results matching the filters."""
+        return list(self.target.find(filters or {}, {REFRESHED: 0}, **kwargs))
+
+
+def get_view(
+    source: Collection, namespace: Hashable, name: str, pipeline: List[Dict], **options
+) -> MaterializedView:
+    """Return the process-wide view of the namespace with the provided name,
+    replacing it if its definition changed."""
+    with _lock:
+        view = _views.get((namespace, name))
+        definition = (pipeline, options.get("refresh", "interval"))
+        if view is None or (view.pipeline, view.refresh) != definition:
+            view = _views[namespace, name] = MaterializedView(
+                source, namespace, name, pipeline, **options
+            )
+        else:
+            view.interval = options.get("interval", view.interval)
+            view.overlap = options.get("overlap", view.overlap)
+        return view
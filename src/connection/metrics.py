@@ -0,0 +1,277 @@
+import json
+from bisect import bisect_left
+from collections import defaultdict
+from collections.abc import Mapping
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from inspect import signature
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Dict, Hashable, Iterator, List, Tuple
+
+from pymongo.monitoring import (
+    CommandFailedEvent,
+    CommandListener,
+    CommandStartedEvent,
+    CommandSucceededEvent,
+)
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUANTILES = (0.5, 0.95, 0.99)
+CACHE_RESULTS = ("hit", "stale", "miss", "coalesced", "fallback")
+
+_operations: ContextVar[Tuple["Operation", ...]] = ContextVar("operations", default=())
+
+
+class Histogram:
+    """Latency histogram over fixed bucket bounds (in seconds)."""
+
+    def __init__(self, bounds: Tuple[float, ...] = BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count, self.sum = 0, 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (the largest bound for
+        the values above every bucket)."""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.bounds[-1]
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            **{f"p{round(q * 100)}": self.quantile(q) for q in QUANTILES},
+        }
+
+
+class Operation:
+    """Metrics of an operation on a collection with a given query shape."""
+
+    def __init__(self):
+        self.calls, self.errors, self.commands = 0, 0, 0
+        self.documents, self.bytes = 0, 0
+        self.cache = dict.fromkeys(CACHE_RESULTS, 0)
+        self.latency, self.server = Histogram(), Histogram()
+
+    def to_dict(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            **self.cache,
+            "documents": self.documents,
+            "bytes": self.bytes,
+            "commands": self.commands,
+            "latency": self.latency.to_dict(),
+            "server": self.server.to_dict(),
+        }
+
+
+class Metrics:
+    """Process-wide registry of the operation metrics, keyed by collection namespace,
+    operation and query shape."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._operations: Dict[Tuple, Operation] = defaultdict(Operation)
+
+    @contextmanager
+    def track(self, namespace: Hashable, operation: str, shape: str) -> Iterator:
+        """Time the enclosed operation, collecting what is recorded meanwhile."""
+        with self._lock:
+            metrics = self._operations[namespace, operation, shape]
+        token = _operations.set(_operations.get() + (metrics,))
+        start = perf_counter()
+        try:
+            yield metrics
+        except BaseException:
+            with self._lock:
+                metrics.errors += 1
+            raise
+        finally:
+            elapsed = perf_counter() - start
+            _operations.reset(token)
+            with self._lock:
+                metrics.calls += 1
+                metrics.latency.observe(elapsed)
+
+    def record(self, cache: str = None, size: int = 0, **server):
+        """Add a cache result and the size of the served result, or a server
+        command (its 'seconds' and 'documents'), to the running operations."""
+        if not (operations := _operations.get()):
+            return
+        with self._lock:
+            for metrics in operations:
+                if cache:
+                    metrics.cache[cache] += 1
+                metrics.bytes += size
+                if server:
+                    metrics.commands += 1
+                    metrics.documents += server.get("documents", 0)
+                    metrics.server.observe(server["seconds"])
+
+    def snapshot(self, namespace: Hashable = None) -> List[Dict]:
+        """Return the metrics of every operation (of the namespace only if given),
+        identified by collection name, operation and query shape."""
+        with self._lock:
+            return [
+                {"collection": _collection(key[0]), "operation": key[1]}
+                | {"shape": key[2], **metrics.to_dict()}
+                for key, metrics in self._operations.items()
+                if namespace is None or key[0] == namespace
+            ]
+
+    def reset(self, namespace: Hashable = None):
+        with self._lock:
+            for key in list(self._operations):
+                if namespace is None or key[0] == namespace:
+                    del self._operations[key]
+
+    def prometheus(self, namespace: Hashable = None) -> str:
+        """Export the metrics in the Prometheus text exposition format. Only the
+        collection name of the namespace is exported, never the connection URL."""
+        with self._lock:
+            items = [
+                (_labels(key), metrics)
+                for key, metrics in self._operations.items()
+                if namespace is None or key[0] == namespace
+            ]
+        lines = []
+        for name, kind, help_text, values in (
+            ("calls_total", "counter", "Operations run.", lambda m: m.calls),
+            ("errors_total", "counter", "Operations failed.", lambda m: m.errors),
+            ("commands_total", "counter", "Server commands.", lambda m: m.commands),
+            ("documents_total", "counter", "Documents fetched.", lambda m: m.documents),
+            ("bytes_total", "counter", "Cached bytes served.", lambda m: m.bytes),
+        ):
+            lines += [f"# HELP st_mongo_{name} {help_text}"]
+            lines += [f"# TYPE st_mongo_{name} {kind}"]
+            lines += [f"st_mongo_{name}{{{lb}}} {values(m)}" for lb, m in items]
+        lines += ["# HELP st_mongo_cache_total Cache lookups by result."]
+        lines += ["# TYPE st_mongo_cache_total counter"]
+        for labels, metrics in items:
+            for result, count in metrics.cache.items():
+                lines += [f'st_mongo_cache_total{{{labels},result="{result}"}} {count}']
+        for name, help_text, histogram in (
+            ("seconds", "Operation latency.", lambda m: m.latency),
+            ("server_seconds", "Server command latency.", lambda m: m.server),
+        ):
+            lines += [f"# HELP st_mongo_{name} {help_text}"]
+            lines += [f"# TYPE st_mongo_{name} histogram"]
+            for labels, metrics in items:
+                lines += _histogram_lines(
+                    f"st_mongo_{name}", labels, histogram(metrics)
+                )
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _collection(namespace: Hashable) -> str:
+    return namespace[-1] if isinstance(namespace, tuple) else str(namespace)
+
+
+def _labels(key: Tuple) -> str:
+    namespace, operation, shape = key
+    return ",".join(
+        f'{label}="{_escape(str(value))}"'
+        for label, value in (
+            ("collection", _collection(namespace)),
+            ("operation", operation),
+            ("shape", shape),
+        )
+    )
+
+
+def _histogram_lines(name: str, labels: str, histogram: Histogram) -> List[str]:
+    lines, cumulative = [], 0
+    for bound, count in zip(histogram.bounds + (float("inf"),), histogram.counts):
+        cumulative += count
+        le = "+Inf" if bound == float("inf") else bound
+        lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+    lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+    return lines
+
+
+metrics = Metrics()
+
+
+# ---- query shapes
+
+
+def _shape(value):
+    if isinstance(value, Dict):
+        return {key: _shape(arg) for key, arg in value.items()}
+    if isinstance(value, (list, tuple)):
+        items = [_shape(item) for item in value]
+        return items if any(isinstance(item, (Dict, list)) for item in items) else "?"
+    return "?"
+
+
+def query_shape(query) -> str:
+    """Return the shape of a query (filters or pipeline): its fields and operators,
+    with every value replaced by '?'."""
+    if not isinstance(query, (Dict, list, tuple)):
+        return ""
+    return json.dumps(_shape(query), separators=(",", ":"))
+
+
+def instrument(query: str = None) -> Callable:
+    """Decorate a connection method to track its metrics under its name, the shape
+    of its 'query' argument (e.g. 'filters' or 'pipeline') being part of the key."""
+
+    def decorator(method: Callable) -> Callable:
+        operation = method.__name__
+        parameters = list(signature(method).parameters)
+        position = parameters.index(query) - 1 if query in parameters else None
+
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            value = kwargs.get(query)
+            if position is not None and len(args) > position:
+                value = args[position]
+            with metrics.track(self._namespace, operation, query_shape(value)):
+                return method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# ---- pymongo commands
+
+
+class CommandMetrics(CommandListener):
+    """Record the server time of the commands, and the documents they return, in
+    the operations running in the same thread."""
+
+    def started(self, event: CommandStartedEvent):
+        pass
+
+    def succeeded(self, event: CommandSucceededEvent):
+        reply = event.reply if isinstance(event.reply, Mapping) else {}
+        cursor = reply.get("cursor") or {}
+        batch = cursor.get("firstBatch", cursor.get("nextBatch", []))
+        documents = len(batch) if isinstance(batch, list) else 0
+        metrics.record(seconds=event.duration_micros / 1e6, documents=documents)
+
+    def failed(self, event: CommandFailedEvent):
+        metrics.record(seconds=event.duration_micros / 1e6)
+
+
+command_metrics = CommandMetrics()
@@ -1,42 +1,346 @@
-from typing import Dict, List, Union
+from asyncio import wrap_future
+from collections.abc import Mapping
+from functools import partial
+from itertools import chain, islice
+from threading import Thread
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
-from pymongo import MongoClient
+import pandas as pd
+import pyarrow as pa
+from bson import ObjectId
+from pymongo import MongoClient, ReplaceOne
+from pymongo.collection import Collection
+from pymongo.command_cursor import CommandCursor
+from pymongo.cursor import Cursor
+from pymongo.errors import BulkWriteError
 from streamlit.connections import BaseConnection
-from streamlit.runtime.caching import cache_data
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from .budget import is_timeout, within
+from .bulk import BulkResult, chunks
+from .cache import ResultCache, ttl_seconds
+from .clients import get_client, get_write_limits
+from .columnar import (
+    OUTPUTS,
+    aggregate_arrow,
+    concat_tables,
+    find_arrow,
+    from_ipc,
+    to_ipc,
+)
+from .concurrency import submit
+from .facet import compile_batch
+from .indexes import ensure_indexes
+from .invalidation import MODES, invalidator
+from .keys import cache_key, canonical_projection, canonical_sort, scope_name
+from .materialize import get_view
+from .metrics import instrument, metrics
+from .pagination import (
+    decode_token,
+    encode_token,
+    keyset_filters,
+    keyset_sort,
+    reverse_sort,
+    sort_values,
+    unset,
+)
+from .partition import (
+    UNSUPPORTED,
+    iterate_partitions,
+    partition_bounds,
+    partition_filters,
+    read_partitions,
+)
+from .prefetch import prefetch_queries, run_prefetch, warm_pool
+from .profiler import profiler
+from .raw import document_from_bytes, from_bytes, raw_collection, to_bytes
+from .sketch import sketches
+from .transfer import file_format, insert_batches, read_file, write_file
+from .watch import Watcher, watch
+from .writer import BufferedWriter, get_writer
+
+
+def _iterate(
+    cursor: Union[Cursor, CommandCursor], batch_size: int, batches: bool
+) -> Iterator:
+    """Yield the documents of the cursor, grouped in lists if 'batches' is True,
+    closing it when the iteration stops."""
+    with cursor:
+        if not batches:
+            yield from cursor
+            return
+        while batch := list(islice(cursor, batch_size)):
+            yield batch
+
+
+def _check_output(output: str, one: bool = False):
+    if output not in OUTPUTS:
+        raise ValueError(f"output must be one of {OUTPUTS}")
+    if one:
+        raise ValueError("output can't be used to find a single document")
 
 
 class MongoDBConnection(BaseConnection[MongoClient]):
     def _connect(self, **kwargs) -> MongoClient:
+        url = kwargs.pop("url", None) or self._secrets.get("url")
         db = kwargs.pop("database", None) or self._secrets.get("database")
         coll = kwargs.pop("collection", None) or self._secrets.get("collection")
-        parameters = {**self._secrets.get("kwargs", {}), **kwargs}
-        client = MongoClient(self._secrets.get("url"), **parameters)
+        invalidate = kwargs.pop("invalidate", self._secrets.get("invalidate", MODES[0]))
+        cache = kwargs.pop("cache", {})
+        prefetch = kwargs.pop("prefetch", None) or self._secrets.get("prefetch")
+        indexes = kwargs.pop("indexes", None) or self._secrets.get("indexes")
+        self._profile = kwargs.pop("profile", self._secrets.get("profile", False))
+        self._watch = kwargs.pop("watch", self._secrets.get("watch", False))
+        self._timeout_ms = kwargs.pop("timeout_ms", self._secrets.get("timeout_ms"))
+        if invalidate and invalidate not in MODES:
+            raise ValueError(f"invalidate must be one of {MODES} or False")
+        self._url, self._invalidate_mode = url, invalidate
+        self._cache = ResultCache(**{**self._secrets.get("cache", {}), **cache})
+        options = {**self._secrets.get("kwargs", {}), **kwargs.pop("kwargs", {})}
+        client = get_client(url, **{**options, **kwargs})
+        if self._watch:
+            self._watcher(client[db][coll])
+        if indexes:
+            ensure_indexes(client[db][coll], indexes)
+        # set before __init__ does, so that the prefetch thread can use it
+        self._raw_instance = client[db][coll]
+        if prefetch or client.options.pool_options.min_pool_size:
+            self.prefetch(prefetch, warm_up=True)
         return client[db][coll]
 
+    # collections
+
+    def collection(self, name: str, database: str = None) -> "MongoDBConnection":
+        """Return a connection to another collection of the database (or of the
+        provided one). It shares the client, and so the connection pool, and the
+        settings of this connection."""
+        database = database or self._instance.database.name
+        view = object.__new__(type(self))
+        view.__dict__.update(self.__dict__)
+        view._kwargs = {**self._kwargs, "database": database, "collection": name}
+        view._raw_instance = self._instance.database.client[database][name]
+        if self._watch:
+            view._watcher(view._raw_instance)
+        return view
+
+    def db(self, name: str) -> "MongoDBConnection":
+        """Return a connection to the collection with the same name in another
+        database, sharing the client of this connection. Chain it with 'collection'
+        to access any collection of that database."""
+        return self.collection(self._instance.name, database=name)
+
+    # profiler
+
+    def _sample(self, operation: str, **query):
+        """Explain the read in the background if the connection is profiled."""
+        if self._profile:
+            options = self._profile if isinstance(self._profile, Mapping) else {}
+            profiler.sample(
+                self._instance, self._namespace, operation, query, **options
+            )
+
+    def profile(self) -> List[Dict]:
+        """Return the profiles of the query shapes read on the collection, when the
+        connection is created with profile=True (or with the 'interval' between two
+        explains of a shape and the 'max_ratio' of examined to returned documents).
+        Each shape of find, aggregate and count is explained in the background: the
+        profile lists the plan stages and indexes used, the keys and documents
+        examined, warnings for collection scans, in-memory sorts and high ratios,
+        and a 'suggested_index' following the Equality, Sort, Range rule."""
+        return profiler.report(self._namespace)
+
+    # cache
+
+    def prefetch(
+        self, queries: Union[Dict, List] = None, warm_up: bool = False, wait=False
+    ) -> Thread:
+        """Run the provided reads in a background thread to cache their results, as
+        done with the 'prefetch' reads of the connection right after it is created.
+        Each read is a dictionary with the 'method' to call (e.g. 'find'), optionally
+        the name of another 'collection' of the database, and the method arguments.
+        If 'warm_up' is True, up to minPoolSize pooled connections are opened first.
+        If 'wait' is True, return once every read is done."""
+
+        def read(method: str, collection: str = None, **arguments):
+            connection = self.collection(collection) if collection else self
+            getattr(connection, method)(**arguments)
+
+        queries = prefetch_queries(queries)
+        size = self._instance.database.client.options.pool_options.min_pool_size
+        warm = partial(warm_pool, self._instance.database.client, size)
+        thread = Thread(
+            target=run_prefetch,
+            args=(queries, read, warm if warm_up and size else None),
+            name=f"prefetch-{self._instance.full_name}",
+            daemon=True,
+        )
+        thread.start()
+        if wait:
+            thread.join()
+        return thread
+
+    def cache_stats(self) -> Dict:
+        """Return the hits, misses, evictions, entries and resident bytes of the
+        results cache of the connection, in total and for each read method."""
+        return self._cache.stats()
+
+    def clear_cache(self, method: str = None):
+        """Drop the cached results of the connection collection, or only those of a
+        method. With a shared backend, those cached by the other processes too."""
+        self._cache.clear(method, scope_name(self._namespace))
+
+    # metrics
+
+    def metrics(self, prometheus: bool = False) -> Union[List[Dict], str]:
+        """Return the metrics of the operations on the collection, one per operation
+        and query shape: calls, errors, cache hits and misses, documents fetched from
+        the server, bytes of the cached results served, and the latency histograms of
+        the calls and of their server commands. If 'prometheus' is True they are
+        exported in the Prometheus text format instead."""
+        if prometheus:
+            return metrics.prometheus(self._namespace)
+        return metrics.snapshot(self._namespace)
+
+    def reset_metrics(self):
+        """Drop the metrics of the operations on the collection."""
+        metrics.reset(self._namespace)
+
+    def _watcher(self, collection: Collection = None) -> Watcher:
+        """Process-wide change stream invalidating the cached reads of the collection."""
+        collection = collection or self._instance
+        mode = self._invalidate_mode or MODES[0]
+        return watch(collection, (self._url, collection.full_name), mode)
+
+    def subscribe(self):
+        """Rerun the current session whenever the collection changes, e.g. to keep a
+        page live without polling. Requires the connection to be created with
+        watch=True."""
+        if not self._watch:
+            raise ValueError("subscribe requires a connection with watch=True")
+        if ctx := get_script_run_ctx():
+            self._watcher().sessions.add(ctx.session_id)
+
+    def _key(self, method: str, filters: Dict = None, /, **query) -> str:
+        """Canonical cache key of a read, including the write version of the filters
+        selecting the documents it depends on."""
+        version = self._version(filters)
+        return cache_key(self._namespace, method, version=version, **query)
+
+    def _cached(
+        self,
+        method: str,
+        key: str,
+        ttl: int,
+        compute: Callable,
+        stale_ttl: int = None,
+        timeout_ms: int = None,
+    ):
+        """Return the cached result of a read, or run it within its time budget (the
+        connection default if None, no budget if 0). If the budget is spent, the
+        last result cached for the read is returned instead, if it expired less than
+        the cache 'fallback_ttl' ago, and 'stale' is True."""
+        timeout_ms = self._timeout_ms if timeout_ms is None else timeout_ms
+        if not timeout_ms:
+            return self._cache.get(method, key, ttl, compute, stale_ttl)
+        compute = within(timeout_ms, compute)
+        return self._cache.get(method, key, ttl, compute, stale_ttl, is_timeout)
+
+    @property
+    def stale(self) -> bool:
+        """Whether the last cached read of the session returned a stale result: an
+        expired one (see 'stale_ttl') or, after running out of time, the last one
+        cached (see 'timeout_ms')."""
+        return self._cache.stale
+
+    @property
+    def _namespace(self) -> Tuple[str, str]:
+        return self._url, self._instance.full_name
+
+    def _version(self, filters: Dict = None) -> Tuple[int, int]:
+        """Version of the cached reads with the provided filters, bumped by writes.
+        With a cache shared by several processes, every write bumps the version of
+        all the reads of the collection."""
+        if self._cache.shared:
+            return self._cache.generation(self._namespace), 0
+        return invalidator.version(self._namespace, filters)
+
+    def _invalidate(self, **write):
+        """Mark the cached reads affected by a write on the collection as stale, all
+        of them if the write is not described."""
+        mode = self._invalidate_mode
+        if mode and not write:
+            mode = MODES[0]
+        invalidator.invalidate(self._namespace, mode, **write)
+
     # find
 
+    @instrument("filters")
     def find(
         self,
         filters: dict = None,
         one: bool = False,
         mongo_id: bool = False,
         ttl: int = 3600,
-        **kwargs
-    ) -> Union[List, Dict]:
+        output: str = None,
+        schema: Union[Dict, pa.Schema] = None,
+        stale_ttl: int = None,
+        raw: bool = False,
+        timeout_ms: int = None,
+        **kwargs,
+    ) -> Union[List, Dict, pa.Table, pd.DataFrame]:
         """Find documents in the MongoDB collection that match the provided filters.
         If 'one' is True, only the first match will be returned.
-        If 'mongo_id' is False, the Mongo ID will be excluded from the results."""
+        If 'mongo_id' is False, the Mongo ID will be excluded from the results.
+        If 'output' is 'arrow', 'pandas' or 'numpy' the documents are returned as an
+        Arrow table, a DataFrame or a dictionary of arrays, with the provided
+        'schema' or an inferred one, and cached as an Arrow IPC buffer.
+        Once the 'ttl' is over, the expired result is still returned for up to
+        'stale_ttl' seconds while a single background query refreshes it.
+        If 'raw' is True the documents are returned as RawBSONDocuments, decoded
+        only when a field is accessed, and cached as their BSON bytes.
+        The query must complete within 'timeout_ms' milliseconds (the connection
+        'timeout_ms' if None, no limit if 0), on the server (maxTimeMS) and on the
+        client: otherwise the last cached result is returned, however old, or the
+        timeout error is raised if there is none."""
 
-        @cache_data(ttl=ttl)
-        def _find(filters: dict, one: bool, **kwargs):
-            mongo_id_proj = {"_id": 0} if not mongo_id else {}
-            kwargs["projection"] = kwargs.get("projection", {}) | mongo_id_proj
+        def _find():
             if one:
-                return self._instance.find_one(filters or {}, **kwargs)
-            return list(self._instance.find(filters or {}, **kwargs))
+                return self._instance.find_one(filters, **kwargs)
+            return list(self._instance.find(filters, **kwargs))
 
-        return _find(filters, one, **kwargs)
+        def _find_raw():
+            collection = raw_collection(self._instance)
+            if one:
+                document = collection.find_one(filters, **kwargs)
+                return document.raw if document is not None else None
+            return to_bytes(collection.find(filters, **kwargs))
+
+        def _find_columnar():
+            return to_ipc(find_arrow(self._instance, filters, **kwargs))
+
+        filters = filters or {}
+        kwargs = self._find_options(mongo_id, **kwargs)
+        limit = 1 if one else kwargs.get("limit")
+        sort, skip = kwargs.get("sort"), kwargs.get("skip")
+        self._sample("find", filters=filters, sort=sort, limit=limit, skip=skip)
+        if output is not None:
+            _check_output(output, one)
+            if raw:
+                raise ValueError("output and raw can't be used together")
+            kwargs["schema"] = schema
+            key = self._key("find", filters, filters=filters, columnar=True, **kwargs)
+            buffer = self._cached(
+                "find", key, ttl, _find_columnar, stale_ttl, timeout_ms
+            )
+            return from_ipc(buffer, output)
+        if raw:
+            key = self._key("find", filters, filters=filters, one=one, raw=1, **kwargs)
+            buffer = self._cached("find", key, ttl, _find_raw, stale_ttl, timeout_ms)
+            return document_from_bytes(buffer) if one else from_bytes(buffer)
+        key = self._key("find", filters, filters=filters, one=one, **kwargs)
+        return self._cached("find", key, ttl, _find, stale_ttl, timeout_ms)
 
+    @instrument("filters")
     def find_one(
         self, filters: dict = None, mongo_id: bool = False, ttl: int = 3600, **kwargs
     ) -> Dict:
@@ -45,50 +349,455 @@ class MongoDBConnection(BaseConnection[MongoClient]):
         the results."""
         return self.find(filters, one=True, mongo_id=mongo_id, ttl=ttl, **kwargs)
 
+    def find_iter(
+        self,
+        filters: dict = None,
+        mongo_id: bool = False,
+        batch_size: int = 1000,
+        batches: bool = False,
+        timeout_ms: int = None,
+        **kwargs,
+    ) -> Iterator[Union[Dict, List[Dict]]]:
+        """Iterate over the documents in the MongoDB collection that match the
+        provided filters, without caching them. Documents are fetched 'batch_size' at
+        a time, so at most one batch is held in memory. If 'batches' is True, lists
+        of up to 'batch_size' documents are yielded instead of single documents.
+        The query must complete within 'timeout_ms' milliseconds of server time (the
+        connection 'timeout_ms' if None, no limit if 0): having no cached result to
+        fall back on, the iteration raises ExecutionTimeout once it is spent."""
+        kwargs = self._find_options(mongo_id, **kwargs)
+        if timeout_ms := self._timeout_ms if timeout_ms is None else timeout_ms:
+            kwargs["max_time_ms"] = timeout_ms
+        cursor = self._instance.find(filters or {}, batch_size=batch_size, **kwargs)
+        return _iterate(cursor, batch_size, batches)
+
+    @instrument("filters")
+    def find_incremental(
+        self,
+        filters: Dict = None,
+        watermark_field: str = "timestamp",
+        window: int = 500,
+        mongo_id: bool = False,
+        ttl: int = 3600,
+        timeout_ms: int = None,
+        **kwargs,
+    ) -> List[Dict]:
+        """Find the 'window' newest documents (by 'watermark_field', descending) in
+        an append-only MongoDB collection that match the provided filters. Once the
+        'ttl' is over, only the documents from the highest 'watermark_field' value
+        already fetched are read and merged into the cached window, so a refresh
+        costs as many documents as were added. Updates and deletions of documents in
+        the window are not seen: 'clear_cache("find_incremental")' rebuilds it.
+        'timeout_ms' works as in 'find'."""
+
+        def _refresh():
+            found, documents = self._cache.lookup("find_incremental", window_key)
+            if found and documents:
+                mark = documents[0].get(watermark_field)
+                seen = {
+                    document["_id"]
+                    for document in documents
+                    if document.get(watermark_field) == mark
+                }
+                newer = {"$and": [filters, {watermark_field: {"$gte": mark}}]}
+                added = [
+                    document
+                    for document in self._instance.find(newer, limit=window, **kwargs)
+                    if document["_id"] not in seen
+                ]
+                documents = (added + documents)[:window]
+            else:
+                documents = list(self._instance.find(filters, limit=window, **kwargs))
+            self._cache.put("find_incremental", window_key, documents, None)
+            return documents
+
+        filters = filters or {}
+        kwargs = self._find_options(True, **kwargs)
+        if any(kwargs["projection"].values()):
+            kwargs["projection"][watermark_field] = 1
+        kwargs["sort"] = [(watermark_field, -1), ("_id", -1)]
+        query = {"filters": filters, "field": watermark_field, "window": window}
+        # the window survives writes: they are picked up by the next refresh
+        window_key = cache_key(self._namespace, "find_incremental", **query, **kwargs)
+        key = self._key("find_incremental", filters, **query, **kwargs)
+        documents = self._cached(
+            "find_incremental", key, ttl, _refresh, timeout_ms=timeout_ms
+        )
+        if not mongo_id:
+            for document in documents:
+                document.pop("_id", None)
+        return documents
+
+    # partitioned reads
+
+    def _partitions(
+        self, filters: Dict, partitions: int, field: str, sample: int, ttl: int
+    ) -> List[Dict]:
+        """Return the filters of the partitions of the read, their bounds being
+        cached for 'ttl' seconds."""
+
+        def _bounds():
+            return partition_bounds(self._instance, filters, partitions, field, sample)
+
+        query = {"partitions": partitions, "field": field, "sample": sample}
+        key = self._key("partitions", filters, filters=filters, **query)
+        bounds = self._cache.get("partitions", key, ttl, _bounds)
+        return partition_filters(filters, bounds, field)
+
+    @staticmethod
+    def _check_partitioned(**kwargs):
+        if unsupported := [option for option in UNSUPPORTED if kwargs.get(option)]:
+            raise ValueError(
+                f"partitioned reads don't support {', '.join(unsupported)}"
+            )
+
+    @instrument("filters")
+    def parallel_find(
+        self,
+        filters: Dict = None,
+        partitions: int = 4,
+        field: str = "_id",
+        sample: int = None,
+        mongo_id: bool = False,
+        ttl: int = 3600,
+        output: str = None,
+        schema: Union[Dict, pa.Schema] = None,
+        timeout_ms: int = None,
+        **kwargs,
+    ) -> Union[List, pa.Table, pd.DataFrame]:
+        """Find documents in the MongoDB collection that match the provided filters
+        like 'find', splitting the values of 'field' (an indexed one) into up to
+        'partitions' ranges of about as many documents with a $bucketAuto
+        aggregation (over a random 'sample' of the documents if provided), and
+        reading the ranges concurrently on as many pooled connections. The documents
+        (or the 'output' table) are merged in the order of the ranges. Sort, skip and
+        limit are not supported. 'timeout_ms' works as in 'find'."""
+
+        def _find(partition: Dict) -> List[Dict]:
+            return list(self._instance.find(partition, **kwargs))
+
+        def _find_columnar(partition: Dict) -> pa.Table:
+            return find_arrow(self._instance, partition, **kwargs)
+
+        def _parallel_find():
+            ranges = self._partitions(filters, partitions, field, sample, ttl)
+            if output is None:
+                return list(chain.from_iterable(read_partitions(_find, ranges)))
+            tables = read_partitions(_find_columnar, ranges)
+            return to_ipc(concat_tables(tables))
+
+        self._check_partitioned(**kwargs)
+        filters = filters or {}
+        kwargs = self._find_options(mongo_id, **kwargs)
+        if output is not None:
+            _check_output(output)
+            kwargs["schema"] = schema
+        query = {"partitions": partitions, "field": field, "columnar": bool(output)}
+        key = self._key("parallel_find", filters, filters=filters, **query, **kwargs)
+        result = self._cached(
+            "parallel_find", key, ttl, _parallel_find, timeout_ms=timeout_ms
+        )
+        return from_ipc(result, output) if output is not None else result
+
+    def parallel_find_iter(
+        self,
+        filters: Dict = None,
+        partitions: int = 4,
+        field: str = "_id",
+        sample: int = None,
+        mongo_id: bool = False,
+        batch_size: int = 1000,
+        batches: bool = False,
+        ttl: int = 3600,
+        **kwargs,
+    ) -> Iterator[Union[Dict, List[Dict]]]:
+        """Iterate over the documents in the MongoDB collection that match the
+        provided filters like 'find_iter', reading the partitions of 'parallel_find'
+        concurrently (their bounds are cached for 'ttl' seconds). Documents are
+        yielded in the order they arrive, at most two batches of 'batch_size'
+        documents per partition being held in memory."""
+
+        def _read(partition: Dict) -> Iterator[List[Dict]]:
+            cursor = self._instance.find(partition, batch_size=batch_size, **kwargs)
+            yield from _iterate(cursor, batch_size, True)
+
+        self._check_partitioned(**kwargs)
+        filters = filters or {}
+        kwargs = self._find_options(mongo_id, **kwargs)
+        ranges = self._partitions(filters, partitions, field, sample, ttl)
+        documents = iterate_partitions(_read, ranges)
+        return documents if batches else chain.from_iterable(documents)
+
+    def _find_options(self, mongo_id: bool, **kwargs) -> Dict:
+        """Normalize the projection, excluding the Mongo ID if 'mongo_id' is False,
+        and the sort of a find."""
+        mongo_id_proj = {"_id": 0} if not mongo_id else {}
+        kwargs["projection"] = canonical_projection(kwargs.get("projection"))
+        kwargs["projection"] |= mongo_id_proj
+        if kwargs.get("sort"):
+            kwargs["sort"] = canonical_sort(kwargs["sort"])
+        return kwargs
+
+    # pagination
+
+    @instrument("filters")
+    def paginate(
+        self,
+        filters: Dict = None,
+        sort: Union[str, List, Dict] = None,
+        page_size: int = 50,
+        after: str = None,
+        before: str = None,
+        mongo_id: bool = False,
+        ttl: int = 3600,
+        **kwargs,
+    ) -> Dict:
+        """Return a page of 'page_size' documents in the MongoDB collection that
+        match the provided filters, following the provided sort (completed with the
+        Mongo ID). Pages are selected with range predicates on the sort keys instead
+        of 'skip': pass the 'next' (or 'previous') token of a page as 'after' (or
+        'before') to get the following (or preceding) one. Each page is cached."""
+        sort = keyset_sort(sort)
+        query_sort = reverse_sort(sort) if before else sort
+        query_filters = filters or {}
+        if after or before:
+            boundary = keyset_filters(query_sort, decode_token(after or before))
+            query_filters = {"$and": [query_filters, boundary]}
+        projection = canonical_projection(kwargs.pop("projection", None))
+        projection.pop("_id", None)
+        # the sort keys are read for the tokens, then removed if not requested
+        keys = [field for field, _ in sort if field != "_id"]
+        if any(projection.values()):
+            hidden = [field for field in keys if field not in projection]
+            projection |= dict.fromkeys(hidden, 1)
+        else:
+            hidden = [field for field in keys if field in projection]
+            projection = {k: v for k, v in projection.items() if k not in hidden}
+        documents = self.find(
+            query_filters,
+            mongo_id=True,
+            ttl=ttl,
+            sort=query_sort,
+            limit=page_size + 1,
+            projection=projection,
+            **kwargs,
+        )
+        more, documents = len(documents) > page_size, documents[:page_size]
+        if before:
+            documents.reverse()
+        tokens = [encode_token(sort_values(doc, sort)) for doc in documents]
+        has_next, has_previous = (True, more) if before else (more, bool(after))
+        hidden += [] if mongo_id else ["_id"]
+        for document in documents:
+            for field in hidden:
+                unset(document, field)
+        return {
+            "documents": documents,
+            "next": tokens[-1] if tokens and has_next else None,
+            "previous": tokens[0] if tokens and has_previous else None,
+        }
+
+    # batch
+
+    @instrument("reads")
+    def batch(self, reads: Dict[str, Dict], ttl: int = 3600, **kwargs) -> Dict:
+        """Run several named reads on the MongoDB collection in a single $facet
+        aggregation, cached as a whole, and return their named results. Each read is
+        a dictionary defining one operation among
+        - {"count": filters}
+        - {"distinct": field, "filters": filters} (null values are left out)
+        - {"find": filters, "sort": ..., "skip": ..., "limit": ..., "projection": ...,
+          "mongo_id": False}
+        - {"aggregate": pipeline}
+        All the results must fit in a single 16MB document."""
+        pipeline, decoders = compile_batch(reads)
+        results = self.aggregate(pipeline, ttl=ttl, **kwargs)[0]
+        return {name: decode(results[name]) for name, decode in decoders.items()}
+
+    # concurrency
+
+    def gather(self, *calls: Callable, **named_calls: Callable) -> Union[List, Dict]:
+        """Run the provided calls (e.g. 'functools.partial(conn.count, filters)')
+        concurrently in worker threads and return their results, as a list for the
+        positional calls or as a dictionary for the named ones. Independent reads
+        then cost as much as the slowest of them instead of their sum."""
+        if calls and named_calls:
+            raise ValueError("gather takes either positional or named calls")
+        calls = named_calls or dict(enumerate(calls))
+        futures = {name: submit(call) for name, call in calls.items()}
+        results = {name: future.result() for name, future in futures.items()}
+        return results if named_calls else list(results.values())
+
+    async def afind(self, *args, **kwargs) -> Union[List, Dict]:
+        """Awaitable 'find', running in a worker thread and sharing its cache."""
+        return await wrap_future(submit(self.find, *args, **kwargs))
+
+    async def afind_one(self, *args, **kwargs) -> Dict:
+        """Awaitable 'find_one', running in a worker thread and sharing its cache."""
+        return await wrap_future(submit(self.find_one, *args, **kwargs))
+
+    async def aaggregate(self, *args, **kwargs) -> List:
+        """Awaitable 'aggregate', running in a worker thread and sharing its cache."""
+        return await wrap_future(submit(self.aggregate, *args, **kwargs))
+
+    async def acount(self, *args, **kwargs) -> int:
+        """Awaitable 'count', running in a worker thread and sharing its cache."""
+        return await wrap_future(submit(self.count, *args, **kwargs))
+
+    async def adistinct(self, *args, **kwargs) -> List:
+        """Awaitable 'distinct', running in a worker thread and sharing its cache."""
+        return await wrap_future(submit(self.distinct, *args, **kwargs))
+
     # insert
 
-    def insert(self, data: Union[List, Dict], ttl: int = 0, **kwargs) -> Dict:
+    @instrument()
+    def insert(
+        self, data: Union[List, Dict], ttl: int = 0, buffered: bool = False, **kwargs
+    ) -> Dict:
         """Insert the provided data into the MongoDB collection.
-        The data can be a single document (Dict) or multiple documents (List)."""
-
-        @cache_data(ttl=ttl)
-        def _insert_many(data: List, **kwargs):
+        The data can be a single document (Dict) or multiple documents (List).
+        Writes are never cached, 'ttl' is only kept for compatibility.
+        If 'buffered' is True the documents are handed to the buffered writer of the
+        collection (see 'writer') and the futures of their insertion are returned
+        with their IDs, without waiting for the server."""
+        if buffered:
+            buffer = self.writer()
+            if isinstance(data, Dict):
+                future = buffer.add(data)
+                return {"inserted_id": data["_id"], "future": future}
+            futures = [buffer.add(document) for document in data]
+            return {
+                "inserted_ids": [document["_id"] for document in data],
+                "futures": futures,
+            }
+        # invalidate even if the write fails, it might be partially applied
+        if isinstance(data, Dict):
+            try:
+                response = self._instance.insert_one(data, **kwargs)
+            finally:
+                self._invalidate(documents=[data])
+            return {"inserted_id": response.inserted_id}
+        try:
             response = self._instance.insert_many(data, **kwargs)
-            return {"inserted_ids": response.inserted_ids}
+        finally:
+            self._invalidate(documents=data)
+        return {"inserted_ids": response.inserted_ids}
 
-        @cache_data(ttl=ttl)
-        def _insert_one(data: Dict, **kwargs):
-            response = self._instance.insert_one(data, **kwargs)
-            return {"inserted_id": response.inserted_id}
+    def writer(self, **options) -> BufferedWriter:
+        """Return the process-wide buffered writer of the collection, inserting the
+        documents added by every session together with insert_many, on a background
+        thread, once 'max_documents' (1000) or 'max_bytes' (8MB) are buffered or
+        'interval' (0.5) seconds after the first one. 'add(document)' returns the
+        future of the insertion, 'flush()' inserts the buffer now. The options
+        default to the 'writer' section of the secrets."""
+        options = {**self._secrets.get("writer", {}), **options}
 
-        if isinstance(data, Dict):
-            return _insert_one(data, **kwargs)
-        return _insert_many(data, **kwargs)
+        def invalidate(documents: List[Dict]):
+            self._invalidate(documents=documents)
+
+        return get_writer(
+            self._instance, self._namespace, on_flush=invalidate, **options
+        )
+
+    # files
+
+    @instrument("filters")
+    def export(
+        self,
+        path: str,
+        filters: Dict = None,
+        format: str = None,
+        mongo_id: bool = True,
+        batch_size: int = 1000,
+        partitions: int = 1,
+        schema: Union[Dict, pa.Schema] = None,
+        progress: Callable[[int, Optional[float]], None] = None,
+        **kwargs,
+    ) -> Dict:
+        """Write the documents in the MongoDB collection that match the provided
+        filters to a file, without caching them: 'format' is 'jsonl' (Extended
+        JSON lines), 'parquet' (with the provided 'schema' or the one merged from
+        the first 10,000 documents, Mongo IDs as strings: a later document with
+        other fields or types fails the export, pass a 'schema' for collections
+        whose documents vary) or 'bson' (as dumped by mongodump, documents are not
+        decoded), inferred from the extension if not provided. Documents
+        are read 'batch_size' at a time in a background thread while the previous
+        batch is written, or from 'partitions' concurrent ranges (see
+        'parallel_find'), so memory use doesn't depend on the collection size.
+        After every batch 'progress' is called with the documents written and their
+        fraction of the matching ones."""
+        format = file_format(path, format)
+        collection = self._instance
+        if format == "bson":
+            collection = raw_collection(self._instance)
+
+        def _read(partition: Dict) -> Iterator[List[Dict]]:
+            cursor = collection.find(partition, batch_size=batch_size, **kwargs)
+            yield from _iterate(cursor, batch_size, True)
+
+        filters = filters or {}
+        kwargs = self._find_options(mongo_id, **kwargs)
+        total = None
+        if progress:
+            if filters:
+                total = self._instance.count_documents(filters)
+            else:
+                total = self._instance.estimated_document_count()
+        ranges = [filters]
+        if partitions > 1:
+            self._check_partitioned(**kwargs)
+            ranges = self._partitions(filters, partitions, "_id", None, 0)
+        batches = iterate_partitions(_read, ranges)
+        exported = write_file(path, batches, format, schema, progress, total)
+        return {"exported": exported, "path": path}
+
+    @instrument()
+    def import_file(
+        self,
+        path: str,
+        format: str = None,
+        batch_size: int = 1000,
+        workers: int = 4,
+        progress: Callable[[int, float], None] = None,
+    ) -> Dict:
+        """Insert the documents of a 'jsonl', 'parquet' or 'bson' file (see
+        'export') into the MongoDB collection. The file is read 'batch_size'
+        documents at a time while the previous batches are inserted by 'workers'
+        threads with unordered insert_many calls, so memory use doesn't depend on
+        the file size. Write errors (e.g. duplicate keys) don't stop the import:
+        the number of documents 'inserted' and 'failed' are returned, with the
+        first 'errors'. After every insert 'progress' is called with the documents
+        inserted and the fraction of the file read."""
+        batches = read_file(path, file_format(path, format), batch_size)
+        try:
+            return insert_batches(self._instance, batches, workers, progress)
+        finally:
+            self._invalidate()
 
     # update
 
+    @instrument("filters")
     def update(
         self, filters: Dict, data: Dict, one: bool = False, ttl: int = 0, **kwargs
     ) -> Dict:
         """Update the documents in the MongoDB collection that match the provided
         filters with the provided data. If 'one' is True, only the first matching
         document will be updated."""
-
-        @cache_data(ttl=ttl)
-        def _update(filters: Dict, data: Dict, one: bool, **kwargs):
+        try:
             response = (
                 self._instance.update_one(filters, data, **kwargs)
                 if one
                 else self._instance.update_many(filters, data, **kwargs)
             )
-            return {
-                "matched_count": response.matched_count,
-                "modified_count": response.modified_count,
-                "upserted_id": response.upserted_id,
-            }
-
-        return _update(filters, data, one, **kwargs)
+        finally:
+            self._invalidate(filters=filters or {}, update=data)
+        return {
+            "matched_count": response.matched_count,
+            "modified_count": response.modified_count,
+            "upserted_id": response.upserted_id,
+        }
 
+    @instrument("filters")
     def update_one(self, filters: Dict, data: Dict, ttl: int = 0, **kwargs) -> Dict:
         """Update a single document in the MongoDB collection that matches the provided
         filters with the provided data."""
@@ -96,73 +805,285 @@ class MongoDBConnection(BaseConnection[MongoClient]):
 
     # delete
 
+    @instrument("filters")
     def delete(self, filters: Dict, one: bool = False, ttl: int = 0, **kwargs) -> Dict:
         """Delete documents in the MongoDB collection that match the provided filters.
         If 'one' is True, only the first matching document will be deleted."""
-
-        @cache_data(ttl=ttl)
-        def _delete(filters: Dict, one: bool, **kwargs):
+        try:
             response = (
                 self._instance.delete_one(filters, **kwargs)
                 if one
                 else self._instance.delete_many(filters, **kwargs)
             )
-            return {"deleted_count": response.deleted_count}
-
-        return _delete(filters, one, **kwargs)
+        finally:
+            self._invalidate(filters=filters or {})
+        return {"deleted_count": response.deleted_count}
 
+    @instrument("filters")
     def delete_one(self, filters: Dict, ttl: int = 0, **kwargs) -> Dict:
         """Delete a single document in the MongoDB collection that matches the
         provided filters."""
         return self.delete(filters, one=True, ttl=ttl, **kwargs)
 
+    # bulk
+
+    @instrument()
+    def bulk_write(self, requests: Iterable, ordered: bool = True, **kwargs) -> Dict:
+        """Execute the provided write requests (InsertOne, UpdateOne, DeleteMany...
+        from pymongo) in chunks fitting the server maxWriteBatchSize and BSON size
+        limits, and return the counts aggregated over all the chunks. 'requests' can
+        be any iterable (e.g. a generator) and is consumed one chunk at a time.
+        If 'ordered' is False, the chunks after a failed one are still executed and
+        a single BulkWriteError is raised at the end."""
+        max_count, max_bytes = get_write_limits(self._instance.database.client)
+        result, offset = BulkResult(), 0
+        try:
+            for chunk in chunks(requests, max_count, max_bytes):
+                try:
+                    response = self._instance.bulk_write(
+                        chunk, ordered=ordered, **kwargs
+                    )
+                    result.add(response.bulk_api_result, offset)
+                except BulkWriteError as error:
+                    result.add(error.details, offset)
+                    if ordered:
+                        break
+                offset += len(chunk)
+        finally:
+            self._invalidate()
+        result.raise_errors()
+        return result.to_dict()
+
+    @instrument()
+    def upsert_many(
+        self, documents: Iterable[Dict], keys: Iterable[str] = ("_id",), **kwargs
+    ) -> Dict:
+        """Replace the documents in the MongoDB collection matching the provided
+        documents on the 'keys' fields, inserting the ones not found. Unless told
+        otherwise the writes are unordered, see 'bulk_write'. Documents without
+        an _id get one (as insert_one would), a document missing another key
+        raises a ValueError (the requests before it are written)."""
+        keys = list(keys)
+        kwargs.setdefault("ordered", False)
+
+        def _request(doc: Dict) -> ReplaceOne:
+            # a null _id would match the previous new document and replace it
+            doc.setdefault("_id", ObjectId())
+            if missing := [key for key in keys if key not in doc]:
+                raise ValueError(f"document {doc['_id']} misses the keys {missing}")
+            return ReplaceOne({key: doc[key] for key in keys}, doc, upsert=True)
+
+        return self.bulk_write(map(_request, documents), **kwargs)
+
     # extra
 
+    @instrument("filters")
     def replace(
         self, filters: Dict = None, replacement: Dict = None, ttl: int = 0, **kwargs
     ) -> Dict:
         """Replace a single document in the MongoDB collection that matches the
         provided filters with the provided replacement."""
-
-        @cache_data(ttl=ttl)
-        def _replace(filters: Dict, replacement: Dict, **kwargs):
+        try:
             response = self._instance.replace_one(filters or {}, replacement, **kwargs)
-            return {
-                "matched_count": response.matched_count,
-                "modified_count": response.modified_count,
-                "upserted_id": response.upserted_id,
-            }
+        finally:
+            self._invalidate(filters=filters or {}, update=replacement)
+        return {
+            "matched_count": response.matched_count,
+            "modified_count": response.modified_count,
+            "upserted_id": response.upserted_id,
+        }
 
-        return _replace(filters, replacement, **kwargs)
-
-    def aggregate(self, pipeline: Dict, ttl: int = 3600, **kwargs) -> List:
+    @instrument("pipeline")
+    def aggregate(
+        self,
+        pipeline: Dict,
+        ttl: int = 3600,
+        output: str = None,
+        schema: Union[Dict, pa.Schema] = None,
+        stale_ttl: int = None,
+        timeout_ms: int = None,
+        **kwargs,
+    ) -> Union[List, pa.Table, pd.DataFrame, Dict]:
         """Aggregate the data in the MongoDB collection using the provided
-        aggregation pipeline."""
+        aggregation pipeline. 'output', 'schema', 'stale_ttl' and 'timeout_ms' work
+        as in 'find'."""
+
+        def _aggregate():
+            return list(self._instance.aggregate(pipeline, **kwargs))
 
-        @cache_data(ttl=ttl)
-        def _aggregate(pipeline: Dict, **kwargs):
-            return list(self._instance.aggregate(pipeline or {}, **kwargs))
+        def _aggregate_columnar():
+            return to_ipc(aggregate_arrow(self._instance, pipeline, **kwargs))
 
-        return _aggregate(pipeline, **kwargs)
+        pipeline = pipeline or []
+        self._sample("aggregate", pipeline=pipeline)
+        # only documents passing a leading $match can affect the result
+        match = (pipeline or [{}])[0].get("$match")
+        if output is not None:
+            _check_output(output)
+            kwargs["schema"] = schema
+            key = self._key(
+                "aggregate", match, pipeline=pipeline, columnar=True, **kwargs
+            )
+            buffer = self._cached(
+                "aggregate", key, ttl, _aggregate_columnar, stale_ttl, timeout_ms
+            )
+            return from_ipc(buffer, output)
+        key = self._key("aggregate", match, pipeline=pipeline, **kwargs)
+        return self._cached("aggregate", key, ttl, _aggregate, stale_ttl, timeout_ms)
 
-    def count(self, filters: Dict = None, ttl: int = 3600, **kwargs) -> int:
+    def aggregate_iter(
+        self,
+        pipeline: Dict,
+        batch_size: int = 1000,
+        batches: bool = False,
+        timeout_ms: int = None,
+        **kwargs,
+    ) -> Iterator[Union[Dict, List[Dict]]]:
+        """Iterate over the results of the provided aggregation pipeline without
+        caching them, fetching 'batch_size' documents at a time. 'timeout_ms' works
+        as in 'find_iter'."""
+        if timeout_ms := self._timeout_ms if timeout_ms is None else timeout_ms:
+            kwargs["maxTimeMS"] = timeout_ms
+        cursor = self._instance.aggregate(pipeline, batchSize=batch_size, **kwargs)
+        return _iterate(cursor, batch_size, batches)
+
+    @instrument("pipeline")
+    def materialize(
+        self,
+        name: str,
+        pipeline: List[Dict],
+        refresh: str = "interval",
+        interval: int = 300,
+        watermark_field: str = "timestamp",
+        filters: Dict = None,
+        ttl: int = 60,
+        overlap: float = 60,
+        timeout_ms: int = None,
+    ) -> List[Dict]:
+        """Persist the results of the aggregation pipeline in the 'name' collection
+        of the database with $merge, and return the ones matching the provided
+        filters: once materialized, a read costs a lookup of the summary documents
+        however large the collection grows. The results are refreshed
+        - 'interval': every 'interval' seconds, in the background;
+        - 'on_write': on the first read after a write through the connection;
+        - 'incremental': on every read, aggregating only the documents with a
+          'watermark_field' value above the last one processed (the pipeline must
+          end with a $group whose accumulators are $sum, $count, $min, $max,
+          $addToSet, $push, $first or $last), for append-only collections.
+          Documents inserted late, with a value up to 'overlap' seconds below the
+          last one processed, are aggregated too (once).
+        The summary read is cached for 'ttl' seconds, 'timeout_ms' works as in
+        'find' for it: the refresh itself is not bounded, an aggregation stopped
+        midway would leave the results partially merged."""
+        view = get_view(
+            self._instance,
+            self._namespace,
+            name,
+            pipeline,
+            refresh=refresh,
+            interval=interval,
+            watermark_field=watermark_field,
+            overlap=overlap,
+        )
+
+        timeout_ms = self._timeout_ms if timeout_ms is None else timeout_ms
+        read = partial(view.read, filters)
+        if timeout_ms:
+            read = within(timeout_ms, read)
+
+        def _materialize():
+            view.update()
+            return read()
+
+        query = {"name": name, "pipeline": view.pipeline, "filters": filters}
+        key = self._key("materialize", None, refresh=refresh, **query)
+        fallback = is_timeout if timeout_ms else None
+        return self._cache.get("materialize", key, ttl, _materialize, None, fallback)
+
+    @instrument("filters")
+    def count(
+        self,
+        filters: Dict = None,
+        ttl: int = 3600,
+        estimated: bool = False,
+        stale_ttl: int = None,
+        timeout_ms: int = None,
+        **kwargs,
+    ) -> int:
         """Count the number of documents in the MongoDB collection that match the
-        provided filters."""
+        provided filters. If 'estimated' is True and there are no filters, the count
+        comes from the collection metadata instead of a collection scan.
+        'stale_ttl' and 'timeout_ms' work as in 'find'."""
 
-        @cache_data(ttl=ttl)
-        def _count(filters: Dict, **kwargs):
-            return self._instance.count_documents(filters or {}, **kwargs)
+        def _count():
+            if estimated:
+                return self._instance.estimated_document_count(**kwargs)
+            return self._instance.count_documents(filters, **kwargs)
 
-        return _count(filters, **kwargs)
+        filters = filters or {}
+        estimated = estimated and not filters
+        if not estimated:
+            self._sample("count", filters=filters)
+        key = self._key(
+            "count", filters, filters=filters, estimated=estimated, **kwargs
+        )
+        return self._cached("count", key, ttl, _count, stale_ttl, timeout_ms)
 
+    @instrument("filters")
     def distinct(
-        self, field: str, filters: Dict = None, ttl: int = 3600, **kwargs
+        self,
+        field: str,
+        filters: Dict = None,
+        ttl: int = 3600,
+        stale_ttl: int = None,
+        timeout_ms: int = None,
+        **kwargs,
     ) -> List:
         """Find the distinct values for a specified field across a single collection
-        and returns the results in an array."""
+        and returns the results in an array. 'stale_ttl' and 'timeout_ms' work as in
+        'find'."""
 
-        @cache_data(ttl=ttl)
-        def _distinct(filters: Dict, **kwargs):
-            return self._instance.distinct(field, filters or {}, **kwargs)
+        def _distinct():
+            return self._instance.distinct(field, filters, **kwargs)
 
-        return _distinct(filters, **kwargs)
+        filters = filters or {}
+        key = self._key("distinct", filters, field=field, filters=filters, **kwargs)
+        return self._cached("distinct", key, ttl, _distinct, stale_ttl, timeout_ms)
+
+    @instrument("filters")
+    def distinct_count(
+        self,
+        field: str,
+        filters: Dict = None,
+        approximate: bool = False,
+        ttl: int = 3600,
+        stale_ttl: int = None,
+        timeout_ms: int = None,
+        **kwargs,
+    ) -> int:
+        """Count the distinct values (null excluded) for a specified field across a
+        single collection, computed by the server so that only the count is
+        transferred. If 'approximate' is True, the count is estimated by a
+        HyperLogLog sketch (about 0.8% error) built once from the field values and
+        then kept up to date with the documents inserted through the connection,
+        rebuilt after other writes that might change the values. Unless the
+        connection watches the writes of other clients (watch=True), the sketch is
+        also rebuilt once older than 'ttl'. 'ttl', 'stale_ttl' and 'timeout_ms' work
+        as in 'find' for the exact count."""
+        filters = filters or {}
+        if approximate:
+            documents = partial(
+                self.find_iter, filters, projection={field: 1}, **kwargs
+            )
+            max_age = None if self._watch else ttl_seconds(ttl)
+            return sketches.count(self._namespace, field, filters, documents, max_age)
+        pipeline = [{"$match": filters}] if filters else []
+        pipeline += [
+            {"$unwind": f"${field}"},
+            {"$group": {"_id": f"${field}"}},
+            {"$count": "count"},
+        ]
+        result = self.aggregate(
+            pipeline, ttl=ttl, stale_ttl=stale_ttl, timeout_ms=timeout_ms, **kwargs
+        )
+        return result[0]["count"] if result else 0
@@ -0,0 +1,77 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from typing import Dict, List, Optional, Tuple
+
+from bson import BSON
+
+from .keys import canonical_sort
+
+
+def keyset_sort(sort) -> List[Tuple[str, int]]:
+    """Normalize the sort of a pagination, adding '_id' as the last key so that
+    every document has a unique position."""
+    sort = canonical_sort(sort)
+    if "_id" not in (field for field, _ in sort):
+        sort.append(("_id", sort[-1][1] if sort else 1))
+    return sort
+
+
+def reverse_sort(sort: List[Tuple[str, int]]) -> List[Tuple[str, int]]:
+    return [(field, -direction) for field, direction in sort]
+
+
+def sort_values(document: Dict, sort: List[Tuple[str, int]]) -> List:
+    """Return the values of the sort keys of a document."""
+    values = []
+    for field, _ in sort:
+        value = document
+        for part in field.split("."):
+            value = value.get(part) if isinstance(value, Dict) else None
+        values.append(value)
+    return values
+
+
+def _beyond(field: str, direction: int, value) -> Optional[Dict]:
+    """Return the predicate of the values of a field after 'value' in the sort
+    direction (None if there are none). Null and missing values sort first, and
+    range operators never match them (nor match anything when comparing to null)."""
+    if direction == 1:
+        return {field: {"$ne": None}} if value is None else {field: {"$gt": value}}
+    if value is None:
+        return None
+    return {"$or": [{field: {"$lt": value}}, {field: None}]}
+
+
+def keyset_filters(sort: List[Tuple[str, int]], values: List) -> Dict:
+    """Return the range predicate selecting the documents that come after the
+    provided sort values in the sort order."""
+    branches = []
+    for position, (field, direction) in enumerate(sort):
+        if (beyond := _beyond(field, direction, values[position])) is None:
+            continue
+        branch = {key: value for (key, _), value in zip(sort, values[:position])}
+        branches.append({**branch, **beyond})
+    if not branches:
+        return {"_id": {"$exists": False}}
+    return branches[0] if len(branches) == 1 else {"$or": branches}
+
+
+def unset(document: Dict, field: str):
+    """Remove a (dotted) field from a document, and the embedded documents it
+    leaves empty."""
+    parent, _, name = field.rpartition(".")
+    container = document
+    for part in parent.split(".") if parent else []:
+        container = container.get(part) if isinstance(container, Dict) else None
+    if isinstance(container, Dict):
+        container.pop(name, None)
+        if parent and not container:
+            unset(document, parent)
+
+
+def encode_token(values: List) -> str:
+    """Encode the sort values of a page boundary in an opaque token."""
+    return urlsafe_b64encode(BSON.encode({"v": values})).decode()
+
+
+def decode_token(token: str) -> List:
+    return BSON(urlsafe_b64decode(token.encode())).decode()["v"]
@@ -0,0 +1,115 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from queue import Full, Queue
+from threading import Event
+from typing import Callable, Dict, Iterator, List
+
+from pymongo.collection import Collection
+
+MAX_PARTITIONS = 32
+UNSUPPORTED = ("sort", "skip", "limit")
+
+
+def partition_bounds(
+    collection: Collection,
+    filters: Dict,
+    partitions: int,
+    field: str = "_id",
+    sample: int = None,
+) -> List:
+    """Split the values of 'field' among the documents matching the filters into up
+    to 'partitions' ranges of about as many documents, with a $bucketAuto
+    aggregation (over a random 'sample' of the documents if provided), and return
+    the lower bound of every range but the first."""
+    if partitions <= 1:
+        return []
+    pipeline = [{"$match": filters}, {"$project": {field: 1}}]
+    if sample:
+        pipeline.append({"$sample": {"size": sample}})
+    pipeline.append({"$bucketAuto": {"groupBy": f"${field}", "buckets": partitions}})
+    buckets = collection.aggregate(pipeline, allowDiskUse=True)
+    return [bucket["_id"]["min"] for bucket in buckets][1:]
+
+
+def partition_filters(filters: Dict, bounds: List, field: str = "_id") -> List[Dict]:
+    """Return the filters of every range delimited by the bounds. The first one also
+    matches the documents missing the field or with a value of another type, so that
+    every document is read exactly once. An array value belongs to the range of its
+    lowest element (of the bounds type): the other ranges exclude the arrays with an
+    element below them."""
+    if not bounds:
+        return [filters]
+    ranges = [{field: {"$not": {"$gte": bounds[0]}}}]
+    if field != "_id":
+        ranges = [{"$or": [ranges[0], {field: {"$lt": bounds[0]}}]}]
+    for lower, upper in zip(bounds, [*bounds[1:], None]):
+        condition = {"$gte": lower}
+        if upper is not None:
+            condition["$lt"] = upper
+        if field != "_id":
+            condition["$not"] = {"$lt": lower}
+        ranges.append({field: condition})
+    if not filters:
+        return ranges
+    return [{"$and": [filters, condition]} for condition in ranges]
+
+
+def read_partitions(read: Callable, partitions: List[Dict]) -> List:
+    """Run the read on every partition concurrently, each in its own thread and on
+    its own pooled connection, and return the results in the partitions order. The
+    reads run in copies of the caller context, so that its time budget and metrics
+    apply to them."""
+    workers = min(len(partitions), MAX_PARTITIONS)
+    with ThreadPoolExecutor(workers, thread_name_prefix="st-mongo-partition") as pool:
+        futures = [
+            pool.submit(copy_context().run, read, partition) for partition in partitions
+        ]
+        return [future.result() for future in futures]
+
+
+def iterate_partitions(
+    read: Callable[[Dict], Iterator[List[Dict]]], partitions: List[Dict]
+) -> Iterator[List[Dict]]:
+    """Yield the batches of documents read concurrently from every partition, in the
+    order they arrive. At most two batches per partition are held in memory, and the
+    reads stop when the iteration does."""
+    queue, stopped, done = Queue(2 * len(partitions)), Event(), object()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def produce(partition: Dict):
+        batches = read(partition)
+        try:
+            for batch in batches:
+                if not put(batch):
+                    return
+        except Exception as error:
+            put(error)
+        finally:
+            batches.close()
+            put(done)
+
+    workers = min(len(partitions), MAX_PARTITIONS)
+    pool = ThreadPoolExecutor(workers, thread_name_prefix="st-mongo-partition")
+    for partition in partitions:
+        pool.submit(produce, partition)
+    try:
+        remaining = len(partitions)
+        while remaining:
+            item = queue.get()
+            if item is done:
+                remaining -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield item
+    finally:
+        stopped.set()
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,77 @@
+import logging
+from collections.abc import Mapping
+from threading import Barrier, BrokenBarrierError, Thread
+from typing import Callable, Dict, List, Union
+
+from pymongo import MongoClient
+
+METHODS = (
+    "find",
+    "find_one",
+    "paginate",
+    "batch",
+    "aggregate",
+    "count",
+    "distinct",
+    "distinct_count",
+)
+WARM_UP_TIMEOUT = 10
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _plain(value):
+    """Convert the secrets wrappers (e.g. AttrDict) to dictionaries."""
+    if isinstance(value, Mapping):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    return value
+
+
+def prefetch_queries(queries: Union[Dict, List, None]) -> Dict[str, Dict]:
+    """Normalize the reads to prefetch, a list or a dictionary of named reads like
+    {"method": "find", "filters": {...}, "collection": "users", "ttl": 3600}, to a
+    dictionary of named reads."""
+    queries = _plain(queries or {})
+    if isinstance(queries, list):
+        queries = {str(index): query for index, query in enumerate(queries)}
+    for name, query in queries.items():
+        if query.get("method") not in METHODS:
+            raise ValueError(f"prefetch '{name}': method must be one of {METHODS}")
+    return queries
+
+
+def warm_pool(client: MongoClient, size: int):
+    """Open up to 'size' pooled connections by running as many concurrent pings, so
+    that the first reads don't pay for the server selection and the handshakes."""
+    client.admin.command("ping")
+    barrier = Barrier(size)
+
+    def ping():
+        try:
+            barrier.wait(WARM_UP_TIMEOUT)
+        except BrokenBarrierError:
+            pass
+        client.admin.command("ping")
+
+    threads = [Thread(target=ping, daemon=True) for _ in range(size - 1)]
+    for thread in threads:
+        thread.start()
+    ping()
+    for thread in threads:
+        thread.join()
+
+
+def run_prefetch(queries: Dict[str, Dict], read: Callable, warm_up: Callable = None):
+    """Warm up the connection pool, then run every read (logging its failure)."""
+    if warm_up:
+        try:
+            warm_up()
+        except Exception as error:
+            _LOGGER.warning("Connection pool warm-up failed: %s", error)
+    for name, query in queries.items():
+        try:
+            read(**query)
+        except Exception as error:
+            _LOGGER.warning("Prefetch '%s' failed: %s", name, error)
@@ -0,0 +1,170 @@
+import json
+from threading import Lock
+from time import monotonic
+from typing import Dict, Hashable, Iterator, List, Tuple
+
+from pymongo.collection import Collection
+
+from .concurrency import submit
+from .indexes import covered_by, suggest_index
+from .keys import canonical_sort
+from .metrics import query_shape
+
+EXPLAIN_INTERVAL = 300
+MAX_RATIO = 10
+
+
+def explain(collection: Collection, operation: str, query: Dict) -> Dict:
+    """Return the execution stats explanation of a read."""
+    if operation == "find":
+        options = {k: v for k, v in query.items() if k != "filters" and v}
+        return collection.find(query["filters"], **options).explain()
+    if operation == "count":
+        command = {"count": collection.name, "query": query["filters"]}
+    else:
+        command = {"aggregate": collection.name, "pipeline": query["pipeline"]}
+        command["cursor"] = {}
+    return collection.database.command(
+        {"explain": command, "verbosity": "executionStats"}
+    )
+
+
+def _plans(explanation: Dict) -> Iterator[Tuple[Dict, Dict]]:
+    """Yield the query planner and execution stats of an explanation, including
+    the ones of the $cursor stage of aggregations."""
+    if "queryPlanner" in explanation:
+        yield explanation["queryPlanner"], explanation.get("executionStats", {})
+    for stage in explanation.get("stages", []):
+        if "$cursor" in stage:
+            yield from _plans(stage["$cursor"])
+
+
+def _stages(plan: Dict) -> Iterator[Dict]:
+    """Yield every stage of a plan tree (classic or slot based engine)."""
+    if "queryPlan" in plan:
+        plan = plan["queryPlan"]
+    yield plan
+    for child in [plan.get("inputStage")] + plan.get("inputStages", []):
+        if child:
+            yield from _stages(child)
+    for shard in plan.get("shards", []):
+        yield from _stages(shard.get("winningPlan", {}))
+
+
+def analyze(explanation: Dict, max_ratio: float = MAX_RATIO) -> Dict:
+    """Summarize an explanation: the stages of the winning plan, the indexes used,
+    the keys and documents examined per document returned, and the warnings about
+    collection scans, in-memory sorts and examined to returned ratios above
+    'max_ratio'."""
+    stages, indexes, keys, documents, returned = [], [], 0, 0, 0
+    for planner, stats in _plans(explanation):
+        for stage in _stages(planner.get("winningPlan", {})):
+            stages.append(stage.get("stage"))
+            if "keyPattern" in stage:
+                indexes.append(stage["keyPattern"])
+        keys += stats.get("totalKeysExamined", 0)
+        documents += stats.get("totalDocsExamined", 0)
+        returned += stats.get("nReturned", 0)
+    ratio = max(keys, documents) / max(returned, 1)
+    warnings = []
+    if "COLLSCAN" in stages:
+        warnings.append("collection scan")
+    if "SORT" in stages:
+        warnings.append("in-memory sort")
+    if ratio > max_ratio:
+        warnings.append(f"{ratio:.0f} keys or documents examined per returned")
+    return {
+        "stages": stages,
+        "indexes": indexes,
+        "keys_examined": keys,
+        "docs_examined": documents,
+        "returned": returned,
+        "ratio": ratio,
+        "warnings": warnings,
+    }
+
+
+def _filters_and_sort(operation: str, query: Dict) -> Tuple[Dict, List]:
+    if operation != "aggregate":
+        return query.get("filters") or {}, query.get("sort")
+    pipeline, filters, sort = list(query["pipeline"]), {}, None
+    if pipeline and "$match" in pipeline[0]:
+        filters = pipeline.pop(0)["$match"]
+    if pipeline and "$sort" in pipeline[0]:
+        sort = pipeline[0]["$sort"]
+    return filters, sort
+
+
+class Profiler:
+    """Process-wide registry of the explained query shapes. Every shape is explained
+    in a worker thread the first time it is read, then again at most every
+    'interval' seconds."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._profiles: Dict[Tuple, Dict] = {}
+        self._explained_at: Dict[Tuple, float] = {}
+
+    def sample(
+        self,
+        collection: Collection,
+        namespace: Hashable,
+        operation: str,
+        query: Dict,
+        interval: float = EXPLAIN_INTERVAL,
+        max_ratio: float = MAX_RATIO,
+    ):
+        """Explain the read in the background if its shape is due."""
+        filters, sort = _filters_and_sort(operation, query)
+        shape = query_shape(query.get("pipeline", filters))
+        sort_shape = json.dumps(canonical_sort(sort)) if sort else ""
+        key = (namespace, operation, shape, sort_shape)
+        with self._lock:
+            explained_at = self._explained_at.get(key)
+            if explained_at is not None and monotonic() - explained_at < interval:
+                return
+            self._explained_at[key] = monotonic()
+        submit(self._explain, collection, key, operation, query, max_ratio)
+
+    def _explain(
+        self,
+        collection: Collection,
+        key: Tuple,
+        operation: str,
+        query: Dict,
+        max_ratio: float,
+    ):
+        profile = {"operation": operation, "shape": key[2], "sort": key[3]}
+        try:
+            profile |= analyze(explain(collection, operation, query), max_ratio)
+            filters, sort = _filters_and_sort(operation, query)
+            keys = suggest_index(filters, sort)
+            if profile["warnings"] and keys:
+                if not covered_by(keys, collection.index_information()):
+                    profile["suggested_index"] = keys
+        except Exception as error:
+            # e.g. the user is not allowed to run explain
+            profile["error"] = str(error) or type(error).__name__
+        with self._lock:
+            self._profiles[key] = profile
+
+    def report(self, namespace: Hashable = None) -> List[Dict]:
+        """Return the profiles of the explained shapes (of the namespace if given),
+        the ones with warnings first."""
+        with self._lock:
+            profiles = [
+                profile
+                for key, profile in self._profiles.items()
+                if namespace is None or key[0] == namespace
+            ]
+        return sorted(profiles, key=lambda profile: not profile.get("warnings"))
+
+    def reset(self, namespace: Hashable = None):
+        with self._lock:
+            for key in list(self._explained_at):
+                if namespace is None or key[0] == namespace:
+                    self._explained_at.pop(key, None)
+                    self._profiles.pop(key, None)
+
+
+profiler = Profiler()
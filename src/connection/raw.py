@@ -0,0 +1,28 @@
+from typing import Iterable, List, Optional
+
+from bson import decode_iter
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from pymongo.collection import Collection
+
+RAW_OPTIONS = CodecOptions(document_class=RawBSONDocument)
+
+
+def raw_collection(collection: Collection) -> Collection:
+    """Return the collection returning RawBSONDocuments: their BSON bytes are kept
+    as received from the server and a field is decoded only when accessed."""
+    return collection.with_options(codec_options=RAW_OPTIONS)
+
+
+def to_bytes(documents: Iterable[RawBSONDocument]) -> bytes:
+    """Concatenate the BSON bytes of raw documents (each one starts with its size)."""
+    return b"".join(document.raw for document in documents)
+
+
+def from_bytes(buffer: bytes) -> List[RawBSONDocument]:
+    """Split concatenated BSON bytes back into raw documents, decoding nothing."""
+    return list(decode_iter(buffer, RAW_OPTIONS))
+
+
+def document_from_bytes(buffer: Optional[bytes]) -> Optional[RawBSONDocument]:
+    return RawBSONDocument(buffer) if buffer is not None else None
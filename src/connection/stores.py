@@ -0,0 +1,385 @@
+import sqlite3
+from abc import ABC, abstractmethod
+import struct
+from collections import OrderedDict, defaultdict
+from hashlib import sha256
+from heapq import heappop, heappush
+from itertools import count
+from pathlib import Path
+from threading import Lock
+from time import time
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from .invalidation import invalidator
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+BACKENDS = ("memory", "disk", "redis")
+POLICIES = ("lru", "lfu")
+DISK_PATH = ".streamlit/mongo-cache.sqlite"
+
+
+class Entry:
+    __slots__ = ("value", "size", "expires_at", "hits", "accessed_at")
+
+    def __init__(self, value: bytes, ttl: Optional[float], expires_at: float = None):
+        self.value, self.size = value, len(value)
+        self.expires_at = expires_at if ttl is None else time() + ttl
+        self.hits, self.accessed_at = 0, time()
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and time() >= self.expires_at
+
+    def servable(self, stale_ttl: Optional[float]) -> bool:
+        """Whether the entry can still be served, stale for up to 'stale_ttl'
+        seconds after its expiration."""
+        if self.expires_at is None or stale_ttl is None:
+            return self.expires_at is None or not self.expired
+        return time() < self.expires_at + stale_ttl
+
+    def kept_until(self, retention: Optional[float]) -> Optional[float]:
+        """Time after which the entry can't be served anymore, even stale."""
+        if self.expires_at is None:
+            return None
+        return self.expires_at + (retention or 0)
+
+
+class Limits:
+    def __init__(self, max_entries: int = None, max_bytes: int = None):
+        self.max_entries, self.max_bytes = max_entries, max_bytes
+
+    def exceeded(self, entries: int, size: int) -> bool:
+        return (self.max_entries is not None and entries > self.max_entries) or (
+            self.max_bytes is not None and size > self.max_bytes
+        )
+
+
+def _name(namespace: Hashable) -> str:
+    """Stable name of a namespace, which never exposes the connection URL."""
+    return sha256(repr(namespace).encode()).hexdigest()
+
+
+class MemoryStore:
+    """Entries held by the process, dropped once their retention is over and
+    evicted following 'policy' when a limit of the whole store or of a method is
+    exceeded."""
+
+    shared = False
+
+    def __init__(
+        self,
+        max_entries: int = None,
+        max_bytes: int = None,
+        policy: str = "lru",
+        methods: Dict[str, Dict] = None,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {POLICIES}")
+        self.policy = policy
+        self._limits = Limits(max_entries, max_bytes)
+        self._method_limits = {
+            method: Limits(**limits) for method, limits in (methods or {}).items()
+        }
+        self._lock = Lock()
+        self._entries: Dict[str, OrderedDict] = defaultdict(OrderedDict)
+        self._bytes: Dict[str, int] = defaultdict(int)
+        self._evictions: Dict[str, int] = defaultdict(int)
+        # (kept until, tie breaker, method, key, entry) of the expiring entries
+        self._deadlines: List[Tuple[float, int, str, str, Entry]] = []
+        self._order = count()
+
+    def get(self, method: str, key: str) -> Optional[Entry]:
+        with self._lock:
+            self._purge()
+            entry = self._entries[method].get(key)
+            if entry is not None:
+                entry.hits += 1
+                entry.accessed_at = time()
+                self._entries[method].move_to_end(key)
+            return entry
+
+    def put(self, method: str, key: str, entry: Entry, retention: float = None):
+        limits = self._method_limits.get(method)
+        if self._limits.exceeded(1, entry.size) or (
+            limits and limits.exceeded(1, entry.size)
+        ):
+            return
+        with self._lock:
+            self._purge()
+            self._remove(method, key)
+            self._entries[method][key] = entry
+            self._bytes[method] += entry.size
+            if (kept_until := entry.kept_until(retention)) is not None:
+                deadline = (kept_until, next(self._order), method, key, entry)
+                heappush(self._deadlines, deadline)
+            while limits and limits.exceeded(
+                len(self._entries[method]), self._bytes[method]
+            ):
+                self._evict(method)
+            while self._limits.exceeded(self._size(), sum(self._bytes.values())):
+                self._evict(self._victim_method())
+
+    def clear(self, method: str = None, prefix: str = ""):
+        with self._lock:
+            for name in [method] if method else list(self._entries):
+                for key in [
+                    key for key in self._entries[name] if key.startswith(prefix)
+                ]:
+                    self._remove(name, key)
+
+    def usage(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            self._purge()
+            return {
+                method: {
+                    "evictions": self._evictions[method],
+                    "entries": len(entries),
+                    "bytes": self._bytes[method],
+                }
+                for method, entries in self._entries.items()
+            }
+
+    # eviction
+
+    def _purge(self):
+        """Drop the entries past their retention, which can't be served anymore.
+        Written reads are keyed by a new version, so their old entries are only
+        freed this way (or by an eviction)."""
+        now = time()
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, _, method, key, entry = heappop(self._deadlines)
+            # the entry might have been replaced, evicted or cleared since
+            if self._entries[method].get(key) is entry:
+                self._remove(method, key)
+
+    def _remove(self, method: str, key: str) -> Optional[Entry]:
+        entry = self._entries[method].pop(key, None)
+        if entry is not None:
+            self._bytes[method] -= entry.size
+        return entry
+
+    def _size(self) -> int:
+        return sum(len(entries) for entries in self._entries.values())
+
+    def _rank(self, entry: Entry):
+        if self.policy == "lru":
+            return entry.accessed_at
+        return entry.hits, entry.accessed_at
+
+    def _victim(self, method: str) -> Tuple[str, Entry]:
+        entries = self._entries[method]
+        if self.policy == "lru":
+            return next(iter(entries.items()))
+        return min(entries.items(), key=lambda item: self._rank(item[1]))
+
+    def _victim_method(self) -> str:
+        candidates = {
+            method: self._victim(method)[1]
+            for method, entries in self._entries.items()
+            if entries
+        }
+        return min(candidates, key=lambda method: self._rank(candidates[method]))
+
+    def _evict(self, method: str):
+        key, _ = self._victim(method)
+        self._remove(method, key)
+        self._evictions[method] += 1
+
+
+class SharedStore(ABC):
+    """Store shared by several processes. Since their writes can't be tracked one
+    by one, every write bumps a generation of the namespace kept in the store, and
+    the cached reads of a namespace are keyed by its current generation."""
+
+    shared = True
+
+    def __init__(self):
+        invalidator.add_listener(self.on_write)
+
+    def on_write(self, namespace: Hashable, mode: str = None, **write):
+        if mode:
+            self.bump(namespace)
+
+    @abstractmethod
+    def generation(self, namespace: Hashable) -> int:
+        """Return the current generation of the namespace."""
+
+    @abstractmethod
+    def bump(self, namespace: Hashable):
+        """Start a new generation of the namespace."""
+
+
+class DiskStore(SharedStore):
+    """SQLite file shared by the processes of a host. Entries past their retention
+    are purged on writes, the oldest ones are evicted first when a limit is
+    exceeded."""
+
+    def __init__(self, path: str = DISK_PATH, max_entries: int = None, max_bytes=None):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._limits = Limits(max_entries, max_bytes)
+        self._lock = Lock()
+        self._evictions: Dict[str, int] = defaultdict(int)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries (method TEXT, key TEXT, "
+                "value BLOB, size INTEGER, expires_at REAL, kept_until REAL, "
+                "stored_at REAL, PRIMARY KEY (method, key))"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS generations "
+                "(namespace TEXT PRIMARY KEY, generation INTEGER)"
+            )
+        super().__init__()
+
+    def get(self, method: str, key: str) -> Optional[Entry]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, expires_at FROM entries WHERE method = ? AND key = ? "
+                "AND (kept_until IS NULL OR kept_until > ?)",
+                (method, key, time()),
+            ).fetchone()
+        return Entry(row[0], None, expires_at=row[1]) if row else None
+
+    def put(self, method: str, key: str, entry: Entry, retention: float = None):
+        if self._limits.exceeded(1, entry.size):
+            return
+        now = time()
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM entries WHERE kept_until <= ?", (now,))
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    method,
+                    key,
+                    entry.value,
+                    entry.size,
+                    entry.expires_at,
+                    entry.kept_until(retention),
+                    now,
+                ),
+            )
+            entries, size = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+            while self._limits.exceeded(entries, size):
+                victim, key, victim_size = self._db.execute(
+                    "SELECT method, key, size FROM entries ORDER BY stored_at LIMIT 1"
+                ).fetchone()
+                self._db.execute(
+                    "DELETE FROM entries WHERE method = ? AND key = ?", (victim, key)
+                )
+                self._evictions[victim] += 1
+                entries, size = entries - 1, size - victim_size
+
+    def clear(self, method: str = None, prefix: str = ""):
+        # keys are hexadecimal digests: the prefix holds no LIKE wildcard
+        with self._lock, self._db:
+            if method:
+                self._db.execute(
+                    "DELETE FROM entries WHERE method = ? AND key LIKE ?",
+                    (method, f"{prefix}%"),
+                )
+            else:
+                self._db.execute(
+                    "DELETE FROM entries WHERE key LIKE ?", (f"{prefix}%",)
+                )
+
+    def usage(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT method, COUNT(*), SUM(size) FROM entries GROUP BY method"
+            ).fetchall()
+        return {
+            method: {"evictions": self._evictions[method], "entries": n, "bytes": b}
+            for method, n, b in rows
+        }
+
+    def generation(self, namespace: Hashable) -> int:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT generation FROM generations WHERE namespace = ?",
+                (_name(namespace),),
+            ).fetchone()
+        return row[0] if row else 0
+
+    def bump(self, namespace: Hashable):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO generations VALUES (?, 1) ON CONFLICT (namespace) "
+                "DO UPDATE SET generation = generation + 1",
+                (_name(namespace),),
+            )
+
+
+class RedisStore(SharedStore):
+    """Redis (or any server speaking its protocol) shared by the processes of every
+    host. Entries expire with the server when their retention is over, their
+    eviction follows the server 'maxmemory-policy'."""
+
+    def __init__(self, url: str, prefix: str = "st-mongo", **options):
+        if redis is None:
+            raise ImportError("the redis backend requires the 'redis' package")
+        self._redis = redis.Redis.from_url(url, **options)
+        self._prefix = prefix
+        super().__init__()
+
+    def _key(self, method: str, key: str = "*") -> str:
+        return f"{self._prefix}:entry:{method}:{key}"
+
+    def get(self, method: str, key: str) -> Optional[Entry]:
+        payload = self._redis.get(self._key(method, key))
+        if payload is None:
+            return None
+        (expires_at,) = struct.unpack_from("<d", payload)
+        value = payload[struct.calcsize("<d") :]
+        return Entry(value, None, expires_at=None if expires_at < 0 else expires_at)
+
+    def put(self, method: str, key: str, entry: Entry, retention: float = None):
+        kept_until = entry.kept_until(retention)
+        expires_at = -1.0 if entry.expires_at is None else entry.expires_at
+        payload = struct.pack("<d", expires_at) + entry.value
+        milliseconds = None
+        if kept_until is not None:
+            milliseconds = max(1, int((kept_until - time()) * 1000))
+        self._redis.set(self._key(method, key), payload, px=milliseconds)
+
+    def clear(self, method: str = None, prefix: str = ""):
+        pattern = self._key(method or "*", f"{prefix}*")
+        keys = list(self._redis.scan_iter(match=pattern, count=1000))
+        for start in range(0, len(keys), 1000):
+            self._redis.delete(*keys[start : start + 1000])
+
+    def usage(self) -> Dict[str, Dict[str, int]]:
+        return {}
+
+    def generation(self, namespace: Hashable) -> int:
+        value = self._redis.get(f"{self._prefix}:generation:{_name(namespace)}")
+        return int(value or 0)
+
+    def bump(self, namespace: Hashable):
+        self._redis.incr(f"{self._prefix}:generation:{_name(namespace)}")
+
+
+_stores: Dict[Hashable, SharedStore] = {}
+_lock = Lock()
+
+
+def get_store(backend: str = "memory", **options):
+    """Return a new memory store, or the process-wide store of a shared backend
+    ('disk' or 'redis') with the provided options, creating it on first use."""
+    if backend not in BACKENDS:
+        raise ValueError(f"backend must be one of {BACKENDS}")
+    if backend == "memory":
+        return MemoryStore(**options)
+    key = (backend, tuple(sorted((name, repr(arg)) for name, arg in options.items())))
+    with _lock:
+        if key not in _stores:
+            store = DiskStore if backend == "disk" else RedisStore
+            _stores[key] = store(**options)
+        return _stores[key]
@@ -0,0 +1,206 @@
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from itertools import chain, islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import pyarrow.parquet as pq
+from bson import BSON, decode_file_iter, json_util
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
+
+from .columnar import arrow_schema, conform, record_batches, unify_schemas
+from .raw import RAW_OPTIONS
+
+FORMATS = ("jsonl", "parquet", "bson")
+EXTENSIONS = {
+    ".jsonl": "jsonl",
+    ".json": "jsonl",
+    ".parquet": "parquet",
+    ".bson": "bson",
+}
+MAX_ERRORS = 10
+SAMPLE_DOCUMENTS = 10_000
+
+Progress = Callable[[int, Optional[float]], None]
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def file_format(path: str, format: str = None) -> str:
+    """Return the format of the file, inferred from its extension if not provided."""
+    if format is None:
+        extension = os.path.splitext(path)[1]
+        if extension not in EXTENSIONS:
+            raise ValueError(
+                f"can't infer the format of {path!r}: provide one of {FORMATS}"
+            )
+        format = EXTENSIONS[extension]
+    if format not in FORMATS:
+        raise ValueError(f"format must be one of {FORMATS}")
+    return format
+
+
+# export
+
+
+def write_file(
+    path: str,
+    batches: Iterable[List[Dict]],
+    format: str,
+    schema: Dict = None,
+    progress: Progress = None,
+    total: int = None,
+) -> int:
+    """Write the batches of documents to the file one at a time, as JSON lines
+    (Extended JSON), Parquet row groups (see '_write_parquet') or concatenated BSON
+    documents, and return their number. After every batch 'progress' is called with
+    the documents written and their fraction of the 'total'. The file is written
+    under a temporary name, replacing 'path' once complete: a failed export leaves
+    no truncated file."""
+    partial = f"{path}.part"
+    try:
+        if format == "parquet":
+            written = _write_parquet(partial, batches, schema, progress, total)
+        else:
+            written = _write_documents(partial, batches, format, progress, total)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    os.replace(partial, path)
+    return written
+
+
+def _write_parquet(
+    path: str,
+    batches: Iterable[List[Dict]],
+    schema: Dict = None,
+    progress: Progress = None,
+    total: int = None,
+) -> int:
+    """Write the batches as Parquet row groups, with the provided 'schema' (fields
+    missing from it are dropped) or the one merged from the first
+    'SAMPLE_DOCUMENTS' documents, fields null in all of them being strings. A later
+    document with a field or a value that schema can't hold fails the export with a
+    ValueError: provide a 'schema' then."""
+    converted = record_batches(batches, schema)
+    schema = arrow_schema(schema)
+    if schema is None:
+        sample, sampled = [], 0
+        while sampled < SAMPLE_DOCUMENTS and (record_batch := next(converted, None)):
+            sample.append(record_batch)
+            sampled += record_batch.num_rows
+        schema = unify_schemas([record_batch.schema for record_batch in sample])
+        converted = chain(sample, converted)
+    written = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for record_batch in converted:
+            writer.write_batch(conform(record_batch, schema))
+            written = _report(progress, written + record_batch.num_rows, total)
+    return written
+
+
+def _write_documents(
+    path: str,
+    batches: Iterable[List[Dict]],
+    format: str,
+    progress: Progress = None,
+    total: int = None,
+) -> int:
+    written = 0
+    mode = "w" if format == "jsonl" else "wb"
+    with open(path, mode, encoding="utf-8" if mode == "w" else None) as file:
+        for batch in batches:
+            if format == "jsonl":
+                file.writelines(f"{json_util.dumps(document)}\n" for document in batch)
+            else:
+                file.writelines(_raw(document) for document in batch)
+            written = _report(progress, written + len(batch), total)
+    return written
+
+
+def _raw(document) -> bytes:
+    return document.raw if hasattr(document, "raw") else BSON.encode(document)
+
+
+def _report(progress: Optional[Progress], done: int, total: Optional[int]) -> int:
+    if progress:
+        progress(done, min(done / total, 1.0) if total else None)
+    return done
+
+
+# import
+
+
+def read_file(path: str, format: str, batch_size: int) -> Iterator[Tuple[List, float]]:
+    """Yield the documents of the file in batches of 'batch_size', with the fraction
+    of the file read so far. BSON documents are not decoded."""
+    if format == "parquet":
+        file = pq.ParquetFile(path)
+        rows, read = max(file.metadata.num_rows, 1), 0
+        for record_batch in file.iter_batches(batch_size):
+            read += record_batch.num_rows
+            yield record_batch.to_pylist(), read / rows
+        return
+    size = max(os.path.getsize(path), 1)
+    if format == "jsonl":
+        with open(path, encoding="utf-8") as file:
+            lines = (line for line in file if line.strip())
+            while batch := list(islice(lines, batch_size)):
+                documents = [json_util.loads(line) for line in batch]
+                yield documents, file.buffer.tell() / size
+        return
+    with open(path, "rb") as file:
+        documents = decode_file_iter(file, RAW_OPTIONS)
+        while batch := list(islice(documents, batch_size)):
+            yield batch, file.tell() / size
+
+
+def insert_batches(
+    collection: Collection,
+    batches: Iterable[Tuple[List, float]],
+    workers: int = 4,
+    progress: Progress = None,
+) -> Dict:
+    """Insert the batches with unordered insert_many calls on 'workers' threads,
+    while the next batches are read: at most two batches per worker are held in
+    memory. Write errors (e.g. duplicate keys) don't stop the import: they are
+    counted as 'failed' and the first ones are returned as 'errors'. After every
+    insert 'progress' is called with the documents inserted and the fraction of the
+    file read."""
+    result = {"inserted": 0, "failed": 0, "errors": []}
+    pending: Dict[Future, float] = {}
+    read = 0.0
+
+    def insert(batch: List) -> Tuple[int, List[Dict]]:
+        # inserted_ids is empty for raw BSON documents, whose _id isn't decoded
+        try:
+            collection.insert_many(batch, ordered=False)
+            return len(batch), []
+        except BulkWriteError as error:
+            errors = error.details["writeErrors"]
+            return len(batch) - len(errors), errors
+
+    def collect(done: Set[Future]):
+        nonlocal read
+        for future in done:
+            inserted, errors = future.result()
+            result["inserted"] += inserted
+            result["failed"] += len(errors)
+            result["errors"] += errors[: MAX_ERRORS - len(result["errors"])]
+            read = max(read, pending.pop(future))
+            if progress:
+                progress(result["inserted"], read)
+
+    with ThreadPoolExecutor(workers, thread_name_prefix="st-mongo-import") as pool:
+        for batch, fraction in batches:
+            if len(pending) >= 2 * workers:
+                collect(wait(pending, return_when=FIRST_COMPLETED).done)
+            pending[pool.submit(insert, batch)] = fraction
+        collect(wait(pending).done)
+    if result["failed"]:
+        _LOGGER.warning(
+            "%s documents not imported into %s", result["failed"], collection.full_name
+        )
+    return result
@@ -0,0 +1,119 @@
+import logging
+from threading import Event, Lock, Thread, Timer
+from time import monotonic, sleep
+from typing import Dict, Hashable, Optional, Set
+
+from pymongo.collection import Collection
+from pymongo.errors import ConnectionFailure, OperationFailure
+from streamlit.runtime import Runtime
+
+from .invalidation import invalidator
+
+RETRY_DELAY = 5
+RERUN_INTERVAL = 1.0
+
+_LOGGER = logging.getLogger(__name__)
+_watchers: Dict[Hashable, "Watcher"] = {}
+_lock = Lock()
+
+
+class Watcher(Thread):
+    """Background change stream on a collection: every change invalidates the cached
+    reads it might affect, for every connection of the process, and triggers a
+    rerun of the subscribed sessions (at most once every 'rerun_interval'). If the
+    server can't provide a change stream, the watcher stops and keeps the error as
+    its 'failure'."""
+
+    def __init__(self, collection: Collection, namespace: Hashable, mode: str):
+        super().__init__(name=f"watch-{collection.full_name}", daemon=True)
+        self.collection, self.namespace, self.mode = collection, namespace, mode
+        self.rerun_interval = RERUN_INTERVAL
+        self.sessions: Set[str] = set()
+        self.failure: Optional[OperationFailure] = None
+        self._stopped = Event()
+        self._last_rerun, self._rerun_timer = 0.0, None
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        resume_token = None
+        while not self._stopped.is_set():
+            try:
+                with self.collection.watch(
+                    resume_after=resume_token, max_await_time_ms=1000
+                ) as stream:
+                    while stream.alive and not self._stopped.is_set():
+                        if (change := stream.try_next()) is not None:
+                            self.apply(change)
+                        resume_token = stream.resume_token
+            except OperationFailure as error:
+                # e.g. change streams are not supported by a standalone server
+                _LOGGER.warning("Stopped watching %s: %s", self.namespace, error)
+                self.failure = error
+                return
+            except ConnectionFailure as error:
+                _LOGGER.warning("Watching %s failed: %s", self.namespace, error)
+                sleep(RETRY_DELAY)
+            # some changes could have been missed
+            invalidator.invalidate(self.namespace)
+
+    def apply(self, change: Dict):
+        """Invalidate the cached reads affected by a change event."""
+        operation = change["operationType"]
+        key = {"_id": change["documentKey"]["_id"]} if "documentKey" in change else {}
+        if operation == "insert":
+            write = {"documents": [change["fullDocument"]]}
+        elif operation == "update":
+            description = change["updateDescription"]
+            update = {"$set": description.get("updatedFields", {})}
+            update["$unset"] = dict.fromkeys(description.get("removedFields", []), "")
+            write = {"filters": key, "update": update}
+        elif operation == "replace":
+            write = {"filters": key, "update": change["fullDocument"]}
+        elif operation == "delete":
+            write = {"filters": key}
+        else:
+            write = {}
+        mode = self.mode if write else "collection"
+        invalidator.invalidate(self.namespace, mode, **write)
+        self.request_rerun()
+
+    # subscriptions
+
+    def request_rerun(self):
+        """Rerun the subscribed sessions, delaying the rerun if the previous one was
+        less than 'rerun_interval' seconds ago."""
+        if not self.sessions:
+            return
+        with _lock:
+            if self._rerun_timer is not None:
+                return
+            delay = self._last_rerun + self.rerun_interval - monotonic()
+            self._rerun_timer = Timer(max(delay, 0), self._rerun)
+            self._rerun_timer.daemon = True
+            self._rerun_timer.start()
+
+    def _rerun(self):
+        with _lock:
+            self._rerun_timer, self._last_rerun = None, monotonic()
+        if not Runtime.exists():
+            return
+        sessions = Runtime.instance()._session_mgr
+        for session_id in list(self.sessions):
+            if (info := sessions.get_active_session_info(session_id)) is None:
+                self.sessions.discard(session_id)
+            else:
+                # rerun the page the session is on, with its widgets state
+                info.session.request_rerun(info.session._client_state)
+
+
+def watch(collection: Collection, namespace: Hashable, mode: str) -> Watcher:
+    """Return the process-wide watcher of the namespace, starting it on first use.
+    A watcher that failed is not started again."""
+    with _lock:
+        watcher = _watchers.get(namespace)
+        if watcher is None or not (watcher.is_alive() or watcher.failure):
+            watcher = _watchers[namespace] = Watcher(collection, namespace, mode)
+            watcher.start()
+        return watcher
@@ -0,0 +1,157 @@
+import atexit
+import logging
+from concurrent.futures import Future
+from threading import Condition, Lock, Thread
+from time import monotonic
+from typing import Callable, Dict, Hashable, List, Tuple, Union
+
+from bson import BSON, ObjectId
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError, WriteError
+
+MAX_DOCUMENTS = 1000
+MAX_BYTES = 8 * 1024 * 1024
+INTERVAL = 0.5
+
+_LOGGER = logging.getLogger(__name__)
+_writers: Dict[Hashable, "BufferedWriter"] = {}
+_lock = Lock()
+
+
+class BufferedWriter(Thread):
+    """Process-wide insert buffer of a collection: documents added by every session
+    are inserted together with insert_many (unordered) by a background thread, as
+    soon as 'max_documents' or 'max_bytes' are buffered or 'interval' seconds after
+    the first one. Every document gets a future resolved with its _id, or failed
+    with its write error, once 'on_flush' was called with the inserted documents
+    (so that reads made when it's resolved see them). Buffered documents are
+    flushed when the process exits."""
+
+    def __init__(
+        self,
+        collection: Collection,
+        on_flush: Callable[[List[Dict]], None] = None,
+        max_documents: int = MAX_DOCUMENTS,
+        max_bytes: int = MAX_BYTES,
+        interval: float = INTERVAL,
+    ):
+        super().__init__(name=f"writer-{collection.full_name}", daemon=True)
+        self.collection, self.on_flush = collection, on_flush
+        self.max_documents, self.max_bytes = max_documents, max_bytes
+        self.interval = interval
+        self._buffer: List[Tuple[Dict, Future]] = []
+        self._bytes, self._since, self._closed = 0, None, False
+        self._condition = Condition()
+        self._flushing = Lock()
+
+    def add(self, document: Dict) -> Future:
+        """Buffer a document (assigning its _id, as insert_one would) and return the
+        future of its insertion."""
+        document.setdefault("_id", ObjectId())
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("the writer is closed")
+            self._buffer.append((document, future))
+            self._bytes += len(BSON.encode(document))
+            if self._since is None or self._full():
+                # start the interval of the first document, or flush now
+                self._since = self._since or monotonic()
+                self._condition.notify()
+        return future
+
+    def _full(self) -> bool:
+        return len(self._buffer) >= self.max_documents or self._bytes >= self.max_bytes
+
+    def _due(self) -> bool:
+        return self._since is not None and monotonic() - self._since >= self.interval
+
+    def run(self):
+        while True:
+            with self._condition:
+                while not (self._closed or self._full() or self._due()):
+                    timeout = None
+                    if self._since is not None:
+                        timeout = self._since + self.interval - monotonic()
+                    self._condition.wait(timeout)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+
+    def flush(self):
+        """Insert the buffered documents now, resolving their futures."""
+        with self._flushing:
+            with self._condition:
+                buffer, self._buffer = self._buffer, []
+                self._bytes, self._since = 0, None
+            if not buffer:
+                return
+            documents = [document for document, _ in buffer]
+            outcomes = []
+            for start in range(0, len(buffer), self.max_documents):
+                outcomes += self._insert(buffer[start : start + self.max_documents])
+            if self.on_flush:
+                try:
+                    self.on_flush(documents)
+                except Exception as error:
+                    _LOGGER.warning("Buffered insert callback failed: %s", error)
+            for (_, future), outcome in zip(buffer, outcomes):
+                if isinstance(outcome, BaseException):
+                    future.set_exception(outcome)
+                else:
+                    future.set_result(outcome)
+
+    def _insert(
+        self, buffer: List[Tuple[Dict, Future]]
+    ) -> List[Union[ObjectId, BaseException]]:
+        """Insert the documents, returning the _id or the error of each one."""
+        errors = {}
+        try:
+            self.collection.insert_many(
+                [document for document, _ in buffer], ordered=False
+            )
+        except BulkWriteError as error:
+            errors = {
+                write_error["index"]: WriteError(
+                    write_error.get("errmsg"), write_error.get("code"), write_error
+                )
+                for write_error in error.details.get("writeErrors", [])
+            }
+        except Exception as error:
+            return [error] * len(buffer)
+        return [
+            errors.get(index, document["_id"])
+            for index, (document, _) in enumerate(buffer)
+        ]
+
+    def close(self):
+        """Flush the buffered documents and stop the background thread."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self.is_alive():
+            self.join()
+        self.flush()
+
+
+def get_writer(
+    collection: Collection, namespace: Hashable, **options
+) -> BufferedWriter:
+    """Return the process-wide buffered writer of the namespace, starting it on first
+    use (the options of later calls are ignored)."""
+    with _lock:
+        buffered = _writers.get(namespace)
+        if buffered is None or not buffered.is_alive():
+            buffered = _writers[namespace] = BufferedWriter(collection, **options)
+            buffered.start()
+        return buffered
+
+
+@atexit.register
+def close_writers():
+    """Flush every buffered writer, e.g. when the Streamlit server shuts down."""
+    with _lock:
+        writers = list(_writers.values())
+    for buffered in writers:
+        buffered.close()
@@ -38,6 +38,31 @@ def app():
         # Find a single document in the MongoDB collection that matches the filters.
         # If 'mongo_id' is False, the Mongo ID will be excluded from the results.
         connection.find_one(filters, mongo_id=False, ttl=3600, **kwargs)
+
+        # With output="arrow", "pandas" or "numpy" the documents are returned as a
+        # table, a DataFrame or a dictionary of arrays, with an optional schema.
+        connection.find(filters, output="pandas", schema=None, **kwargs)
+
+        # With raw=True the documents are RawBSONDocuments, decoded only when a
+        # field is accessed, and cached as their BSON bytes.
+        connection.find(filters, raw=True, **kwargs)
+
+        # Return a page of documents and the 'next'/'previous' tokens to pass as
+        # 'after'/'before' to get the adjacent pages (keyset pagination).
+        connection.paginate(filters, sort, page_size=50, after=None, before=None)
+
+        # Find the 'window' newest documents of an append-only collection: once
+        # the ttl is over only the documents newer than the cached ones are read.
+        connection.find_incremental(filters, watermark_field="timestamp", window=500)
+
+        # Iterate over the matching documents without caching them, fetching
+        # 'batch_size' at a time. If 'batches' is True, lists are yielded.
+        connection.find_iter(filters, batch_size=1000, batches=False, **kwargs)
+
+        # Split the '_id' values into ranges of about as many documents and read
+        # them concurrently. Sort, skip and limit are not supported.
+        connection.parallel_find(filters, partitions=4, field="_id", output=None)
+        connection.parallel_find_iter(filters, partitions=4, batch_size=1000)
         """
     )
     tabs[1].subheader("Examples")
@@ -72,6 +97,22 @@ def app():
         # Insert the provided data into the MongoDB collection.
         # The data can be a single document (dict) or multiple documents (list).
         connection.insert(data, ttl=0, **kwargs)
+
+        # With buffered=True the documents are inserted later, together with the
+        # ones of every session, and the futures of their insertion are returned.
+        connection.insert(data, buffered=True)
+
+        # Execute pymongo write requests in chunks fitting the server limits
+        # and return the aggregated counts.
+        connection.bulk_write(requests, ordered=True, **kwargs)
+
+        # Replace the documents matching on the 'keys' fields, inserting new ones.
+        connection.upsert_many(documents, keys=("_id",), ordered=False, **kwargs)
+
+        # Stream the matching documents to a 'jsonl', 'parquet' or 'bson' file,
+        # and a file back into the collection, a batch at a time.
+        connection.export("users.jsonl", filters, progress=callback)
+        connection.import_file("users.jsonl", batch_size=1000, workers=4)
         """
     )
     tabs[2].subheader("Examples")
@@ -173,13 +214,30 @@ def app():
         # aggregation pipeline
         connection.aggregate(pipeline, ttl=3600, **kwargs)
 
+        # Persist the aggregation results in a summary collection with $merge and
+        # read them from there, refreshed every 'interval' seconds, after writes
+        # ('on_write') or with the new documents only ('incremental')
+        connection.materialize(name, pipeline, refresh="interval", interval=300)
+
         # Count the number of documents in the MongoDB collection that match the
-        # provided filters
-        connection.count(filters, ttl=3600, **kwargs)
+        # provided filters ('estimated' uses the metadata when there are no filters)
+        connection.count(filters, ttl=3600, estimated=False, **kwargs)
 
         # Find the distinct values for a specified field across a single collection
         # and returns the results in an array
         connection.distinct(field, filters, ttl=3600, **kwargs)
+
+        # Count the distinct values of a field on the server, or estimate it
+        # with an incrementally maintained sketch if 'approximate' is True
+        connection.distinct_count(field, filters, approximate=False, ttl=3600)
+
+        # Run named reads (e.g. {"total": {"count": filters}}) in a single
+        # $facet aggregation, cached as a whole
+        connection.batch(reads, ttl=3600, **kwargs)
+
+        # Run independent calls concurrently and return their results
+        # (afind, aaggregate, acount and adistinct are awaitable reads)
+        connection.gather(partial(connection.count, filters), ...)
         """
     )
     tabs[5].subheader("Examples")
@@ -57,6 +57,159 @@ def app():
         "your _MongoDB_ database."
     )
 
+    st.subheader("Live updates")
+    st.write(
+        "With `watch=true` each process keeps a single change stream per collection "
+        "(replica sets and sharded clusters only): changes made by anyone invalidate "
+        "the cached reads they affect, so long `ttl`s never serve stale results. "
+        "Call `conn.subscribe()` in a page to rerun it whenever the collection changes."
+    )
+    st.code(
+        """
+        [connections.mongodb]
+        watch=true
+        """
+    )
+
+    st.subheader("Multiple collections")
+    st.write(
+        "Connections with the same `url` and options share a single _MongoDB_ client, "
+        "and so a single connection pool. A connection can also access any other "
+        "collection or database through that client."
+    )
+    st.code(
+        """
+        conn = st.connection("mongodb", type=MongoDBConnection)
+        users = conn.collection("users")
+        logs = conn.db("monitoring").collection("logs")
+        """
+    )
+
+    st.subheader("Results cache")
+    st.write(
+        "Read results are cached by the connection for their `ttl`. The `cache` "
+        "section bounds the cache by number of entries and resident bytes, in total "
+        "and for each read method, evicting the least recently (`lru`) or least "
+        "frequently (`lfu`) used results first. `conn.cache_stats()` reports hits, "
+        "misses, evictions and resident bytes, `conn.clear_cache()` empties it. "
+        "Concurrent misses of the same read share a single query and, with a "
+        "`stale_ttl` (also a parameter of every cached read), an expired result is "
+        "still served for that many seconds while it is refreshed in the background."
+    )
+    st.code(
+        """
+        [connections.mongodb.cache]
+        max_entries=1000
+        max_bytes=200_000_000
+        policy="lru"
+        stale_ttl=60
+
+        [connections.mongodb.cache.methods.find]
+        max_bytes=100_000_000
+        """
+    )
+    st.write(
+        "Several Streamlit processes can share the results with the `disk` backend "
+        "(a SQLite file, for the processes of a host) or the `redis` backend (for "
+        "every host, `pip install st-mongo-connection[redis]`). Every write made "
+        "through a shared cache refreshes all the cached reads of the collection."
+    )
+    st.code(
+        """
+        [connections.mongodb.cache]
+        backend="disk"  # or "memory" (default)
+        path=".streamlit/mongo-cache.sqlite"
+        max_bytes=1_000_000_000
+
+        [connections.mongodb.cache]
+        backend="redis"
+        url="redis://localhost:6379/0"
+        """
+    )
+
+    st.subheader("Prefetch")
+    st.write(
+        "The `prefetch` reads are run in a background thread as soon as the "
+        "connection is created, so the first visitor after a restart is served from "
+        "a warm cache. Each read names its `method`, optionally another "
+        "`collection` of the database, and the method arguments. With a "
+        "`minPoolSize` the connection pool is filled up first. "
+        "`conn.prefetch(reads)` runs other reads the same way."
+    )
+    st.code(
+        """
+        [connections.mongodb.kwargs]
+        minPoolSize=10
+
+        [connections.mongodb.prefetch.recent]
+        method="find"
+        filters={status="active"}
+        sort=[["timestamp", -1]]
+        limit=100
+
+        [connections.mongodb.prefetch.users]
+        method="count"
+        collection="users"
+        """
+    )
+
+    st.subheader("Time budgets")
+    st.write(
+        "With `timeout_ms` every read must complete within that many milliseconds, "
+        "enforced by the server (`maxTimeMS`) and by the client. A read running out "
+        "of time returns the last result cached for it, kept up to the cache "
+        "`fallback_ttl` (an hour by default) after it expired, sets `conn.stale` and "
+        "is counted as a `fallback` in the metrics: a single heavy query can't stall "
+        "the pages of every session. Each read method also takes its own "
+        "`timeout_ms` (`0` for no limit); `find_iter` and `aggregate_iter`, having "
+        "no cached result to fall back on, fail once it is spent."
+    )
+    st.code(
+        """
+        [connections.mongodb]
+        timeout_ms=2000
+
+        [connections.mongodb.cache]
+        fallback_ttl=3600
+        """
+    )
+
+    st.subheader("Indexes and profiler")
+    st.write(
+        "The declared `indexes` are created in a background thread when the "
+        "connection is created (nothing happens if they already exist). With "
+        "`profile` every query shape of `find`, `aggregate` and `count` is explained "
+        "in the background, at most once every `interval` seconds: "
+        "`conn.profile()` lists the plans with a collection scan, an in-memory sort "
+        "or more than `max_ratio` documents examined per returned, and suggests an "
+        "index following the _Equality, Sort, Range_ rule."
+    )
+    st.code(
+        """
+        [connections.mongodb]
+        indexes=["status", {keys={user=1, timestamp=-1}, name="user_timestamp"}]
+
+        [connections.mongodb.profile]
+        interval=300
+        max_ratio=10
+        """
+    )
+
+    st.subheader("Cache invalidation")
+    st.write(
+        "Reads are cached for their `ttl`, but every write made through the "
+        "connection marks the cached reads of its collection as stale. With "
+        '`invalidate="collection"` (default) every read is refreshed, with '
+        '`invalidate="filters"` only the reads whose filters might match the '
+        "written documents. Set `invalidate=false` to rely on the `ttl` only."
+    )
+    st.code(
+        """
+        [connections.mongodb]
+        invalidate="filters"
+        """
+    )
+
 
 if __name__ == "__main__":
     app()
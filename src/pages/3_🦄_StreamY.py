@@ -1,3 +1,4 @@
+from concurrent.futures import TimeoutError
 from datetime import datetime
 from random import choice, randint
 from re import sub
@@ -6,6 +7,7 @@ import streamlit as st
 from connection.mongo import MongoDBConnection
 
 DB = st.connection("streamy", type=MongoDBConnection)
+POST_TIMEOUT = 2
 
 # ---- utils
 
@@ -22,12 +24,24 @@ def send_post(post):
         "post": post,
         "timestamp": datetime.utcnow(),
     }
-    if DB.insert(data):
+    # buffered: posts of every session are inserted together. This one is flushed
+    # now rather than after the writer interval, so that it's on the wall shown
+    # after it (the timeout covers a flush already running in the background)
+    future = DB.insert(data, buffered=True)["future"]
+    DB.writer().flush()
+    try:
+        future.result(timeout=POST_TIMEOUT)
+    except TimeoutError:
+        st.toast("Your **post** will be on the wall soon", icon="⏳")
+    except Exception as error:
+        st.error(f"Your post couldn't be sent: {error}", icon="🚨")
+    else:
         st.toast("New **post** created!", icon="🦄")
 
 
 def retrieve_post(ttl):
-    return DB.find(sort=[("timestamp", -1)], limit=500, ttl=ttl)
+    # posts are only appended: a refresh reads the new ones only
+    return DB.find_incremental(watermark_field="timestamp", window=500, ttl=ttl)
 
 
 # ---- app
@@ -52,18 +66,29 @@ def app():
     )
     side_section.button("Refresh 🔄", use_container_width=True)
     side_section.divider()
-    # stats
-    total_chars = DB.aggregate(
+    # stats: kept up to date in a summary collection, adding the new posts only
+    stats = DB.materialize(
+        "streamy_stats",
         [
-            {"$addFields": {"length": {"$strLenCP": "$post"}}},
-            {"$group": {"_id": None, "total": {"$sum": "$length"}}},
+            {
+                "$group": {
+                    "_id": None,
+                    "posts": {"$sum": 1},
+                    "chars": {"$sum": {"$strLenCP": "$post"}},
+                }
+            }
         ],
+        refresh="incremental",
+        watermark_field="timestamp",
         ttl=ttl,
     )
+    stats = stats[0] if stats else {}
+    users = DB.distinct_count("user", ttl=ttl)
+    total_chars = stats.get("chars", 0)
     side_section.title("📊 Wall stats")
-    side_section.write(f"* **Post** count: `{DB.count(ttl=ttl)}`")
-    side_section.write(f"* Unique **users**: `{len(DB.distinct('user', ttl=ttl))}`")
-    side_section.write(f"* Total **chars**: `{total_chars[0].get('total')}`")
+    side_section.write(f"* **Post** count: `{stats.get('posts', 0)}`")
+    side_section.write(f"* Unique **users**: `{users}`")
+    side_section.write(f"* Total **chars**: `{total_chars}`")
 
     # ---- user
     if not (username := st.session_state.get("username")):
@@ -0,0 +1,59 @@
+import pandas as pd
+import streamlit as st
+from connection.mongo import MongoDBConnection
+
+
+def metrics_table(metrics):
+    return pd.DataFrame(
+        [
+            {
+                **{k: v for k, v in row.items() if k not in ("latency", "server")},
+                "p50 (ms)": row["latency"]["p50"] * 1000,
+                "p95 (ms)": row["latency"]["p95"] * 1000,
+                "p99 (ms)": row["latency"]["p99"] * 1000,
+                "server (ms)": row["server"]["sum"] * 1000,
+            }
+            for row in metrics
+        ]
+    )
+
+
+def app():
+    st.title("📈 Metrics")
+    st.write(
+        "Every operation of the connection is timed and its cache results, "
+        "documents fetched and bytes served are recorded, keyed by operation and "
+        "_query shape_ (the filters or pipeline with every value replaced by `?`). "
+        "Server commands are timed by a **pymongo** `CommandListener`."
+    )
+    st.code(
+        """
+        connection.metrics()                 # list of dictionaries
+        connection.metrics(prometheus=True)  # Prometheus text format
+        connection.reset_metrics()
+        connection.cache_stats()
+        """
+    )
+
+    for name in ("mongodb", "streamy"):
+        connection = st.connection(name, type=MongoDBConnection)
+        st.header(f"`{connection._instance.full_name}`")
+        if metrics := connection.metrics():
+            st.dataframe(metrics_table(metrics), hide_index=True)
+        else:
+            st.info("No operation recorded yet", icon="ℹ️")
+        if profiles := connection.profile():
+            st.subheader("Profiler")
+            st.dataframe(pd.DataFrame(profiles), hide_index=True)
+        cols = st.columns(2)
+        cols[0].subheader("Results cache")
+        cols[0].json(connection.cache_stats(), expanded=False)
+        cols[1].subheader("Prometheus")
+        cols[1].code(connection.metrics(prometheus=True), language="text")
+        if st.button("**Reset** metrics 🧹", key=f"reset-{name}"):
+            connection.reset_metrics()
+            st.rerun()
+
+
+if __name__ == "__main__":
+    app()
@@ -16,7 +16,7 @@ def main():
         "The goal is to showcase a new _MongoDB_ connection using the "
         "recently released `st.connection` feature of **Streamlit**."
     )
-    st.write("The application is divided into 3 main pages:")
+    st.write("The application is divided into 4 main pages:")
     st.write(
         "1. **Connection demonstration** in [🔌 Connection](/Connection): This page "
         "will demonstrate how the connection to _MongoDB_ has been implemented, "
@@ -33,6 +33,11 @@ def main():
         " This showcase uses the _MongoDB_ connection to store and retrieve posts,"
         " demonstrating its practical application."
     )
+    st.write(
+        "4. **Connection metrics** in [📈 Metrics](/Metrics): This page shows the "
+        "latency, cache hits and misses, documents and bytes of every operation of "
+        "the connections, also exported in the _Prometheus_ text format."
+    )
 
     st.header("About me")
     st.write("Hello, I'm **Mortafix**! 👋🏻")
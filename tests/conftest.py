@@ -0,0 +1,51 @@
+import fakeredis
+import mongomock
+import pytest
+from streamlit.runtime.secrets import AttrDict
+
+from connection import clients, stores
+from connection.mongo import MongoDBConnection
+from connection.stores import DiskStore, RedisStore
+
+
+@pytest.fixture
+def connection(monkeypatch, request):
+    """Factory of connections to a mongomock collection named after the test,
+    emptied first. Keyword arguments are added to the connection secrets."""
+    monkeypatch.setattr(clients, "MongoClient", mongomock.MongoClient)
+
+    def connect(**secrets) -> MongoDBConnection:
+        secrets = {
+            "url": "mongodb://localhost",
+            "database": "test",
+            "collection": request.node.name[:60],
+            **secrets,
+        }
+
+        class Connection(MongoDBConnection):
+            _secrets = property(lambda self: AttrDict(secrets))
+
+        conn = Connection(f"test-{secrets['collection']}")
+        conn._instance.delete_many({})
+        return conn
+
+    return connect
+
+
+@pytest.fixture(params=["disk", "redis"])
+def shared(request, tmp_path, monkeypatch):
+    """Factory of shared stores of the backend, the ones of a test sharing their
+    entries like the stores of several processes."""
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        stores.redis.Redis,
+        "from_url",
+        lambda url, **options: fakeredis.FakeRedis(server=server),
+    )
+
+    def store(**options):
+        if request.param == "disk":
+            return DiskStore(str(tmp_path / "cache.sqlite"), **options)
+        return RedisStore("redis://localhost", **options)
+
+    return store
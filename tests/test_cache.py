@@ -0,0 +1,84 @@
+from time import sleep
+
+import pytest
+from pymongo.errors import ExecutionTimeout
+
+from connection.budget import is_timeout
+from connection.cache import ResultCache
+
+
+def timed_out():
+    raise ExecutionTimeout("operation exceeded time limit", 50)
+
+
+def test_fallback_is_marked_stale():
+    cache = ResultCache()
+    assert cache.get("find", "key", 0.01, lambda: [1], fallback=is_timeout) == [1]
+    assert not cache.stale
+    sleep(0.02)
+    assert cache.get("find", "key", 0.01, timed_out, fallback=is_timeout) == [1]
+    assert cache.stale
+    assert cache.stats()["fallbacks"] == 1
+    assert cache.get("find", "key", 0.01, lambda: [2], fallback=is_timeout) == [2]
+    assert not cache.stale
+
+
+def test_fallback_with_a_shared_store(shared):
+    cache = ResultCache()
+    cache._store = shared()
+    cache.get("find", "key", 0.01, lambda: [1], fallback=is_timeout)
+    sleep(0.05)
+    assert cache.get("find", "key", 0.01, timed_out, fallback=is_timeout) == [1]
+    assert cache.stale
+
+
+def test_fallback_retention_is_bounded():
+    cache = ResultCache(fallback_ttl=0.01)
+    cache.get("find", "key", 0.01, lambda: [1], fallback=is_timeout)
+    sleep(0.05)
+    with pytest.raises(ExecutionTimeout):
+        cache.get("find", "key", 0.01, timed_out, fallback=is_timeout)
+
+
+def test_reads_without_fallback_are_not_retained():
+    cache = ResultCache()
+    cache.get("find", "key", 0.01, lambda: [1])
+    sleep(0.02)
+    assert cache.stats()["entries"] == 0
+
+
+def test_stale_results_are_marked():
+    cache = ResultCache(stale_ttl=60)
+    cache.get("count", "key", 0.01, lambda: 1)
+    sleep(0.02)
+    assert cache.get("count", "key", 0.01, lambda: 2) == 1
+    assert cache.stale
+
+
+def test_connection_falls_back_on_timeouts(connection, monkeypatch):
+    conn = connection(timeout_ms=1000)
+    conn.insert({"a": 1})
+    assert conn.find(ttl=0.01) == [{"a": 1}]
+    assert not conn.stale
+    sleep(0.02)
+    monkeypatch.setattr(conn._instance, "find", lambda *args, **kwargs: timed_out())
+    assert conn.find(ttl=0.01) == [{"a": 1}]
+    assert conn.stale
+
+
+def test_iterations_have_a_time_budget(connection, monkeypatch):
+    conn = connection(timeout_ms=1000)
+    calls = []
+    find, aggregate = conn._instance.find, conn._instance.aggregate
+
+    def record(read):
+        return lambda *args, **kwargs: calls.append(kwargs) or read(*args, **kwargs)
+
+    monkeypatch.setattr(conn._instance, "find", record(find))
+    monkeypatch.setattr(conn._instance, "aggregate", record(aggregate))
+    list(conn.find_iter())
+    list(conn.aggregate_iter([], timeout_ms=50))
+    list(conn.find_iter(timeout_ms=0))
+    assert calls[0]["max_time_ms"] == 1000
+    assert calls[1]["maxTimeMS"] == 50
+    assert "max_time_ms" not in calls[2]
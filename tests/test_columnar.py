@@ -0,0 +1,20 @@
+import pyarrow as pa
+
+from connection.columnar import batches_to_arrow, concat_tables
+
+
+def test_concat_tables_of_different_schemas():
+    tables = [pa.table({"a": [1], "b": [None]}), pa.table({"a": [2], "b": ["x"]})]
+    tables.append(pa.table({"a": [3]}))
+    table = concat_tables(tables)
+    assert table.schema.field("b").type == pa.string()
+    assert table.to_pylist() == [
+        {"a": 1, "b": None},
+        {"a": 2, "b": "x"},
+        {"a": 3, "b": None},
+    ]
+
+
+def test_batches_keep_the_fields_missing_from_the_first():
+    table = batches_to_arrow(iter([[{"a": 1}], [{"a": 2, "b": "x"}]]))
+    assert table.to_pylist() == [{"a": 1, "b": None}, {"a": 2, "b": "x"}]
@@ -0,0 +1,128 @@
+from connection.invalidation import (
+    Invalidator,
+    affects,
+    might_match,
+    overlaps,
+    touches,
+    update_fields,
+)
+
+NAMESPACE = ("mongodb://localhost", "db.posts")
+
+
+def test_might_match_equality_and_operators():
+    document = {"user": "ann", "likes": 3, "tags": ["a", "b"], "meta": {"lang": "en"}}
+    assert might_match({"user": "ann"}, document)
+    assert not might_match({"user": "bob"}, document)
+    assert might_match({"likes": {"$gte": 3, "$lt": 5}}, document)
+    assert not might_match({"likes": {"$gt": 3}}, document)
+    assert might_match({"tags": "a"}, document)
+    assert not might_match({"tags": {"$in": ["c", "d"]}}, document)
+    assert might_match({"meta.lang": "en"}, document)
+    assert not might_match({"meta.lang": {"$ne": "en"}}, document)
+    assert not might_match({"missing": {"$exists": True}}, document)
+
+
+def test_might_match_is_conservative():
+    document = {"user": "ann", "items": [{"qty": 1}]}
+    # unknown operators, regexes and paths through arrays might match
+    assert might_match({"user": {"$regex": "^b"}}, document)
+    assert might_match({"user": {"$type": "int"}}, document)
+    assert might_match({"items.qty": 5}, document)
+    assert might_match({"$where": "false"}, document)
+    # uncomparable types
+    assert might_match({"user": {"$gt": 5}}, document)
+
+
+def test_might_match_logical_operators():
+    document = {"a": 1, "b": 2}
+    assert might_match({"$or": [{"a": 5}, {"b": 2}]}, document)
+    assert not might_match({"$or": [{"a": 5}, {"b": 5}]}, document)
+    assert not might_match({"$and": [{"a": 1}, {"b": 5}]}, document)
+
+
+def test_overlaps():
+    assert not overlaps({"user": "ann"}, {"user": "bob"})
+    assert overlaps({"user": {"$in": ["ann", "bob"]}}, {"user": "bob"})
+    assert overlaps({"user": "ann"}, {"likes": 3})
+    assert overlaps({"user": {"$ne": "ann"}}, {"user": "ann"})
+
+
+def test_update_fields_and_touches():
+    assert update_fields({"$set": {"a": 1}, "$inc": {"b.c": 1}}) == {"a", "b.c"}
+    assert update_fields({"$rename": {"a": "z"}}) == {"a", "z"}
+    assert update_fields([{"$set": {"a": 1}}]) is None
+    assert update_fields({"a": 1}) is None
+    assert touches({"b.c"}, {"b": {"$exists": True}})
+    assert not touches({"likes"}, {"user": "ann"})
+    assert touches(None, {"user": "ann"})
+    assert touches({"a"}, {"$expr": {"$gt": ["$a", 1]}})
+
+
+def test_affects():
+    read = {"user": "ann"}
+    assert affects(read, [{"user": "ann"}])
+    assert not affects(read, [{"user": "bob"}])
+    # updates of other users don't change the read, unless they set 'user'
+    assert not affects(read, [], {"user": "bob"}, {"$set": {"likes": 1}})
+    assert affects(read, [], {"user": "bob"}, {"$set": {"user": "ann"}})
+    assert affects(read, [], {"user": "ann"}, {"$set": {"likes": 1}})
+    # replacements matching the read
+    assert affects(read, [], {"_id": 1}, {"user": "ann"})
+    assert not affects(read, [], {"user": "bob"}, {"user": "bob"})
+
+
+def test_invalidate_collection_bumps_every_read():
+    invalidator = Invalidator()
+    first = invalidator.version(NAMESPACE, {"user": "ann"})
+    other = invalidator.version(NAMESPACE, {"user": "bob"})
+    invalidator.invalidate(NAMESPACE, "collection")
+    assert invalidator.version(NAMESPACE, {"user": "ann"}) != first
+    assert invalidator.version(NAMESPACE, {"user": "bob"}) != other
+    # other collections are untouched
+    assert invalidator.version(("url", "db.other")) == (0, 0)
+
+
+def test_invalidate_filters_bumps_affected_reads_only():
+    invalidator = Invalidator()
+    ann = invalidator.version(NAMESPACE, {"user": "ann"})
+    bob = invalidator.version(NAMESPACE, {"user": "bob"})
+    invalidator.invalidate(NAMESPACE, "filters", documents=[{"user": "ann"}])
+    assert invalidator.version(NAMESPACE, {"user": "ann"}) != ann
+    assert invalidator.version(NAMESPACE, {"user": "bob"}) == bob
+
+
+def test_invalidate_without_mode_only_notifies():
+    invalidator, writes = Invalidator(), []
+    invalidator.add_listener(lambda *args, **kwargs: writes.append((args, kwargs)))
+    version = invalidator.version(NAMESPACE, {})
+    invalidator.invalidate(NAMESPACE, None, documents=[{"a": 1}])
+    assert invalidator.version(NAMESPACE, {}) == version
+    assert writes == [
+        (
+            (NAMESPACE, None),
+            {"documents": [{"a": 1}], "filters": None, "update": None},
+        )
+    ]
+
+
+def test_forgotten_reads_start_a_new_generation():
+    invalidator = Invalidator(max_tracked_reads=2)
+    first = invalidator.version(NAMESPACE, {"a": 1})
+    invalidator.invalidate(NAMESPACE, "filters", documents=[{"a": 1}])
+    bumped = invalidator.version(NAMESPACE, {"a": 1})
+    invalidator.version(NAMESPACE, {"a": 2})
+    invalidator.version(NAMESPACE, {"a": 3})
+    # the bumped read was forgotten, its version must not go back to 'first'
+    assert invalidator.version(NAMESPACE, {"a": 1}) not in (first, bumped)
+
+
+def test_reordered_read_sees_the_write(connection):
+    conn = connection(invalidate="filters")
+    conn.insert({"user": "a", "n": 1})
+    assert conn.count({"user": "a", "n": {"$gte": 0}}) == 1
+    assert conn.aggregate([{"$match": {"user": {"$in": ["a", "b"]}}}]) != []
+    conn.insert({"user": "a", "n": 2})
+    assert conn.count({"n": {"$gte": 0}, "user": "a"}) == 2
+    result = conn.aggregate([{"$match": {"user": {"$in": ["b", "a"]}}}])
+    assert len(result) == 2
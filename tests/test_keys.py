@@ -0,0 +1,98 @@
+from datetime import datetime
+
+from bson import ObjectId
+
+from connection.keys import (
+    cache_key,
+    canonical_filters,
+    canonical_pipeline,
+    canonical_projection,
+    canonical_sort,
+)
+
+SCOPE = ("mongodb://localhost", "db.posts")
+
+
+def test_equal_filters_share_a_key():
+    first = {"user": "ann", "likes": {"$lt": 10, "$gte": 1}, "tag": {"$in": [2, 1]}}
+    second = {"tag": {"$in": [1, 2]}, "likes": {"$gte": 1, "$lt": 10}, "user": "ann"}
+    assert canonical_filters(first) == canonical_filters(second)
+    assert cache_key(SCOPE, "find", filters=first) == cache_key(
+        SCOPE, "find", filters=second
+    )
+
+
+def test_different_reads_get_different_keys():
+    filters = {"user": "ann"}
+    key = cache_key(SCOPE, "find", filters=filters)
+    assert key != cache_key(SCOPE, "count", filters=filters)
+    assert key != cache_key(("mongodb://other", "db.posts"), "find", filters=filters)
+    assert key != cache_key(SCOPE, "find", filters={"user": "bob"})
+    assert key != cache_key(SCOPE, "find", filters=filters, limit=1)
+
+
+def test_embedded_documents_keep_their_key_order():
+    first, second = {"meta": {"a": 1, "b": 2}}, {"meta": {"b": 2, "a": 1}}
+    assert list(canonical_filters(second)["meta"]) == ["b", "a"]
+    assert cache_key(SCOPE, "find", filters=first) != cache_key(
+        SCOPE, "find", filters=second
+    )
+
+
+def test_bson_values_are_encodable():
+    filters = {"_id": ObjectId("65a000000000000000000000"), "at": datetime(2024, 1, 1)}
+    assert cache_key(SCOPE, "find", filters=filters) == cache_key(
+        SCOPE, "find", filters=dict(reversed(filters.items()))
+    )
+    # options BSON can't encode (e.g. sessions) are keyed by their representation
+    assert cache_key(SCOPE, "find", filters={}, session=object)
+
+
+def test_expressions_are_kept_as_written():
+    expression = {"$in": ["$a_rather_long_field_name", ["a"]]}
+    filters = {"$expr": expression, "user": {"$in": ["b", "a"]}}
+    canonical = canonical_filters(filters)
+    assert canonical["$expr"] == expression
+    assert canonical["user"] == {"$in": ["a", "b"]}
+    nested = canonical_filters({"$or": [{"$expr": expression}]})
+    assert nested["$or"][0]["$expr"] == expression
+
+
+def test_expressions_dont_share_keys():
+    # both are valid when 'b' is an array field: the argument order matters
+    first = [{"$match": {"$expr": {"$in": ["$a", "$b"]}}}]
+    second = [{"$match": {"$expr": {"$in": ["$b", "$a"]}}}]
+    assert cache_key(SCOPE, "aggregate", pipeline=first) != cache_key(
+        SCOPE, "aggregate", pipeline=second
+    )
+    stage = {"$set": {"x": {"$in": ["$a", "$b"]}}}
+    assert canonical_pipeline([stage]) == [stage]
+
+
+def test_projection_and_sort():
+    assert canonical_projection(["b", "a"]) == {"a": 1, "b": 1}
+    assert canonical_projection({"b": True, "a": 0}) == {"a": 0, "b": 1}
+    expression = {"$in": ["$a", ["x"]]}
+    assert canonical_projection({"x": expression}) == {"x": expression}
+    assert canonical_sort("a") == [("a", 1)]
+    assert canonical_sort([("a", "desc"), "b"]) == [("a", -1), ("b", 1)]
+    assert canonical_sort({"score": {"$meta": "textScore"}}) == [
+        ("score", {"$meta": "textScore"})
+    ]
+
+
+def test_reads_send_the_filters_as_written(connection):
+    conn = connection()
+    conn._instance.insert_one({"a_rather_long_field_name": "a"})
+    filters = {"$expr": {"$in": ["$a_rather_long_field_name", ["a"]]}}
+    assert conn.find(filters, ttl=0) == [{"a_rather_long_field_name": "a"}]
+    assert conn.count(filters, ttl=0) == 1
+    assert conn.aggregate([{"$match": filters}, {"$count": "n"}], ttl=0) == [{"n": 1}]
+
+
+def test_reordered_filters_hit_the_cache(connection):
+    conn = connection()
+    conn._instance.insert_one({"a": 1, "b": 2})
+    assert conn.find({"a": 1, "b": 2}) == [{"a": 1, "b": 2}]
+    assert conn.find({"b": 2, "a": 1}) == [{"a": 1, "b": 2}]
+    assert conn.cache_stats()["hits"] == 1
@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+
+from connection import materialize
+from connection.materialize import MaterializedView, merge_pipeline
+
+PIPELINE = [{"$group": {"_id": None, "posts": {"$sum": 1}}}]
+START = datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def processed(monkeypatch):
+    """Source collection whose aggregations record the documents they process
+    ($merge is not supported by mongomock)."""
+    source = mongomock.MongoClient().test.posts
+    ids = []
+
+    def aggregate(pipeline, **kwargs):
+        match = pipeline[:1] if "$match" in pipeline[0] else []
+        ids.extend(doc["_id"] for doc in mongomock.Collection.aggregate(source, match))
+
+    monkeypatch.setattr(source, "aggregate", aggregate)
+    return source, ids
+
+
+def post(source, _id: int, seconds: float):
+    source.insert_one({"_id": _id, "timestamp": START + timedelta(seconds=seconds)})
+
+
+def test_late_documents_are_processed_once(processed):
+    source, ids = processed
+    view = MaterializedView(source, "posts", "stats", PIPELINE, refresh="incremental")
+    post(source, 1, 0)
+    post(source, 2, 10)
+    assert view.refresh_now()
+    assert sorted(ids) == [1, 2]
+    post(source, 3, 20)
+    # stamped before the last processed one, inserted after it
+    post(source, 4, 5)
+    assert view.refresh_now()
+    assert view.refresh_now()
+    assert sorted(ids) == [1, 2, 3, 4]
+
+
+def test_documents_below_the_overlap_are_not_read_again(processed):
+    source, ids = processed
+    view = MaterializedView(
+        source, "posts", "stats", PIPELINE, refresh="incremental", overlap=5
+    )
+    post(source, 1, 0)
+    post(source, 2, 100)
+    view.refresh_now()
+    post(source, 3, 110)
+    view.refresh_now()
+    state = source.database.st_mongo_views.find_one({"_id": "posts.stats"})
+    assert [_id for _id, _ in state["seen"]] == [3]
+    assert sorted(ids) == [1, 2, 3]
+
+
+def test_merge_pipeline():
+    group = {"_id": "$user", "posts": {"$sum": 1}, "last": {"$max": "$timestamp"}}
+    assert merge_pipeline(group) == [
+        {
+            "$set": {
+                "posts": {"$add": ["$posts", "$$new.posts"]},
+                "last": {"$max": ["$last", "$$new.last"]},
+            }
+        }
+    ]
+    with pytest.raises(ValueError):
+        merge_pipeline({"_id": None, "average": {"$avg": "$value"}})
+
+
+def test_new_documents_are_matched_on_their_watermark(processed, monkeypatch):
+    source, ids = processed
+    pipelines = []
+    aggregate = source.aggregate
+
+    def recorded(pipeline, **kwargs):
+        pipelines.append(pipeline)
+        aggregate(pipeline, **kwargs)
+
+    monkeypatch.setattr(source, "aggregate", recorded)
+    view = MaterializedView(
+        source, "posts", "stats", PIPELINE, refresh="incremental", overlap=5
+    )
+    post(source, 1, 0)
+    view.refresh_now()
+    for _id in range(2, 6):
+        post(source, _id, 10 * _id)
+    view.refresh_now()
+    assert sorted(ids) == [1, 2, 3, 4, 5]
+    # only the ids of the new overlap window are listed
+    below, window = pipelines[-1][0]["$match"]["$or"]
+    assert window == {"_id": {"$in": [5]}}
+    assert below["_id"] == {"$nin": [1]}
+
+
+def test_a_dense_overlap_window_triggers_a_full_rebuild(processed, monkeypatch):
+    monkeypatch.setattr(materialize, "MAX_SEEN", 2)
+    source, ids = processed
+    view = MaterializedView(source, "posts", "stats", PIPELINE, refresh="incremental")
+    post(source, 1, 0)
+    view.refresh_now()
+    post(source, 2, 10)
+    post(source, 3, 20)
+    view.refresh_now()
+    states = source.database.st_mongo_views
+    assert states.find_one({"_id": "posts.stats"})["seen"] is None
+    assert sorted(ids) == [1, 1, 2, 3]
+    post(source, 4, 30)
+    view.refresh_now()
+    assert sorted(ids) == [1, 1, 1, 2, 2, 3, 3, 4]
@@ -0,0 +1,65 @@
+import pytest
+
+from connection.pagination import keyset_filters
+
+
+def pages(conn, direction: str = "after", **kwargs):
+    """Return the documents of every page, following the tokens."""
+    page, result = conn.paginate(**kwargs), []
+    while True:
+        result.append(page["documents"])
+        token = page["next" if direction == "after" else "previous"]
+        if token is None:
+            return result
+        page = conn.paginate(**{direction: token}, **kwargs)
+
+
+@pytest.mark.parametrize("sort", ["x", [("x", -1)]])
+def test_pages_cross_null_values(connection, sort):
+    conn = connection()
+    conn.insert([{"_id": 1, "x": 2}, {"_id": 2}, {"_id": 3, "x": None}, {"_id": 4}])
+    conn.insert({"_id": 5, "x": 1})
+    result = pages(conn, sort=sort, page_size=1, mongo_id=True)
+    ids = [document["_id"] for page in result for document in page]
+    ascending = [2, 3, 4, 5, 1]
+    assert ids == (ascending if sort == "x" else [1, 5, 4, 3, 2])
+
+
+def test_pages_backwards(connection):
+    conn = connection()
+    conn.insert([{"_id": i, "x": None if i % 2 else i} for i in range(6)])
+    last = conn.paginate(sort="x", page_size=6, mongo_id=True)["documents"][-1]
+    ids = []
+    page = conn.paginate(sort="x", page_size=2, mongo_id=True)
+    while page["next"]:
+        page = conn.paginate(sort="x", page_size=2, after=page["next"], mongo_id=True)
+    assert page["documents"][-1] == last
+    while True:
+        ids[:0] = [document["_id"] for document in page["documents"]]
+        if page["previous"] is None:
+            break
+        page = conn.paginate(
+            sort="x", page_size=2, before=page["previous"], mongo_id=True
+        )
+    assert ids == [1, 3, 5, 0, 2, 4]
+
+
+def test_sort_keys_are_not_returned_unless_projected(connection):
+    conn = connection()
+    conn.insert([{"a": i, "b": {"c": -i}, "d": i} for i in range(3)])
+    page = conn.paginate(sort="b.c", page_size=2, projection=["a"])
+    assert page["documents"] == [{"a": 2}, {"a": 1}]
+    page = conn.paginate(
+        sort="b.c", page_size=2, after=page["next"], projection={"b": 0}
+    )
+    assert page["documents"] == [{"a": 0, "d": 0}]
+    page = conn.paginate(sort="a", page_size=1, projection=["a", "d"], mongo_id=True)
+    assert set(page["documents"][0]) == {"_id", "a", "d"}
+
+
+def test_nothing_sorts_before_null():
+    assert keyset_filters([("x", -1)], [None]) == {"_id": {"$exists": False}}
+    assert keyset_filters([("x", -1), ("_id", 1)], [None, 3]) == {
+        "x": None,
+        "_id": {"$gt": 3},
+    }
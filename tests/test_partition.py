@@ -0,0 +1,42 @@
+import pytest
+
+from connection import mongo
+from connection.partition import partition_filters
+
+
+@pytest.fixture
+def bounds(monkeypatch):
+    """Fixed partition bounds ($bucketAuto is not supported by mongomock)."""
+    bounds = []
+    monkeypatch.setattr(mongo, "partition_bounds", lambda *args: bounds)
+    return bounds
+
+
+def test_every_document_is_read_once(connection, bounds):
+    conn = connection()
+    conn.insert([{"i": i, "tags": [i, i + 5]} for i in range(10)])
+    conn.insert([{"i": 10, "tags": []}, {"i": 11}, {"i": 12, "tags": "a"}])
+    conn.insert({"i": 13, "tags": [7, "a"]})
+    bounds += [3, 6, 9]
+    documents = conn.parallel_find(field="tags", partitions=4, ttl=0)
+    assert sorted(document["i"] for document in documents) == list(range(14))
+
+
+def test_partitioned_ids(connection, bounds):
+    conn = connection()
+    conn.insert([{"_id": i, "n": i} for i in range(10)] + [{"_id": "a", "n": 10}])
+    bounds += [3, 6]
+    documents = conn.parallel_find(partitions=3, ttl=0, mongo_id=True)
+    ids = [document["_id"] for document in documents]
+    assert sorted(ids, key=str) == sorted([*range(10), "a"], key=str)
+    table = conn.parallel_find(partitions=3, ttl=0, output="arrow")
+    assert sorted(table.column("n").to_pylist()) == list(range(11))
+
+
+def test_filters_are_kept():
+    assert partition_filters({"a": 1}, []) == [{"a": 1}]
+    ranges = partition_filters({"a": 1}, [5])
+    assert ranges == [
+        {"$and": [{"a": 1}, {"_id": {"$not": {"$gte": 5}}}]},
+        {"$and": [{"a": 1}, {"_id": {"$gte": 5}}]},
+    ]
@@ -0,0 +1,106 @@
+from threading import Event, Thread
+from time import sleep
+
+from connection.sketch import DistinctSketches, HyperLogLog
+
+
+def test_hyperloglog_estimate():
+    hll = HyperLogLog()
+    for value in range(10_000):
+        hll.add(value)
+        hll.add(str(value))
+    assert abs(hll.count() - 20_000) < 20_000 * 0.03
+
+
+def test_sketch_is_built_once_and_kept_incremental():
+    sketches, reads = DistinctSketches(), []
+
+    def documents():
+        reads.append(True)
+        return [{"user": "a"}, {"user": "b"}]
+
+    assert sketches.count("namespace", "user", {}, documents) == 2
+    sketches.on_write("namespace", "collection", [{"user": "c"}])
+    assert sketches.count("namespace", "user", {}, documents) == 3
+    assert len(reads) == 1
+    # an update might change the values: the sketch is rebuilt
+    sketches.on_write("namespace", "collection", [], {}, {"$set": {"user": "d"}})
+    assert sketches.count("namespace", "user", {}, documents) == 2
+    assert len(reads) == 2
+
+
+def test_partial_sketch_is_not_served():
+    sketches, started, resume = DistinctSketches(), Event(), Event()
+
+    def documents():
+        yield {"user": "a"}
+        started.set()
+        resume.wait(5)
+        yield {"user": "b"}
+
+    counts = []
+    leader = Thread(
+        target=lambda: counts.append(sketches.count("ns", "user", {}, documents))
+    )
+    leader.start()
+    started.wait(5)
+    waiter = Thread(
+        target=lambda: counts.append(sketches.count("ns", "user", {}, documents))
+    )
+    waiter.start()
+    # inserted while the sketch is built
+    sketches.on_write("ns", "collection", [{"user": "c"}])
+    resume.set()
+    leader.join(5)
+    waiter.join(5)
+    assert counts == [3, 3]
+
+
+def test_approximate_distinct_count(connection):
+    conn = connection()
+    conn.insert([{"user": user} for user in "abcab"])
+    assert conn.distinct_count("user", approximate=True, ttl=0) == 3
+    conn.insert({"user": "d"})
+    assert conn.distinct_count("user", approximate=True, ttl=0) == 4
+    assert conn.distinct_count("user", ttl=0) == 4
+
+
+def test_old_sketch_is_rebuilt():
+    sketches, users = DistinctSketches(), ["a"]
+
+    def documents():
+        return [{"user": user} for user in users]
+
+    assert sketches.count("namespace", "user", {}, documents, 60) == 1
+    # written by another process, unseen
+    users.append("b")
+    assert sketches.count("namespace", "user", {}, documents, 60) == 1
+    sleep(0.02)
+    assert sketches.count("namespace", "user", {}, documents, 0.01) == 2
+
+
+def test_old_sketch_is_served_while_rebuilt():
+    sketches, started, resume = DistinctSketches(), Event(), Event()
+    sketches.count("ns", "user", {}, lambda: [{"user": "a"}])
+
+    def documents():
+        started.set()
+        resume.wait(5)
+        return [{"user": "a"}, {"user": "b"}]
+
+    leader = Thread(target=sketches.count, args=("ns", "user", {}, documents, 0))
+    leader.start()
+    started.wait(5)
+    assert sketches.count("ns", "user", {}, documents, 0) == 1
+    resume.set()
+    leader.join(5)
+    assert sketches.count("ns", "user", {}, documents) == 2
+
+
+def test_unwatched_connection_sees_external_inserts(connection):
+    conn = connection()
+    conn.insert([{"user": "a"}])
+    assert conn.distinct_count("user", approximate=True, ttl=0.01) == 1
+    conn._instance.insert_one({"user": "b"})
+    sleep(0.02)
+    assert conn.distinct_count("user", approximate=True, ttl=0.01) == 2
@@ -0,0 +1,175 @@
+from time import sleep
+
+import pytest
+
+from connection.invalidation import invalidator
+from connection.stores import DiskStore, Entry, MemoryStore, SharedStore
+
+
+def test_memory_store_drops_entries_past_retention():
+    store = MemoryStore()
+    store.put("find", "expired", Entry(b"old", 0.01))
+    store.put("find", "stale", Entry(b"stale", 0.01), retention=60)
+    store.put("find", "forever", Entry(b"kept", None))
+    sleep(0.02)
+    assert store.get("find", "expired") is None
+    assert store.get("find", "stale").value == b"stale"
+    assert store.get("find", "forever").value == b"kept"
+    assert store.usage()["find"] == {"evictions": 0, "entries": 2, "bytes": 9}
+
+
+def test_memory_store_keeps_replaced_entries():
+    store = MemoryStore()
+    store.put("find", "key", Entry(b"old", 0.01))
+    store.put("find", "key", Entry(b"new", 60))
+    sleep(0.02)
+    assert store.get("find", "key").value == b"new"
+
+
+def test_written_reads_free_their_old_entries(connection):
+    conn = connection()
+    for i in range(50):
+        conn.insert({"i": i})
+        assert len(conn.find(ttl=0.01)) == i + 1
+        sleep(0.01)
+    assert conn.cache_stats()["methods"]["find"]["entries"] <= 1
+
+
+def test_memory_store_lru_eviction():
+    store = MemoryStore(max_entries=2)
+    store.put("find", "a", Entry(b"a", 60))
+    store.put("find", "b", Entry(b"b", 60))
+    store.get("find", "a")
+    store.put("find", "c", Entry(b"c", 60))
+    assert store.get("find", "b") is None
+    assert store.get("find", "a") and store.get("find", "c")
+    assert store.usage()["find"]["evictions"] == 1
+
+
+def test_memory_store_lfu_eviction():
+    store = MemoryStore(max_entries=2, policy="lfu")
+    store.put("find", "a", Entry(b"a", 60))
+    store.put("find", "b", Entry(b"b", 60))
+    for _ in range(2):
+        store.get("find", "a")
+    store.put("find", "c", Entry(b"c", 60))
+    assert store.get("find", "b") is None
+
+
+def test_memory_store_method_limits():
+    store = MemoryStore(methods={"find": {"max_bytes": 10}})
+    store.put("find", "large", Entry(b"x" * 11, 60))
+    store.put("find", "a", Entry(b"x" * 6, 60))
+    store.put("find", "b", Entry(b"x" * 6, 60))
+    store.put("count", "a", Entry(b"x" * 11, 60))
+    usage = store.usage()
+    assert usage["find"] == {"evictions": 1, "entries": 1, "bytes": 6}
+    assert usage["count"]["entries"] == 1
+
+
+def test_shared_store_entries(shared):
+    store, other = shared(), shared()
+    store.put("find", "key", Entry(b"value", 60))
+    store.put("find", "forever", Entry(b"kept", None))
+    entry = other.get("find", "key")
+    assert entry.value == b"value" and not entry.expired
+    assert other.get("find", "forever").expires_at is None
+    assert other.get("count", "key") is None
+    other.clear("find")
+    assert store.get("find", "key") is None
+
+
+def test_shared_store_retention(shared):
+    store = shared()
+    store.put("find", "expired", Entry(b"old", 0.01))
+    store.put("find", "stale", Entry(b"stale", 0.01), retention=60)
+    sleep(0.05)
+    assert store.get("find", "expired") is None
+    entry = store.get("find", "stale")
+    assert entry.value == b"stale" and entry.expired and entry.servable(60)
+
+
+def test_shared_store_generations(shared):
+    store, other = shared(), shared()
+    namespace = ("mongodb://localhost", f"test.{id(store)}")
+    assert store.generation(namespace) == 0
+    invalidator.invalidate(namespace, "collection")
+    assert other.generation(namespace) >= 1
+    generation = store.generation(namespace)
+    store.bump(namespace)
+    assert other.generation(namespace) == generation + 1
+    assert other.generation(("mongodb://localhost", "test.other")) == 0
+
+
+def test_disk_store_eviction(tmp_path):
+    store = DiskStore(str(tmp_path / "cache.sqlite"), max_entries=2)
+    for key in "abc":
+        store.put("find", key, Entry(key.encode(), 60))
+        sleep(0.01)
+    assert store.get("find", "a") is None
+    assert store.usage()["find"] == {"evictions": 1, "entries": 2, "bytes": 2}
+
+
+def test_disk_store_purges_entries_past_retention(tmp_path):
+    store = DiskStore(str(tmp_path / "cache.sqlite"))
+    store.put("find", "expired", Entry(b"old", 0.01))
+    sleep(0.02)
+    store.put("find", "key", Entry(b"new", 60))
+    assert store.usage()["find"]["entries"] == 1
+
+
+def test_shared_cache_invalidation(connection, tmp_path):
+    cache = {"backend": "disk", "path": str(tmp_path / "cache.sqlite")}
+    conn = connection(cache=cache)
+    assert conn.count() == 0
+    conn.insert({"a": 1})
+    assert conn.count() == 1
+    assert conn.cache_stats()["hits"] == 0
+    assert conn.count() == 1
+    assert conn.cache_stats()["hits"] == 1
+
+
+def test_shared_stores_are_abstract():
+    with pytest.raises(TypeError):
+        SharedStore()
+
+
+def test_memory_store_clear_is_scoped():
+    store = MemoryStore()
+    for key in ("a:1", "a:2", "b:1"):
+        store.put("find", key, Entry(b"x", 60))
+    store.put("count", "a:1", Entry(b"x", 60))
+    store.clear("find", "a:")
+    assert [store.get("find", key) is None for key in ("a:1", "a:2", "b:1")] == [
+        True,
+        True,
+        False,
+    ]
+    assert store.get("count", "a:1")
+    store.clear(prefix="a:")
+    assert store.get("count", "a:1") is None
+    assert store.usage()["find"]["bytes"] == 1
+
+
+def test_shared_store_clear_is_scoped(shared):
+    store = shared()
+    for key in ("a:1", "b:1"):
+        store.put("find", key, Entry(b"x", 60))
+        store.put("count", key, Entry(b"x", 60))
+    store.clear("find", "a:")
+    assert store.get("find", "a:1") is None and store.get("count", "a:1")
+    store.clear(prefix="a:")
+    assert store.get("count", "a:1") is None
+    assert store.get("find", "b:1") and store.get("count", "b:1")
+
+
+def test_clear_cache_keeps_other_collections(connection, tmp_path):
+    cache = {"backend": "disk", "path": str(tmp_path / "cache.sqlite")}
+    posts, users = connection(cache=cache), connection(cache=cache, collection="users")
+    posts.count()
+    users.count()
+    posts.clear_cache()
+    posts.count()
+    users.count()
+    assert posts.cache_stats()["hits"] == 0
+    assert users.cache_stats()["hits"] == 1
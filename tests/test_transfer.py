@@ -0,0 +1,103 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from bson.raw_bson import RawBSONDocument
+from pymongo.errors import BulkWriteError
+from pymongo.results import InsertManyResult
+
+from connection import transfer
+from connection.transfer import file_format, insert_batches, read_file, write_file
+
+
+class RawCollection:
+    """Stands in for a collection with the raw BSON codec, which mongomock lacks:
+    like pymongo, it leaves raw documents out of inserted_ids."""
+
+    full_name = "test.raw"
+
+    def __init__(self, duplicates=()):
+        self.documents, self.duplicates = [], set(duplicates)
+
+    def insert_many(self, documents, ordered=True):
+        errors = []
+        for index, document in enumerate(documents):
+            assert isinstance(document, RawBSONDocument)
+            if document["_id"] in self.duplicates:
+                errors.append({"index": index, "code": 11000})
+            else:
+                self.documents.append(document)
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": 0})
+        return InsertManyResult([], True)
+
+
+def test_parquet_schema_is_merged_from_the_sample(tmp_path):
+    path = str(tmp_path / "export.parquet")
+    batches = [[{"a": 1, "b": None}], [{"a": 2.5, "b": "x", "c": True}]]
+    assert write_file(path, iter(batches), "parquet") == 2
+    table = pq.read_table(path)
+    assert table.schema.field("b").type == pa.string()
+    assert table.to_pylist() == [
+        {"a": 1.0, "b": None, "c": None},
+        {"a": 2.5, "b": "x", "c": True},
+    ]
+
+
+def test_null_fields_are_strings(tmp_path, monkeypatch):
+    monkeypatch.setattr(transfer, "SAMPLE_DOCUMENTS", 1)
+    path = str(tmp_path / "export.parquet")
+    batches = [[{"a": 1, "b": None}], [{"a": 2, "b": "x"}], [{"a": 3}]]
+    assert write_file(path, iter(batches), "parquet") == 3
+    assert pq.read_table(path).column("b").to_pylist() == [None, "x", None]
+
+
+def test_failed_export_leaves_no_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(transfer, "SAMPLE_DOCUMENTS", 1)
+    path = tmp_path / "export.parquet"
+    batches = [[{"a": 1}], [{"a": 2, "b": "x"}]]
+    with pytest.raises(ValueError, match="schema"):
+        write_file(str(path), iter(batches), "parquet")
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_parquet_with_a_schema(tmp_path):
+    path = str(tmp_path / "export.parquet")
+    batches = [[{"a": 1, "b": "x"}], [{"a": 2}]]
+    write_file(path, iter(batches), "parquet", {"a": pa.int32()})
+    assert pq.read_table(path).to_pylist() == [{"a": 1}, {"a": 2}]
+
+
+def test_empty_parquet_export(tmp_path):
+    path = str(tmp_path / "export.parquet")
+    assert write_file(path, iter([]), "parquet") == 0
+    assert pq.read_table(path).num_rows == 0
+
+
+@pytest.mark.parametrize("extension", ["jsonl", "parquet"])
+def test_export_and_import(connection, tmp_path, extension):
+    conn = connection()
+    conn.insert([{"i": i, "tag": "x" if i % 2 else None} for i in range(5)])
+    path = str(tmp_path / f"export.{extension}")
+    assert conn.export(path, mongo_id=False, batch_size=2)["exported"] == 5
+    conn.delete({})
+    assert conn.import_file(path)["inserted"] == 5
+    assert sorted(post["i"] for post in conn.find()) == list(range(5))
+
+
+def test_bson_export_and_import(tmp_path):
+    path = str(tmp_path / "export.bson")
+    batches = [[{"_id": i, "i": i} for i in range(j, j + 2)] for j in (0, 2, 4)]
+    assert write_file(path, iter(batches), file_format(path)) == 6
+    collection = RawCollection(duplicates={3})
+    result = insert_batches(collection, read_file(path, "bson", 4), workers=2)
+    assert (result["inserted"], result["failed"]) == (5, 1)
+    imported = sorted(document["i"] for document in collection.documents)
+    assert imported == [0, 1, 2, 4, 5]
+
+
+def test_unknown_extensions_are_rejected():
+    assert file_format("dump/posts.bson") == "bson"
+    assert file_format("posts.dump", "bson") == "bson"
+    with pytest.raises(ValueError, match="format"):
+        file_format("posts.dump")
@@ -0,0 +1,116 @@
+import os
+from time import monotonic, sleep
+from types import SimpleNamespace
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import OperationFailure
+from streamlit.runtime.secrets import AttrDict
+
+from connection import watch as watch_module
+from connection.mongo import MongoDBConnection
+from connection.watch import Watcher, watch
+
+REPLICA_SET_URL = os.environ.get("ST_MONGO_REPLICA_SET_URL")
+
+
+class Standalone:
+    """Collection of a server without change streams."""
+
+    full_name = "test.standalone"
+
+    def __init__(self):
+        self.watched = 0
+
+    def watch(self, **kwargs):
+        self.watched += 1
+        raise OperationFailure(
+            "The $changeStream stage is only supported on replica sets"
+        )
+
+
+def test_failed_watcher_is_not_restarted(monkeypatch, caplog):
+    monkeypatch.setattr(watch_module, "_watchers", {})
+    collection = Standalone()
+    watcher = watch(collection, "standalone", "collection")
+    watcher.join(1)
+    assert isinstance(watcher.failure, OperationFailure)
+    for _ in range(3):
+        assert watch(collection, "standalone", "collection") is watcher
+    assert collection.watched == 1
+    assert len(caplog.records) == 1
+
+
+def test_rerun_keeps_the_session_page(monkeypatch):
+    client_state = object()
+    reruns = []
+    session = SimpleNamespace(_client_state=client_state, request_rerun=reruns.append)
+    infos = {"active": SimpleNamespace(session=session)}
+    runtime = SimpleNamespace(
+        _session_mgr=SimpleNamespace(get_active_session_info=infos.get)
+    )
+    monkeypatch.setattr(watch_module.Runtime, "exists", lambda: True)
+    monkeypatch.setattr(watch_module.Runtime, "instance", lambda: runtime)
+    watcher = Watcher(Standalone(), "standalone", "collection")
+    watcher.sessions |= {"active", "closed"}
+    watcher._rerun()
+    assert reruns == [client_state]
+    assert watcher.sessions == {"active"}
+
+
+# against a replica set (change streams are not supported by mongomock)
+
+replica_set = pytest.mark.skipif(
+    not REPLICA_SET_URL, reason="ST_MONGO_REPLICA_SET_URL is not set"
+)
+
+
+@pytest.fixture
+def watched(request):
+    secrets = {
+        "url": REPLICA_SET_URL,
+        "database": "st_mongo_test",
+        "collection": request.node.name[:60],
+        "watch": True,
+    }
+
+    class Connection(MongoDBConnection):
+        _secrets = property(lambda self: AttrDict(secrets))
+
+    conn = Connection(f"test-{secrets['collection']}")
+    conn._instance.delete_many({})
+    yield conn
+    conn._watcher().stop()
+    conn._instance.drop()
+
+
+def eventually(condition, timeout: float = 10) -> bool:
+    deadline = monotonic() + timeout
+    while not condition():
+        if monotonic() > deadline:
+            return False
+        sleep(0.1)
+    return True
+
+
+@replica_set
+def test_external_writes_invalidate_cached_reads(watched):
+    assert watched.count() == 0
+    # written by another client, unknown to the connection but for the watcher
+    other = MongoClient(REPLICA_SET_URL)[watched._instance.database.name]
+    other[watched._instance.name].insert_one({"a": 1})
+    assert eventually(lambda: watched.count() == 1)
+    assert watched._watcher().failure is None
+
+
+@replica_set
+def test_changes_rerun_subscribed_sessions(watched, monkeypatch):
+    reruns = []
+    watcher = watched._watcher()
+    monkeypatch.setattr(watcher, "_rerun", lambda: reruns.append(True))
+    watcher.rerun_interval = 0
+    watcher.sessions.add("session")
+    MongoClient(REPLICA_SET_URL)[watched._instance.database.name][
+        watched._instance.name
+    ].insert_one({"a": 1})
+    assert eventually(lambda: reruns)
@@ -0,0 +1,37 @@
+import mongomock
+from pymongo.errors import WriteError
+
+from connection.writer import BufferedWriter
+
+
+def test_futures_resolve_after_the_flush_callback():
+    collection = mongomock.MongoClient().test.writer
+    flushed = []
+    writer = BufferedWriter(
+        collection,
+        on_flush=lambda documents: flushed.append([f.done() for f in futures]),
+    )
+    futures = [writer.add({"_id": 1}), writer.add({"_id": 1}), writer.add({})]
+    writer.flush()
+    # none was resolved when the callback ran
+    assert flushed == [[False, False, False]]
+    assert futures[0].result() == 1
+    assert isinstance(futures[1].exception(), WriteError)
+    assert futures[2].result() is not None
+    assert collection.count_documents({}) == 2
+
+
+def test_buffered_post_is_read_once_resolved(connection):
+    conn = connection(writer={"interval": 0.05})
+    assert conn.find() == []
+    result = conn.insert({"post": "hello"}, buffered=True)
+    assert result["future"].result(timeout=5) == result["inserted_id"]
+    assert [post["post"] for post in conn.find()] == ["hello"]
+
+
+def test_flush_inserts_without_waiting_for_the_interval(connection):
+    conn = connection(writer={"interval": 60})
+    result = conn.insert({"post": "hello"}, buffered=True)
+    conn.writer().flush()
+    assert result["future"].done()
+    assert conn.count() == 1
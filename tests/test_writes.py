@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+
+import mongomock
+import pytest
+from pymongo.errors import BulkWriteError
+
+from connection import mongo
+
+
+@pytest.fixture
+def bulk_requests(monkeypatch):
+    """Requests of the bulk writes, recorded instead of sent (mongomock can't run
+    the hello command, nor upsert replacements on a null _id like a server)."""
+    requests = []
+
+    def bulk_write(self, chunk, **kwargs):
+        requests.extend(chunk)
+        return SimpleNamespace(bulk_api_result={"nUpserted": len(chunk)})
+
+    monkeypatch.setattr(mongo, "get_write_limits", lambda client: (1000, 16 << 20))
+    monkeypatch.setattr(mongomock.Collection, "bulk_write", bulk_write)
+    return requests
+
+
+def test_writes_invalidate_cached_reads(connection):
+    conn = connection()
+    assert conn.count() == 0
+    conn.insert({"a": 1})
+    assert conn.count() == 1
+    conn.update({"a": 1}, {"$set": {"a": 2}})
+    assert conn.find({"a": 2}) == [{"a": 2}]
+    conn.replace({"a": 2}, {"a": 3})
+    assert conn.find({"a": 3}) == [{"a": 3}]
+    conn.delete({"a": 3})
+    assert conn.count() == 0
+
+
+def test_partial_insert_invalidates_cached_reads(connection):
+    conn = connection()
+    conn.insert({"_id": 2, "a": 1})
+    assert conn.count() == 1
+    with pytest.raises(BulkWriteError):
+        # ordered: the first document is inserted, the duplicate fails
+        conn.insert([{"_id": 1, "a": 1}, {"_id": 2, "a": 1}])
+    assert conn.count() == 2
+
+
+def test_upsert_many_gives_new_documents_an_id(connection, bulk_requests):
+    documents = [{"a": 1}, {"a": 2}, {"_id": 3, "a": 3}]
+    assert connection().upsert_many(documents)
+    ids = [request._filter["_id"] for request in bulk_requests]
+    assert len(set(ids)) == 3 and None not in ids and ids[2] == 3
+    assert [document["_id"] for document in documents] == ids
+
+
+def test_upsert_many_rejects_documents_missing_a_key(connection, bulk_requests):
+    with pytest.raises(ValueError, match="user"):
+        connection().upsert_many([{"a": 1}], keys=["_id", "user"])